@@ -0,0 +1,633 @@
+#!/usr/bin/env python3
+"""
+本地音频处理流水线
+以16位PCM的NumPy数组为统一格式，各处理阶段(PipelineStage)按块流式处理，
+可串联后直接作用于TTS返回的音频流或已保存的音频文件
+"""
+import hashlib
+import logging
+import os
+import shutil
+import subprocess
+import wave
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from functools import lru_cache
+from math import ceil, gcd
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional, Tuple, Union
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# 默认静音阈值(dBFS)，低于该能量的帧视为静音
+DEFAULT_SILENCE_THRESHOLD_DB = -45.0
+
+# 默认保留的首尾静音(毫秒)
+DEFAULT_KEEP_MS = 120
+
+# 能量检测的帧长(毫秒)
+DEFAULT_FRAME_MS = 10
+
+# 重采样滤波器每侧的过零点数，越大过渡带越陡
+DEFAULT_ZERO_CROSSINGS = 16
+
+# 重采样结果缓存的最大条目数
+RESAMPLE_CACHE_SIZE = 32
+
+# ASMR分段的首尾静音裁剪参数：音量很轻，阈值比默认更低；
+# 每段两端统一保留keep_ms，拼接后段间停顿固定为2*keep_ms
+ASMR_TRIM_CONFIG = {
+    "threshold_db": -50.0,
+    "keep_ms": 400,
+}
+
+
+def pcm_to_array(data: bytes, channels: int = 1) -> np.ndarray:
+    """
+    16位小端PCM字节转换为 (采样数, 声道数) 的int16数组
+
+    Args:
+        data: PCM字节
+        channels: 声道数
+
+    Returns:
+        np.ndarray: int16数组
+    """
+    usable = len(data) - len(data) % (2 * channels)
+    return np.frombuffer(data[:usable], dtype="<i2").reshape(-1, channels)
+
+
+def array_to_pcm(samples: np.ndarray) -> bytes:
+    """int16数组转换回16位小端PCM字节"""
+    return np.ascontiguousarray(samples, dtype="<i2").tobytes()
+
+
+def iter_pcm_arrays(chunks: Iterable[bytes], channels: int = 1) -> Iterator[np.ndarray]:
+    """
+    把任意长度的PCM字节块(如网络流)转换为int16数组块，不足一帧的字节留到下一块
+
+    Args:
+        chunks: 16位小端PCM字节块
+        channels: 声道数
+
+    Yields:
+        np.ndarray: (采样数, 声道数) 的int16数组
+    """
+    frame_bytes = 2 * channels
+    pending = b""
+    for chunk in chunks:
+        data = pending + chunk if pending else chunk
+        usable = len(data) - len(data) % frame_bytes
+        pending = data[usable:]
+        if usable:
+            yield pcm_to_array(data[:usable], channels)
+
+
+class PipelineStage(ABC):
+    """
+    流水线处理阶段基类
+
+    子类实现 process() 处理每个输入块，有缓存数据的子类重写 flush() 输出剩余数据。
+    输入输出均为 (采样数, 声道数) 的int16数组。
+    """
+
+    def __init__(self, channels: int = 1):
+        """
+        Args:
+            channels: 声道数
+        """
+        self.channels = channels
+
+    @abstractmethod
+    def process(self, samples: np.ndarray) -> np.ndarray:
+        """处理一个输入块，返回可以输出的部分"""
+
+    def flush(self) -> np.ndarray:
+        """输入结束后输出缓存的剩余数据"""
+        return np.zeros((0, self.channels), dtype=np.int16)
+
+
+def run_pipeline(chunks: Iterable[np.ndarray], stages: List[PipelineStage]) -> Iterator[np.ndarray]:
+    """
+    依次将音频块送入各处理阶段，产出非空的输出块
+
+    Args:
+        chunks: 输入音频块
+        stages: 处理阶段列表(按顺序串联)
+
+    Yields:
+        np.ndarray: 处理后的音频块
+    """
+    def push(block: np.ndarray, start: int) -> Iterator[np.ndarray]:
+        for stage in stages[start:]:
+            if not len(block):
+                return
+            block = stage.process(block)
+        if len(block):
+            yield block
+
+    for chunk in chunks:
+        yield from push(chunk, 0)
+
+    # 逐级冲刷：前一级冲刷出的数据需继续经过后续阶段
+    for i, stage in enumerate(stages):
+        yield from push(stage.flush(), i + 1)
+
+
+class SilenceTrimmer(PipelineStage):
+    """
+    首尾静音裁剪
+
+    按固定帧长计算RMS能量(向量化)，丢弃首个有声帧之前和最后一个有声帧之后的静音，
+    两端各保留 keep_ms 毫秒的填充，使拼接后的段落间隔稳定可控。
+    中间的停顿原样保留；尾部静音会暂存，直到确认其后没有声音才丢弃。
+    """
+
+    def __init__(
+        self,
+        sample_rate: int,
+        channels: int = 1,
+        threshold_db: float = DEFAULT_SILENCE_THRESHOLD_DB,
+        keep_ms: int = DEFAULT_KEEP_MS,
+        frame_ms: int = DEFAULT_FRAME_MS,
+    ):
+        """
+        Args:
+            sample_rate: 采样率
+            channels: 声道数
+            threshold_db: 静音阈值(dBFS)
+            keep_ms: 首尾保留的静音时长(毫秒)
+            frame_ms: 能量检测帧长(毫秒)
+        """
+        super().__init__(channels)
+        self.frame_size = max(1, sample_rate * frame_ms // 1000)
+        self.keep_samples = sample_rate * keep_ms // 1000
+        # 将dBFS阈值换算为int16幅度的平方，避免逐帧取对数
+        self.threshold_power = (32768.0 * 10 ** (threshold_db / 20)) ** 2
+
+        empty = np.zeros((0, channels), dtype=np.int16)
+        self._partial = empty   # 不足一帧的剩余采样
+        self._lead = empty      # 首个有声帧之前的静音(只保留最后keep_samples)
+        self._tail = empty      # 最后一个有声帧之后的静音(待定)
+        self._started = False
+
+    def _voiced_frames(self, frames: np.ndarray) -> np.ndarray:
+        """返回每一帧是否为有声帧的布尔数组"""
+        blocks = frames.reshape(-1, self.frame_size * self.channels).astype(np.float32)
+        return np.mean(blocks * blocks, axis=1) > self.threshold_power
+
+    def process(self, samples: np.ndarray) -> np.ndarray:
+        data = np.concatenate([self._partial, samples]) if len(self._partial) else samples
+        usable = len(data) - len(data) % self.frame_size
+        frames, self._partial = data[:usable], data[usable:]
+        if not usable:
+            return frames
+
+        voiced = np.flatnonzero(self._voiced_frames(frames))
+
+        if not self._started:
+            if not len(voiced):
+                if self.keep_samples:
+                    self._lead = np.concatenate([self._lead, frames])[-self.keep_samples:]
+                return frames[:0]
+            first = voiced[0] * self.frame_size
+            lead = np.concatenate([self._lead, frames[:first]])
+            lead = lead[-self.keep_samples:] if self.keep_samples else lead[:0]
+            self._started = True
+            self._lead = frames[:0]
+            frames = frames[first:]
+            voiced = voiced - voiced[0]
+            head = [lead]
+        else:
+            head = [self._tail]
+
+        if not len(voiced):
+            self._tail = np.concatenate([self._tail, frames])
+            return frames[:0]
+
+        end = (voiced[-1] + 1) * self.frame_size
+        self._tail = frames[end:]
+        return np.concatenate(head + [frames[:end]])
+
+    def flush(self) -> np.ndarray:
+        if not self._started:
+            return np.zeros((0, self.channels), dtype=np.int16)
+        tail = np.concatenate([self._tail, self._partial])[:self.keep_samples]
+        self._tail = self._partial = tail[:0]
+        return tail
+
+
+def trim_silence(
+    samples: np.ndarray,
+    sample_rate: int,
+    threshold_db: float = DEFAULT_SILENCE_THRESHOLD_DB,
+    keep_ms: int = DEFAULT_KEEP_MS,
+) -> np.ndarray:
+    """
+    一次性裁剪整段音频的首尾静音
+
+    Args:
+        samples: (采样数, 声道数) 的int16数组
+        sample_rate: 采样率
+        threshold_db: 静音阈值(dBFS)
+        keep_ms: 首尾保留的静音时长(毫秒)
+
+    Returns:
+        np.ndarray: 裁剪后的音频
+    """
+    trimmer = SilenceTrimmer(sample_rate, samples.shape[1], threshold_db, keep_ms)
+    return np.concatenate([trimmer.process(samples), trimmer.flush()])
+
+
+@lru_cache(maxsize=16)
+def _design_polyphase(up: int, down: int, zero_crossings: int, rolloff: float, beta: float) -> np.ndarray:
+    """
+    设计Kaiser窗sinc低通原型滤波器并拆分为多相矩阵
+
+    Returns:
+        np.ndarray: (up, taps) 的float32矩阵，第r行为第r相的系数(已按相归一化为单位直流增益)
+    """
+    taps = ceil(2 * zero_crossings * max(up, down) / up)
+    length = taps * up
+    cutoff = rolloff * 0.5 / max(up, down)
+    # 取奇数长度使群延迟为整数采样 (length - 1) // 2，不足部分末尾补零
+    odd = length - 1 + length % 2
+    t = np.arange(odd) - (odd - 1) / 2
+    prototype = np.zeros(length)
+    prototype[:odd] = 2 * cutoff * np.sinc(2 * cutoff * t) * np.kaiser(odd, beta)
+
+    # h[r + k*up] 属于第r相的第k个系数
+    phases = prototype.reshape(taps, up).T
+    phases = phases / phases.sum(axis=1, keepdims=True)
+    phases = phases.astype(np.float32)
+    phases.setflags(write=False)
+    return phases
+
+
+class Resampler(PipelineStage):
+    """
+    多相FIR重采样
+
+    对有理比例 up/down 只计算需要输出的采样点：每个输出点选择一相滤波器，
+    与对应的 taps 个输入采样做点积，整块输出一次性用矩阵运算完成。
+    跨块保留滤波器所需的历史采样，因此可作为流式阶段串联在流水线中。
+    """
+
+    # 单次矩阵运算的最大输出点数，限制中间数组的内存占用
+    BLOCK = 8192
+
+    def __init__(
+        self,
+        src_rate: int,
+        dst_rate: int,
+        channels: int = 1,
+        zero_crossings: int = DEFAULT_ZERO_CROSSINGS,
+        rolloff: float = 0.945,
+        beta: float = 8.6,
+    ):
+        """
+        Args:
+            src_rate: 输入采样率
+            dst_rate: 输出采样率
+            channels: 声道数
+            zero_crossings: 滤波器每侧过零点数
+            rolloff: 截止频率相对奈奎斯特频率的比例
+            beta: Kaiser窗参数
+        """
+        g = gcd(src_rate, dst_rate)
+        self.up = dst_rate // g
+        self.down = src_rate // g
+        super().__init__(channels)
+        self.phases = _design_polyphase(self.up, self.down, zero_crossings, rolloff, beta)
+        self.taps = self.phases.shape[1]
+        # 原型滤波器的群延迟(上采样域)，补偿后输出与输入对齐
+        self.delay = (self.taps * self.up - 1) // 2
+
+        # 缓冲区第0个采样对应的输入下标；开头补taps个零作为历史
+        self._buffer = np.zeros((self.taps, channels), dtype=np.float32)
+        self._buffer_start = -self.taps
+        self._received = 0
+        self._produced = 0
+
+    def _render(self, count: int) -> np.ndarray:
+        """计算接下来的count个输出点并丢弃不再需要的历史采样"""
+        out = np.empty((count, self.channels), dtype=np.float32)
+        offsets = np.arange(self.taps)
+
+        for start in range(0, count, self.BLOCK):
+            n = np.arange(self._produced + start, self._produced + min(start + self.BLOCK, count))
+            position = n * self.down + self.delay
+            base = position // self.up - self._buffer_start
+            # (输出点, taps, 声道) 的输入采样与 (输出点, taps) 的相位系数逐点相乘后求和
+            window = self._buffer[base[:, None] - offsets[None, :]]
+            coefficients = self.phases[position % self.up]
+            out[start:start + len(n)] = np.einsum("nk,nkc->nc", coefficients, window)
+
+        self._produced += count
+        keep_from = (self._produced * self.down + self.delay) // self.up - self.taps + 1 - self._buffer_start
+        if keep_from > 0:
+            self._buffer = self._buffer[keep_from:]
+            self._buffer_start += keep_from
+
+        return np.clip(np.rint(out), -32768, 32767).astype(np.int16)
+
+    def process(self, samples: np.ndarray) -> np.ndarray:
+        if self.up == self.down:
+            return samples
+        self._buffer = np.concatenate([self._buffer, samples.astype(np.float32)])
+        self._received += len(samples)
+
+        # 输出点n所需的最新输入下标为 (n*down + delay) // up，必须已经到达
+        ready = (self._received * self.up - 1 - self.delay) // self.down + 1
+        return self._render(max(0, ready - self._produced))
+
+    def flush(self) -> np.ndarray:
+        if self.up == self.down:
+            return np.zeros((0, self.channels), dtype=np.int16)
+        # 输入结束后以零补齐，输出总长为 ceil(输入长度 * up / down)
+        total = -(-self._received * self.up // self.down)
+        self._buffer = np.concatenate([self._buffer, np.zeros((self.taps + 1, self.channels), dtype=np.float32)])
+        return self._render(max(0, total - self._produced))
+
+
+def resample(samples: np.ndarray, src_rate: int, dst_rate: int) -> np.ndarray:
+    """
+    一次性重采样整段音频
+
+    Args:
+        samples: (采样数, 声道数) 的int16数组
+        src_rate: 输入采样率
+        dst_rate: 输出采样率
+
+    Returns:
+        np.ndarray: 重采样后的int16数组
+    """
+    resampler = Resampler(src_rate, dst_rate, samples.shape[1])
+    return np.concatenate([resampler.process(samples), resampler.flush()])
+
+
+_resample_cache: "OrderedDict[tuple, np.ndarray]" = OrderedDict()
+
+
+def resample_cached(samples: np.ndarray, src_rate: int, dst_rate: int) -> np.ndarray:
+    """
+    带缓存的重采样，相同音频和目标采样率只计算一次
+
+    Args:
+        samples: (采样数, 声道数) 的int16数组
+        src_rate: 输入采样率
+        dst_rate: 输出采样率
+
+    Returns:
+        np.ndarray: 重采样后的int16数组(只读，请勿原地修改)
+    """
+    digest = hashlib.blake2b(np.ascontiguousarray(samples).tobytes(), digest_size=16).hexdigest()
+    key = (digest, samples.shape[1], src_rate, dst_rate)
+
+    cached = _resample_cache.get(key)
+    if cached is not None:
+        _resample_cache.move_to_end(key)
+        return cached
+
+    result = resample(samples, src_rate, dst_rate)
+    result.setflags(write=False)
+    _resample_cache[key] = result
+    if len(_resample_cache) > RESAMPLE_CACHE_SIZE:
+        _resample_cache.popitem(last=False)
+    return result
+
+
+def read_audio(path: Union[str, Path]) -> Tuple[np.ndarray, int]:
+    """
+    读取音频文件为int16数组
+
+    WAV直接读取PCM，其他格式(如MP3)通过pydub解码(需要FFmpeg)
+
+    Returns:
+        (samples, sample_rate)
+    """
+    path = Path(path)
+    if path.suffix.lower() == ".wav":
+        with wave.open(str(path), "rb") as wf:
+            if wf.getsampwidth() == 2:
+                # 流式WAV头中的长度可能未回填，按实际文件读取
+                frames = wf.readframes(wf.getnframes())
+                return pcm_to_array(frames, wf.getnchannels()), wf.getframerate()
+
+    from pydub import AudioSegment
+
+    segment = AudioSegment.from_file(str(path)).set_sample_width(2)
+    return pcm_to_array(segment.raw_data, segment.channels), segment.frame_rate
+
+
+def write_audio(
+    path: Union[str, Path],
+    samples: np.ndarray,
+    sample_rate: int,
+    bit_rate: Optional[int] = None,
+) -> None:
+    """
+    将int16数组写入音频文件，格式由扩展名决定
+
+    Args:
+        path: 输出路径
+        samples: (采样数, 声道数) 的int16数组
+        sample_rate: 采样率
+        bit_rate: 压缩格式的比特率(kbps)，如128
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    if path.suffix.lower() == ".wav":
+        with wave.open(str(path), "wb") as wf:
+            wf.setnchannels(samples.shape[1])
+            wf.setsampwidth(2)
+            wf.setframerate(sample_rate)
+            wf.writeframes(array_to_pcm(samples))
+        return
+
+    from pydub import AudioSegment
+
+    segment = AudioSegment(
+        data=array_to_pcm(samples),
+        sample_width=2,
+        frame_rate=sample_rate,
+        channels=samples.shape[1],
+    )
+    export_kwargs = {"bitrate": f"{bit_rate}k"} if bit_rate else {}
+    segment.export(str(path), format=path.suffix.lstrip(".").lower(), **export_kwargs)
+
+
+def encode_pcm_stream(
+    chunks: Iterable[np.ndarray],
+    path: Union[str, Path],
+    sample_rate: int,
+    channels: int = 1,
+    bit_rate: Optional[int] = None,
+) -> int:
+    """
+    将int16音频块边处理边编码为文件，只编码一次
+
+    WAV直接写入PCM；其他格式通过标准输入交给FFmpeg编码。
+    先写临时文件，成功后原子替换，失败时不改动已有的输出文件。
+
+    Args:
+        chunks: (采样数, 声道数) 的int16数组块
+        path: 输出路径，格式由扩展名决定
+        sample_rate: 采样率
+        channels: 声道数
+        bit_rate: 压缩格式的比特率(kbps)，如128
+
+    Returns:
+        int: 写入的采样数
+
+    Raises:
+        FileNotFoundError: 编码压缩格式但未安装FFmpeg
+        RuntimeError: FFmpeg编码失败
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    ext = path.suffix.lower().lstrip(".")
+    total = 0
+
+    try:
+        if ext == "wav":
+            with wave.open(str(tmp), "wb") as wf:
+                wf.setnchannels(channels)
+                wf.setsampwidth(2)
+                wf.setframerate(sample_rate)
+                for chunk in chunks:
+                    wf.writeframes(array_to_pcm(chunk))
+                    total += len(chunk)
+        else:
+            cmd = ["ffmpeg", "-hide_banner", "-loglevel", "error", "-y",
+                   "-f", "s16le", "-ar", str(sample_rate), "-ac", str(channels), "-i", "pipe:0"]
+            if bit_rate:
+                cmd += ["-b:a", f"{bit_rate}k"]
+            cmd += ["-f", ext, str(tmp)]
+            process = subprocess.Popen(cmd, stdin=subprocess.PIPE, stderr=subprocess.PIPE)
+            try:
+                for chunk in chunks:
+                    process.stdin.write(array_to_pcm(chunk))
+                    total += len(chunk)
+            except BrokenPipeError:
+                pass
+            finally:
+                process.stdin.close()
+                stderr = process.stderr.read()
+                returncode = process.wait()
+            if returncode != 0:
+                raise RuntimeError(f"FFmpeg编码失败: {stderr.decode(errors='replace').strip()}")
+
+        if total:
+            os.replace(tmp, path)
+    finally:
+        if tmp.exists():
+            tmp.unlink()
+    return total
+
+
+def synthesize_trimmed(
+    client,
+    text: str,
+    output_file: Union[str, Path],
+    sample_rate: int = 24000,
+    bit_rate: Optional[int] = None,
+    threshold_db: float = DEFAULT_SILENCE_THRESHOLD_DB,
+    keep_ms: int = DEFAULT_KEEP_MS,
+    **kwargs,
+) -> bool:
+    """
+    合成一段语音并裁剪首尾静音，每段只调用一次合成接口
+
+    以PCM流式接收，边接收边经过SilenceTrimmer，最后只编码一次(不对服务端的压缩音频解码再重编码)。
+    整段为静音或裁剪、编码出错时，改为写出已接收的原始PCM(不裁剪)，不会为同一段再次请求合成。
+    没有FFmpeg且输出不是WAV时直接合成为目标格式(不裁剪)。
+
+    Args:
+        client: TTS客户端(提供 stream_speech / synthesize_speech，如 tts_http_v3.TTSHttpClient)
+        text: 要合成的文本
+        output_file: 输出文件，格式由扩展名决定
+        sample_rate: 采样率
+        bit_rate: 压缩格式的比特率(kbps)，如128
+        threshold_db: 静音阈值(dBFS)
+        keep_ms: 首尾保留的静音时长(毫秒)
+        **kwargs: 其他合成参数(音色、情感、上下文等；audio_format 以扩展名为准，忽略)
+
+    Returns:
+        bool: 是否生成成功
+    """
+    kwargs.pop("audio_format", None)
+    ext = Path(output_file).suffix.lower().lstrip(".")
+    if ext != "wav" and not shutil.which("ffmpeg"):
+        logger.warning("⚠️ 未安装FFmpeg，直接合成(不裁剪静音)")
+        return client.synthesize_speech(text=text, output_file=str(output_file), audio_format=ext,
+                                        sample_rate=sample_rate, bit_rate=bit_rate, **kwargs)
+
+    stream = client.stream_speech(text=text, audio_format="pcm", sample_rate=sample_rate, **kwargs)
+    received: List[bytes] = []
+    upstream_failed = False
+
+    def record() -> Iterator[bytes]:
+        nonlocal upstream_failed
+        try:
+            for chunk in stream:
+                received.append(chunk)
+                yield chunk
+        except Exception:
+            upstream_failed = True
+            raise
+
+    trimmer = SilenceTrimmer(sample_rate, threshold_db=threshold_db, keep_ms=keep_ms)
+    try:
+        if encode_pcm_stream(run_pipeline(iter_pcm_arrays(record()), [trimmer]), output_file,
+                             sample_rate, bit_rate=bit_rate):
+            logger.info("✂️ 已裁剪首尾静音")
+            return True
+        logger.warning("⚠️ 整段为静音，保留原始音频")
+    except Exception as e:
+        if upstream_failed:
+            logger.error(f"❌ 合成失败: {e}")
+            return False
+        logger.warning(f"⚠️ 裁剪静音失败，保留原始音频(不裁剪): {e}")
+
+    try:
+        # 接收剩余的音频(裁剪出错时流可能尚未读完)，再整段写出
+        received.extend(stream)
+        return encode_pcm_stream(iter_pcm_arrays(received), output_file, sample_rate,
+                                 bit_rate=bit_rate) > 0
+    except Exception as e:
+        logger.error(f"❌ 写出原始音频失败: {e}")
+        return False
+
+
+def trim_audio_file(
+    input_file: Union[str, Path],
+    output_file: Optional[Union[str, Path]] = None,
+    threshold_db: float = DEFAULT_SILENCE_THRESHOLD_DB,
+    keep_ms: int = DEFAULT_KEEP_MS,
+    bit_rate: Optional[int] = None,
+) -> bool:
+    """
+    裁剪音频文件的首尾静音
+
+    Args:
+        input_file: 输入文件
+        output_file: 输出文件，默认覆盖输入文件
+        threshold_db: 静音阈值(dBFS)
+        keep_ms: 首尾保留的静音时长(毫秒)
+        bit_rate: 重新编码压缩格式时使用的比特率(kbps)
+
+    Returns:
+        bool: 是否成功(整段为静音时不改写文件并返回False)
+    """
+    samples, sample_rate = read_audio(input_file)
+    trimmed = trim_silence(samples, sample_rate, threshold_db, keep_ms)
+    if not len(trimmed):
+        return False
+
+    write_audio(output_file or input_file, trimmed, sample_rate, bit_rate)
+    return True
@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+"""
+音频元数据快速探测
+只读取文件头(WAV的RIFF/RF64块头、MP3的帧头和Xing/Info/VBRI头)，
+不解码音频数据即可获得时长、采样率、声道数和比特率
+"""
+import os
+import struct
+from pathlib import Path
+from typing import Dict, Optional, Union
+
+# MP3帧头扫描时最多读取的字节数(跳过ID3v2之后)
+MP3_SCAN_BYTES = 64 * 1024
+
+# MPEG版本: 0=MPEG2.5, 2=MPEG2, 3=MPEG1 (1为保留值)
+_MPEG_SAMPLE_RATES = {
+    3: (44100, 48000, 32000),
+    2: (22050, 24000, 16000),
+    0: (11025, 12000, 8000),
+}
+
+# 比特率表 (kbps)，键为 (是否MPEG1, 层)
+_MPEG_BITRATES = {
+    (True, 1): (0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448),
+    (True, 2): (0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384),
+    (True, 3): (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    (False, 1): (0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256),
+    (False, 2): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+    (False, 3): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+
+# 流式WAV头中常见的"未知长度"占位值
+_WAV_UNKNOWN_SIZES = (0, 0xFFFFFFFF)
+
+
+def probe_audio(path: Union[str, Path]) -> Dict:
+    """
+    探测音频文件的元数据
+
+    Args:
+        path: 音频文件路径 (WAV/RF64/MP3)
+
+    Returns:
+        dict: format, duration(秒), sample_rate, channels, bit_rate(bps)，
+              WAV额外包含 bits_per_sample, data_offset, data_size
+
+    Raises:
+        ValueError: 无法识别的文件格式
+    """
+    path = Path(path)
+    file_size = path.stat().st_size
+
+    with open(path, "rb") as f:
+        head = f.read(12)
+        if len(head) >= 12 and head[:4] in (b"RIFF", b"RF64", b"BW64") and head[8:12] == b"WAVE":
+            return _probe_wav(f, head[:4], file_size)
+
+        f.seek(0)
+        return _probe_mp3(f, file_size)
+
+
+def probe_duration(path: Union[str, Path]) -> Optional[float]:
+    """
+    获取音频时长(秒)，探测失败时返回None
+
+    Args:
+        path: 音频文件路径
+
+    Returns:
+        时长(秒)或None
+    """
+    try:
+        return probe_audio(path)["duration"]
+    except (OSError, ValueError, struct.error):
+        return None
+
+
+def _probe_wav(f, magic: bytes, file_size: int) -> Dict:
+    """逐块跳读RIFF/RF64头，遇到data块即停止"""
+    fmt = None
+    ds64_data_size = None
+    pos = 12
+
+    while pos + 8 <= file_size:
+        f.seek(pos)
+        chunk_id, chunk_size = struct.unpack("<4sI", f.read(8))
+        body = pos + 8
+
+        if chunk_id == b"fmt ":
+            audio_format, channels, sample_rate, byte_rate, block_align, bits = struct.unpack(
+                "<HHIIHH", f.read(16)
+            )
+            fmt = {
+                "audio_format": audio_format,
+                "channels": channels,
+                "sample_rate": sample_rate,
+                "byte_rate": byte_rate,
+                "block_align": block_align,
+                "bits_per_sample": bits,
+            }
+        elif chunk_id == b"ds64":
+            # RF64: riffSize(8) + dataSize(8) + sampleCount(8)
+            _, ds64_data_size = struct.unpack("<QQ", f.read(16))
+        elif chunk_id == b"data":
+            if fmt is None:
+                raise ValueError("WAV文件缺少fmt块")
+
+            available = file_size - body
+            if magic != b"RIFF" and chunk_size == 0xFFFFFFFF and ds64_data_size is not None:
+                data_size = ds64_data_size
+            elif chunk_size in _WAV_UNKNOWN_SIZES or chunk_size > available:
+                # 流式写入的WAV头中长度未回填，以实际文件长度为准
+                data_size = available
+            else:
+                data_size = chunk_size
+            data_size = min(data_size, available)
+
+            byte_rate = fmt["byte_rate"] or (
+                fmt["sample_rate"] * fmt["channels"] * fmt["bits_per_sample"] // 8
+            )
+            return {
+                "format": "wav",
+                "duration": data_size / byte_rate if byte_rate else 0.0,
+                "sample_rate": fmt["sample_rate"],
+                "channels": fmt["channels"],
+                "bit_rate": byte_rate * 8,
+                "bits_per_sample": fmt["bits_per_sample"],
+                "data_offset": body,
+                "data_size": data_size,
+            }
+
+        # 块按偶数字节对齐
+        pos = body + chunk_size + (chunk_size & 1)
+
+    raise ValueError("WAV文件缺少data块")
+
+
+def _parse_mp3_header(header: int) -> Optional[Dict]:
+    """解析4字节MPEG音频帧头，无效时返回None"""
+    if (header >> 21) & 0x7FF != 0x7FF:
+        return None
+
+    version = (header >> 19) & 0x3
+    layer_bits = (header >> 17) & 0x3
+    bitrate_index = (header >> 12) & 0xF
+    sample_rate_index = (header >> 10) & 0x3
+
+    if version == 1 or layer_bits == 0 or bitrate_index in (0, 15) or sample_rate_index == 3:
+        return None
+
+    layer = 4 - layer_bits
+    is_mpeg1 = version == 3
+    bit_rate = _MPEG_BITRATES[(is_mpeg1, layer)][bitrate_index] * 1000
+    sample_rate = _MPEG_SAMPLE_RATES[version][sample_rate_index]
+    padding = (header >> 9) & 0x1
+    channels = 1 if (header >> 6) & 0x3 == 3 else 2
+
+    if layer == 1:
+        samples_per_frame = 384
+        frame_length = (12 * bit_rate // sample_rate + padding) * 4
+    elif layer == 2 or is_mpeg1:
+        samples_per_frame = 1152
+        frame_length = 144 * bit_rate // sample_rate + padding
+    else:
+        samples_per_frame = 576
+        frame_length = 72 * bit_rate // sample_rate + padding
+
+    return {
+        "is_mpeg1": is_mpeg1,
+        "layer": layer,
+        "bit_rate": bit_rate,
+        "sample_rate": sample_rate,
+        "channels": channels,
+        "samples_per_frame": samples_per_frame,
+        "frame_length": frame_length,
+    }
+
+
+def _id3v2_size(data: bytes) -> int:
+    """返回ID3v2标签总长度(不存在时为0)"""
+    if len(data) < 10 or data[:3] != b"ID3":
+        return 0
+    size = (data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9]
+    footer = 10 if data[5] & 0x10 else 0
+    return 10 + size + footer
+
+
+def _probe_mp3(f, file_size: int) -> Dict:
+    """定位首个有效帧，优先使用Xing/Info/VBRI头中的帧数，否则按CBR估算"""
+    start = _id3v2_size(f.read(10))
+    f.seek(start)
+    buf = f.read(MP3_SCAN_BYTES)
+
+    # ID3v1标签位于文件末尾128字节
+    end = file_size
+    if file_size >= 128:
+        f.seek(file_size - 128)
+        if f.read(3) == b"TAG":
+            end -= 128
+
+    offset = 0
+    frame = None
+    while offset + 4 <= len(buf):
+        if buf[offset] == 0xFF and buf[offset + 1] & 0xE0 == 0xE0:
+            frame = _parse_mp3_header(struct.unpack(">I", buf[offset:offset + 4])[0])
+            if frame:
+                # 校验下一帧帧头，避免把音频数据误判为同步字
+                nxt = offset + frame["frame_length"]
+                if nxt + 4 > len(buf) or _parse_mp3_header(struct.unpack(">I", buf[nxt:nxt + 4])[0]):
+                    break
+            frame = None
+        offset += 1
+
+    if frame is None:
+        raise ValueError("无法识别的音频格式")
+
+    audio_start = start + offset
+    audio_bytes = end - audio_start
+
+    # Xing/Info头位于边信息(side info)之后
+    if frame["is_mpeg1"]:
+        side_info = 17 if frame["channels"] == 1 else 32
+    else:
+        side_info = 9 if frame["channels"] == 1 else 17
+    xing_at = offset + 4 + side_info
+    vbri_at = offset + 4 + 32
+
+    frames = None
+    if buf[xing_at:xing_at + 4] in (b"Xing", b"Info"):
+        flags = struct.unpack(">I", buf[xing_at + 4:xing_at + 8])[0]
+        cursor = xing_at + 8
+        if flags & 0x1:
+            frames = struct.unpack(">I", buf[cursor:cursor + 4])[0]
+            cursor += 4
+        if flags & 0x2:
+            audio_bytes = struct.unpack(">I", buf[cursor:cursor + 4])[0]
+            cursor += 4
+        # flags & 0x4 为100字节的TOC寻址表，时长计算不需要，直接跳过
+    elif buf[vbri_at:vbri_at + 4] == b"VBRI":
+        audio_bytes, frames = struct.unpack(">II", buf[vbri_at + 10:vbri_at + 18])
+
+    if frames:
+        duration = frames * frame["samples_per_frame"] / frame["sample_rate"]
+        bit_rate = int(audio_bytes * 8 / duration) if duration else frame["bit_rate"]
+    else:
+        bit_rate = frame["bit_rate"]
+        duration = audio_bytes * 8 / bit_rate
+
+    return {
+        "format": "mp3",
+        "duration": duration,
+        "sample_rate": frame["sample_rate"],
+        "channels": frame["channels"],
+        "bit_rate": bit_rate,
+    }
+
+
+if __name__ == "__main__":
+    import sys
+    import time
+
+    for file_path in sys.argv[1:]:
+        started = time.perf_counter()
+        info = probe_audio(file_path)
+        elapsed_us = (time.perf_counter() - started) * 1e6
+        print(f"{os.path.basename(file_path)}: {info} ({elapsed_us:.0f} µs)")
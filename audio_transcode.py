@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+"""
+本地并行转码
+一次合成得到的WAV在本地用进程池同时编码为多种交付格式(MP3/OGG Opus等)，
+避免为每种格式重复向服务端请求合成
+"""
+import hashlib
+import json
+import logging
+import os
+import shutil
+import time
+import wave
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+# 交付格式配置: 名称 -> 编码参数
+# ext为文件扩展名；format/codec/bitrate传给pydub(FFmpeg)，wav/pcm使用内置编码
+DELIVERY_FORMATS = {
+    "wav": {"ext": "wav"},
+    "pcm": {"ext": "pcm"},
+    "mp3": {"ext": "mp3", "format": "mp3", "bitrate": "128k"},
+    "ogg_opus": {"ext": "ogg", "format": "ogg", "codec": "libopus", "bitrate": "64k"},
+}
+
+# 默认最大转码进程数
+DEFAULT_MAX_WORKERS = 4
+
+# 转码缓存目录，默认位于本模块所在目录下(不随启动时的工作目录变化)
+DEFAULT_CACHE_DIR = Path(os.getenv("TRANSCODE_CACHE_DIR") or Path(__file__).resolve().parent / "transcode_cache")
+
+# 转码缓存默认上限: 总大小(字节)和未使用的最长保留时间(秒)
+DEFAULT_CACHE_MAX_BYTES = int(os.getenv("TRANSCODE_CACHE_MAX_MB", "512")) * 1024 * 1024
+DEFAULT_CACHE_MAX_AGE = float(os.getenv("TRANSCODE_CACHE_MAX_AGE_HOURS", "72")) * 3600
+
+
+def _encode(source_file: str, output_file: str, options: Dict) -> str:
+    """
+    在工作进程中执行单个格式的编码
+
+    先写临时文件再原子替换，避免并发读到半成品
+    """
+    tmp_file = f"{output_file}.{os.getpid()}.tmp"
+    ext = options["ext"]
+
+    try:
+        if ext in ("wav", "pcm"):
+            with wave.open(source_file, "rb") as src:
+                params = src.getparams()
+                frames = src.readframes(src.getnframes())
+            if ext == "pcm":
+                with open(tmp_file, "wb") as f:
+                    f.write(frames)
+            else:
+                # 源文件头中的长度可能是流式占位值，由wave按实际写入长度重新生成
+                with wave.open(tmp_file, "wb") as dst:
+                    dst.setparams(params._replace(nframes=0))
+                    dst.writeframes(frames)
+        else:
+            from pydub import AudioSegment
+
+            segment = AudioSegment.from_wav(source_file)
+            export_kwargs = {key: options[key] for key in ("codec", "bitrate") if options.get(key)}
+            segment.export(tmp_file, format=options["format"], **export_kwargs)
+
+        os.replace(tmp_file, output_file)
+    finally:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+    return output_file
+
+
+def _file_digest(path: Union[str, Path]) -> str:
+    """计算文件内容摘要，作为转码缓存键"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()[:32]
+
+
+class Transcoder:
+    """进程池转码器，按(源音频内容, 格式, 参数)缓存输出，超出上限时淘汰最久未使用的缓存"""
+
+    def __init__(
+        self,
+        cache_dir: Union[str, Path] = DEFAULT_CACHE_DIR,
+        max_workers: Optional[int] = None,
+        max_cache_bytes: Optional[int] = DEFAULT_CACHE_MAX_BYTES,
+        max_cache_age: Optional[float] = DEFAULT_CACHE_MAX_AGE,
+    ):
+        """
+        Args:
+            cache_dir: 转码结果缓存目录，默认 DEFAULT_CACHE_DIR
+            max_workers: 最大转码进程数，默认不超过CPU核数和DEFAULT_MAX_WORKERS
+            max_cache_bytes: 缓存总大小上限(字节)，None表示不限
+            max_cache_age: 缓存文件未被使用的最长保留时间(秒)，None表示不限
+        """
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_workers = max_workers or min(os.cpu_count() or 1, DEFAULT_MAX_WORKERS)
+        self.max_cache_bytes = max_cache_bytes
+        self.max_cache_age = max_cache_age
+        self._pool = None
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.max_workers)
+        return self._pool
+
+    def cache_path(self, digest: str, fmt: str, options: Dict) -> Path:
+        """返回指定格式的缓存文件路径"""
+        options_key = hashlib.sha256(json.dumps(options, sort_keys=True).encode()).hexdigest()[:8]
+        return self.cache_dir / f"{digest}_{fmt}_{options_key}.{options['ext']}"
+
+    def transcode(
+        self,
+        source_file: Union[str, Path],
+        formats: Iterable[str],
+        output_stem: Optional[Union[str, Path]] = None,
+        overrides: Optional[Dict[str, Dict]] = None,
+    ) -> Dict[str, Optional[str]]:
+        """
+        将WAV并行转码为多种格式
+
+        Args:
+            source_file: 源WAV文件(16位PCM)
+            formats: 目标格式名称列表，见 DELIVERY_FORMATS
+            output_stem: 输出路径前缀(不含扩展名)，为空时直接返回缓存文件路径
+            overrides: 按格式覆盖编码参数，如 {"mp3": {"bitrate": "192k"}}
+
+        Returns:
+            Dict[str, Optional[str]]: 格式 -> 输出文件路径(失败为None)
+        """
+        digest = _file_digest(source_file)
+        overrides = overrides or {}
+        results = {}
+        pending = {}
+
+        for fmt in formats:
+            if fmt not in DELIVERY_FORMATS:
+                logger.error(f"❌ 不支持的转码格式: {fmt}")
+                results[fmt] = None
+                continue
+
+            options = {**DELIVERY_FORMATS[fmt], **overrides.get(fmt, {})}
+            cached = self.cache_path(digest, fmt, options)
+            if cached.exists():
+                logger.info(f"♻️ 命中转码缓存: {fmt}")
+                # 刷新修改时间，淘汰时按最近使用排序
+                os.utime(cached)
+                results[fmt] = str(cached)
+            else:
+                pending[fmt] = self._get_pool().submit(_encode, str(source_file), str(cached), options)
+
+        for fmt, future in pending.items():
+            try:
+                results[fmt] = future.result()
+                logger.info(f"🎚️ 转码完成: {fmt}")
+            except Exception as e:
+                logger.error(f"❌ 转码失败 [{fmt}]: {e}")
+                results[fmt] = None
+
+        if output_stem is not None:
+            for fmt, cached in results.items():
+                if cached:
+                    output_file = f"{output_stem}.{DELIVERY_FORMATS[fmt]['ext']}"
+                    Path(output_file).parent.mkdir(parents=True, exist_ok=True)
+                    if Path(output_file).resolve() != Path(cached).resolve():
+                        shutil.copyfile(cached, output_file)
+                    results[fmt] = output_file
+
+        self.prune(keep=[path for path in results.values() if path])
+        return results
+
+    def prune(self, keep: Iterable[Union[str, Path]] = ()) -> int:
+        """
+        淘汰过期和超出总大小上限的缓存文件(按修改时间从旧到新)
+
+        Args:
+            keep: 不淘汰的文件(如刚返回给调用方的缓存路径)
+
+        Returns:
+            int: 删除的文件数
+        """
+        if self.max_cache_bytes is None and self.max_cache_age is None:
+            return 0
+
+        keep = {Path(path).resolve() for path in keep}
+        now = time.time()
+        entries = []
+        for path in self.cache_dir.iterdir():
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            if path.is_file():
+                entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort()
+
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for mtime, size, path in entries:
+            expired = self.max_cache_age is not None and now - mtime > self.max_cache_age
+            oversize = self.max_cache_bytes is not None and total > self.max_cache_bytes
+            if not (expired or oversize):
+                continue
+            # 正在写入的临时文件只按过期清理(残留的半成品)
+            if path.resolve() in keep or (path.suffix == ".tmp" and not expired):
+                continue
+            try:
+                path.unlink()
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+
+        if removed:
+            logger.info(f"🧹 清理转码缓存: {removed} 个文件")
+        return removed
+
+    def close(self):
+        """关闭进程池"""
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -1,12 +1,31 @@
 """
 使用AI分析对话文本
 """
+import copy
+import hashlib
 import json
 import os
-from typing import Dict, Any
+import re
+import threading
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Iterator, List, Optional, Tuple
 import requests
+from script_parser import ScriptParser
 from tts_config import CHINESE_EMOTION_NAMES, VOICE_TYPES, get_voice_type
 
+# 单次请求的最大文本长度(字符),更长的文本按行切分为多段并行分析
+CHUNK_MAX_CHARS = int(os.getenv("ANALYZE_CHUNK_CHARS", "3000"))
+
+# 相邻两段之间重叠的行数,用于对齐两段中的说话人
+CHUNK_OVERLAP_LINES = 4
+
+# 同时分析的最大段数
+MAX_PARALLEL_CHUNKS = int(os.getenv("ANALYZE_MAX_PARALLEL", "4"))
+
+# 分析结果缓存条数(按 模型+文本 哈希)
+ANALYSIS_CACHE_SIZE = 128
+
 
 class DialogueAnalyzer:
     """对话分析器,使用DeepSeek或其他LLM"""
@@ -23,22 +42,199 @@ class DialogueAnalyzer:
         self.api_base = api_base or os.getenv("OPENAI_BASE_URL") or "https://api.deepseek.com"
         self.model = model or os.getenv("OPENAI_MODEL") or "deepseek-chat"
         
+        # 已标注说话人的剧本直接按规则解析,不调用LLM
+        self.script_parser = ScriptParser()
+        
+        # 分析结果缓存: 哈希 -> 结果(LRU)
+        self._cache: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+        
     def analyze_dialogue(self, text: str) -> Dict[str, Any]:
         """
         分析对话文本,返回结构化结果
+        已标注说话人的剧本按规则解析;相同文本(同一模型)直接返回缓存结果;
+        超长文本切分为互相重叠的多段并行分析后合并
         :param text: 原始对话文本
         :return: 分析结果字典
         """
-        prompt = self._build_prompt(text)
+        parsed = self.parse_script(text)
+        if parsed is not None:
+            return parsed
+        
+        cache_key = self._cache_key(text)
+        cached = self._cache_get(cache_key)
+        if cached is not None:
+            print("♻️ 命中对话分析缓存")
+            return cached
+        
+        chunks = self._split_chunks(text)
         
         try:
-            response = self._call_llm(prompt)
-            result = self._parse_response(response)
-            return result
+            if len(chunks) == 1:
+                result = self._analyze_chunk(text)
+                complete = True
+            else:
+                print(f"📚 文本较长,分为 {len(chunks)} 段并行分析")
+                with ThreadPoolExecutor(max_workers=min(MAX_PARALLEL_CHUNKS, len(chunks))) as executor:
+                    outcomes = list(executor.map(self._analyze_chunk_or_default, ["\n".join(c) for c in chunks]))
+                result = self._merge_chunks(chunks, [chunk_result for chunk_result, _ in outcomes])
+                complete = all(ok for _, ok in outcomes)
         except Exception as e:
             print(f"AI分析失败: {e}")
             # 返回默认结构
             return self._get_default_structure(text)
+        
+        # 有分段使用了默认结构时不缓存,下次重新分析失败的分段(成功的分段已按段缓存)
+        if complete:
+            self._cache_put(cache_key, result)
+        return copy.deepcopy(result)
+    
+    def parse_script(self, text: str) -> Optional[Dict[str, Any]]:
+        """
+        按剧本格式(如 `小明: 你好`、`【小红】你好`)规则解析,不调用LLM
+        :param text: 原始对话文本
+        :return: 分析结果字典,不是剧本格式或置信度不足时返回None
+        """
+        result = self.script_parser.try_parse(text)
+        if result is not None:
+            print(f"⚡ 按剧本格式解析: {len(result['speakers'])} 个说话人, {len(result['dialogues'])} 句对话")
+        return result
+    
+    def _analyze_chunk(self, text: str) -> Dict[str, Any]:
+        """分析一段文本(结果按段缓存,修改长文本的一部分时其余段不需要重新分析)"""
+        cache_key = self._cache_key(text)
+        cached = self._cache_get(cache_key)
+        if cached is not None:
+            return cached
+        
+        response = self._call_llm(self._build_prompt(text))
+        result = self._parse_response(response)
+        self._cache_put(cache_key, result)
+        return copy.deepcopy(result)
+    
+    def _analyze_chunk_or_default(self, text: str) -> Tuple[Dict[str, Any], bool]:
+        """
+        分析一段文本,失败时该段使用默认结构(不影响其他段)
+        :return: (分析结果, 是否分析成功)
+        """
+        try:
+            return self._analyze_chunk(text), True
+        except Exception as e:
+            print(f"分段分析失败,该段使用默认结构: {e}")
+            return self._get_default_structure(text), False
+    
+    # ---- 缓存 ----
+    
+    def _cache_key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.model}\n{text}".encode("utf-8")).hexdigest()
+    
+    def _cache_get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._cache_lock:
+            result = self._cache.get(key)
+            if result is None:
+                return None
+            self._cache.move_to_end(key)
+        return copy.deepcopy(result)
+    
+    def _cache_put(self, key: str, result: Dict[str, Any]):
+        with self._cache_lock:
+            self._cache[key] = copy.deepcopy(result)
+            self._cache.move_to_end(key)
+            while len(self._cache) > ANALYSIS_CACHE_SIZE:
+                self._cache.popitem(last=False)
+    
+    # ---- 长文本分段 ----
+    
+    @staticmethod
+    def _split_chunks(text: str) -> List[List[str]]:
+        """
+        按行把文本切分为不超过 CHUNK_MAX_CHARS 的多段,相邻段重叠 CHUNK_OVERLAP_LINES 行
+        :return: 每段的行列表(不足一段时只有一段)
+        """
+        lines = [line.strip() for line in text.split('\n') if line.strip()]
+        if len(text) <= CHUNK_MAX_CHARS or len(lines) <= 1:
+            return [lines]
+        
+        chunks = []
+        start = 0
+        while start < len(lines):
+            end, size = start, 0
+            while end < len(lines) and (end == start or size + len(lines[end]) <= CHUNK_MAX_CHARS):
+                size += len(lines[end]) + 1
+                end += 1
+            chunks.append(lines[start:end])
+            if end >= len(lines):
+                break
+            # 下一段从本段末尾的重叠行开始(至少前进一行)
+            start = max(start + 1, end - CHUNK_OVERLAP_LINES)
+        return chunks
+    
+    @staticmethod
+    def _normalize(text: str) -> str:
+        """去掉空白和标点,用于比较同一句对话"""
+        return re.sub(r"[\W_]+", "", text or "")
+    
+    def _merge_chunks(self, chunks: List[List[str]], results: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        合并各段的分析结果
+        
+        各段的说话人ID互相独立,按以下顺序映射到全局说话人:
+        1. 重叠区中与上一段同一句对话的说话人(多数投票)
+        2. 同名说话人
+        3. 都不匹配时新建说话人
+        重叠区中上一段已输出的对话不重复输出。
+        """
+        speakers: List[Dict[str, Any]] = []
+        speakers_by_name: Dict[str, str] = {}
+        dialogues: List[Dict[str, Any]] = []
+        prev_tail: List[Dict[str, Any]] = []
+        
+        for index, (lines, result) in enumerate(zip(chunks, results)):
+            local_speakers = {s.get("id"): s for s in result.get("speakers", [])}
+            chunk_dialogues = result.get("dialogues", [])
+            
+            # 找出位于重叠区且上一段已输出的对话
+            overlap = [self._normalize(line) for line in lines[:CHUNK_OVERLAP_LINES]] if index else []
+            duplicates = {}
+            votes: Dict[str, Counter] = {}
+            for position, dialogue in enumerate(chunk_dialogues):
+                norm = self._normalize(dialogue.get("text"))
+                if not norm or not any(norm in line for line in overlap):
+                    break
+                match = next((d for d in reversed(prev_tail) if self._normalize(d["text"]) == norm), None)
+                if match:
+                    duplicates[position] = match
+                    votes.setdefault(dialogue.get("speaker_id"), Counter())[match["speaker_id"]] += 1
+            
+            # 局部说话人 -> 全局说话人
+            mapping: Dict[str, str] = {}
+            for local_id, speaker in local_speakers.items():
+                name_key = self._normalize(speaker.get("name"))
+                if local_id in votes:
+                    mapping[local_id] = votes[local_id].most_common(1)[0][0]
+                elif name_key and name_key in speakers_by_name:
+                    mapping[local_id] = speakers_by_name[name_key]
+                else:
+                    global_id = f"speaker_{len(speakers) + 1}"
+                    speakers.append({**speaker, "id": global_id})
+                    mapping[local_id] = global_id
+                if name_key:
+                    speakers_by_name.setdefault(name_key, mapping[local_id])
+            
+            fallback_id = speakers[0]["id"] if speakers else "speaker_1"
+            chunk_tail = []
+            for position, dialogue in enumerate(chunk_dialogues):
+                if position in duplicates:
+                    continue
+                merged = {**dialogue, "speaker_id": mapping.get(dialogue.get("speaker_id"), fallback_id)}
+                if dialogues and not chunk_tail:
+                    # 每段第一句的上下文是合并后的上一句
+                    merged["context"] = dialogues[-1]["text"]
+                dialogues.append(merged)
+                chunk_tail.append(merged)
+            prev_tail = chunk_tail or prev_tail
+        
+        return {"speakers": speakers, "dialogues": dialogues}
     
     def _build_prompt(self, text: str) -> str:
         """构建提示词"""
@@ -119,22 +315,11 @@ class DialogueAnalyzer:
             
             # 为说话人分配音色
             for speaker in data["speakers"]:
-                gender = speaker.get("gender", "male")
-                age = speaker.get("age_group", "adult")
-                
-                if age == "child":
-                    voice_key = f"{gender}_child"
-                else:
-                    voice_key = f"{gender}_adult"
-                
-                # 使用辅助函数获取音色
-                speaker["voice_type"] = get_voice_type(gender, age)
+                self._prepare_speaker(speaker)
             
             # 验证情感标签
             for dialogue in data["dialogues"]:
-                emotion = dialogue.get("emotion")
-                if emotion and emotion not in CHINESE_EMOTION_NAMES:
-                    dialogue["emotion"] = "中性"  # 默认情感
+                self._prepare_dialogue(dialogue)
                     
             return data
             
@@ -142,6 +327,129 @@ class DialogueAnalyzer:
             print(f"JSON解析失败: {e}")
             raise
     
+    @staticmethod
+    def _prepare_speaker(speaker: Dict[str, Any]) -> Dict[str, Any]:
+        """按性别和年龄段为说话人分配音色"""
+        gender = speaker.get("gender", "male")
+        age = speaker.get("age_group", "adult")
+        
+        # 使用辅助函数获取音色
+        speaker["voice_type"] = get_voice_type(gender, age)
+        return speaker
+    
+    @staticmethod
+    def _prepare_dialogue(dialogue: Dict[str, Any]) -> Dict[str, Any]:
+        """校验情感标签"""
+        emotion = dialogue.get("emotion")
+        if emotion and emotion not in CHINESE_EMOTION_NAMES:
+            dialogue["emotion"] = "中性"  # 默认情感
+        return dialogue
+    
+    # ---- 流式分析 ----
+    
+    def analyze_dialogue_stream(self, text: str,
+                                cancel_event: Optional[threading.Event] = None
+                                ) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """
+        流式分析对话文本,每解析出一个说话人/一句对话就立即产出
+        
+        产出 ("speaker", 说话人)、("dialogue", 对话),最后产出 ("done", 完整结果)。
+        剧本格式、缓存命中或需要分段分析的长文本会在得到完整结果后依次产出;
+        流式请求在产出任何内容前失败时退回默认结构。
+        :param text: 原始对话文本
+        :param cancel_event: 取消事件,置位后关闭LLM流并停止产出(不缓存不完整的结果)
+        """
+        cache_key = self._cache_key(text)
+        result = self.parse_script(text) or self._cache_get(cache_key)
+        if result is None and len(self._split_chunks(text)) > 1:
+            result = self.analyze_dialogue(text)
+        if result is not None:
+            yield from self._replay(result)
+            return
+        
+        result = {"speakers": [], "dialogues": []}
+        try:
+            parser = JsonArrayStreamParser(("speakers", "dialogues"))
+            for delta in self._stream_llm(self._build_prompt(text), cancel_event):
+                for key, item in parser.feed(delta):
+                    if not isinstance(item, dict):
+                        continue
+                    if key == "speakers":
+                        result["speakers"].append(self._prepare_speaker(item))
+                        yield "speaker", item
+                    elif item.get("text"):
+                        result["dialogues"].append(self._prepare_dialogue(item))
+                        yield "dialogue", item
+        except Exception as e:
+            if cancel_event is not None and cancel_event.is_set():
+                return
+            print(f"流式AI分析失败: {e}")
+            if result["speakers"] or result["dialogues"]:
+                # 已经产出的内容无法撤回,以已解析的部分作为结果
+                yield "done", result
+                return
+            yield from self._replay(self._get_default_structure(text))
+            return
+        
+        if cancel_event is not None and cancel_event.is_set():
+            return
+        if not result["dialogues"]:
+            yield from self._replay(self._get_default_structure(text))
+            return
+        
+        self._cache_put(cache_key, result)
+        yield "done", copy.deepcopy(result)
+    
+    @staticmethod
+    def _replay(result: Dict[str, Any]) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """把完整结果按流式事件依次产出"""
+        for speaker in result.get("speakers", []):
+            yield "speaker", speaker
+        for dialogue in result.get("dialogues", []):
+            yield "dialogue", dialogue
+        yield "done", result
+    
+    def _stream_llm(self, prompt: str, cancel_event: Optional[threading.Event] = None) -> Iterator[str]:
+        """以流式(SSE)调用LLM API,逐段产出返回的文本;cancel_event置位后关闭连接"""
+        headers = {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {self.api_key}"
+        }
+        
+        data = {
+            "model": self.model,
+            "messages": [
+                {"role": "system", "content": "你是一个专业的对话分析助手,只返回JSON格式的结果。"},
+                {"role": "user", "content": prompt}
+            ],
+            "temperature": 0.3,
+            "response_format": {"type": "json_object"},
+            "stream": True
+        }
+        
+        with requests.post(
+            f"{self.api_base}/v1/chat/completions",
+            headers=headers,
+            json=data,
+            timeout=30,
+            stream=True
+        ) as response:
+            response.raise_for_status()
+            
+            for line in response.iter_lines(decode_unicode=True):
+                if cancel_event is not None and cancel_event.is_set():
+                    return
+                if not line or not line.startswith("data:"):
+                    continue
+                payload = line[5:].strip()
+                if payload == "[DONE]":
+                    break
+                chunk = json.loads(payload)
+                choices = chunk.get("choices") or []
+                delta = choices[0].get("delta", {}).get("content") if choices else None
+                if delta:
+                    yield delta
+    
     def _get_default_structure(self, text: str) -> Dict[str, Any]:
         """当AI分析失败时,返回默认结构"""
         lines = [line.strip() for line in text.split('\n') if line.strip()]
@@ -175,6 +483,81 @@ class DialogueAnalyzer:
         }
 
 
+class JsonArrayStreamParser:
+    """
+    增量JSON解析器
+    逐段输入JSON文本,每当指定键下数组中的一个元素(对象)完整出现时立即返回该元素,
+    不需要等待整个JSON结束
+    """
+    
+    def __init__(self, keys: Tuple[str, ...]):
+        """
+        :param keys: 需要逐个提取元素的数组键名(如 "speakers", "dialogues")
+        """
+        self.keys = set(keys)
+        self._buffer = ""
+        self._pos = 0
+        # 容器栈: (类型, 数组键名, 元素起始位置)
+        self._stack: List[List[Any]] = []
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._last_string: Optional[str] = None
+        self._pending_key: Optional[str] = None
+    
+    def feed(self, data: str) -> List[Tuple[str, Any]]:
+        """
+        输入一段文本
+        :return: 本次新解析出的 (键名, 元素) 列表
+        """
+        self._buffer += data
+        items = []
+        buffer = self._buffer
+        
+        for i in range(self._pos, len(buffer)):
+            ch = buffer[i]
+            
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    try:
+                        self._last_string = json.loads(buffer[self._string_start:i + 1])
+                    except ValueError:
+                        self._last_string = None
+                continue
+            
+            if ch == '"':
+                self._in_string = True
+                self._string_start = i
+            elif ch == ":":
+                self._pending_key = self._last_string
+            elif ch in "{[":
+                parent = self._stack[-1] if self._stack else None
+                key = self._pending_key if ch == "[" else None
+                # 目标数组的直接子元素,记录起始位置
+                start = i if parent and parent[0] == "[" and parent[1] in self.keys else None
+                self._stack.append([ch, key, start])
+                self._pending_key = None
+            elif ch in "}]":
+                if not self._stack:
+                    continue
+                _, _, start = self._stack.pop()
+                if start is not None:
+                    try:
+                        items.append((self._stack[-1][1], json.loads(buffer[start:i + 1])))
+                    except ValueError:
+                        pass
+            elif ch == ",":
+                self._pending_key = None
+        
+        self._pos = len(buffer)
+        return items
+
+
 if __name__ == "__main__":
     # 测试
     analyzer = DialogueAnalyzer()
@@ -1,56 +1,140 @@
 """
 对话编辑器Web服务 - FastAPI后端
 """
+import asyncio
+import gzip
+import hashlib
 import json
+import os
+import threading
 import uuid
 from datetime import datetime
 from pathlib import Path
-from typing import Optional
+from typing import Dict, List, Optional
 from contextlib import asynccontextmanager
 
-from fastapi import FastAPI, HTTPException, Body
+from fastapi import FastAPI, HTTPException, Body, Header, Query, WebSocket, WebSocketDisconnect
+from fastapi.concurrency import run_in_threadpool
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse, JSONResponse
-from pydantic import BaseModel
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
+from pydantic import BaseModel, ValidationError
 
 from project_schema import DialogueProject, Speaker, DialogueLine, CHINESE_EMOTIONS, ENGLISH_EMOTIONS, VOICE_TYPES
 from ai_analyzer import DialogueAnalyzer
-from tts_generator import TTSGenerator
+from tts_generator import DEFAULT_MAX_CONCURRENCY, RENDER_PARAMS, TTSGenerator
+from tts_scheduler import BULK, INTERACTIVE, TTSScheduler
+from prefetcher import MAX_LOOKAHEAD, Prefetcher
+from job_queue import GenerationJob, JobConflictError, JobManager
+from project_store import ProjectStore, decode_cursor, encode_cursor
+from project_cache import ProjectCache
+from audio_store import AudioStore
+from bounded_executor import BoundedExecutor, CallTimeoutError, ExecutorBusyError
 from tts_config import (
     VOICE_TYPE_DETAILS, 
     VOICE_TYPES_BY_CATEGORY, 
     TTS_PARAM_RANGES,
-    get_all_voice_categories
+    catalog_version,
+    get_all_voice_categories,
+    get_voice_type,
+    search_voices
 )
+from waveform_peaks import load_peaks
+from timeline import SUBTITLE_LEVELS, load_timeline
 
 
-# 项目存储目录
+# 项目存储目录(旧版JSON工程文件也在此目录,启动时自动导入数据库)
 PROJECTS_DIR = Path("projects")
 PROJECTS_DIR.mkdir(exist_ok=True)
 
+# 工程数据库
+store = ProjectStore(os.getenv("PROJECT_DB_PATH", str(PROJECTS_DIR / "projects.db")))
+
+# 音频输出目录(通过 /audio 提供访问)
+OUTPUT_DIR = Path("dialogue_output")
+
+# 对话音频按内容哈希存储,各工程共用
+audio_store = AudioStore(OUTPUT_DIR / "objects")
+
+# 工程列表分页大小
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+# 实时预览的防抖时间(秒): 最后一次编辑后等待这么久才开始合成
+PREVIEW_DEBOUNCE_SECONDS = float(os.getenv("PREVIEW_DEBOUNCE_MS", "300")) / 1000
+
+# 工程写回缓存(编辑只改内存,防抖后批量写入数据库)
+project_cache = ProjectCache(store, debounce=float(os.getenv("PROJECT_FLUSH_DEBOUNCE", "0.5")))
+
+# 所有上游TTS调用共用的调度器: 单句生成和预览优先,整工程生成按工程公平排队
+tts_scheduler = TTSScheduler(
+    max_concurrency=DEFAULT_MAX_CONCURRENCY,
+    interactive_reserved=int(os.getenv("TTS_INTERACTIVE_RESERVED", "1"))
+)
+
 # 全局实例
 analyzer = None
 tts_generator = None
+prefetcher = None
+job_manager = JobManager()
+
+# 阻塞调用(LLM分析、TTS合成)在独立的有界线程池中执行,按接口限制并发和超时
+blocking = BoundedExecutor()
+blocking.add_lane("analyze", int(os.getenv("ANALYZE_MAX_CONCURRENCY", "4")),
+                  timeout=float(os.getenv("ANALYZE_TIMEOUT", "120")))
+blocking.add_lane("generate", int(os.getenv("GENERATE_MAX_CONCURRENCY", "2")),
+                  timeout=float(os.getenv("GENERATE_TIMEOUT", "1800")))
+blocking.add_lane("generate_line", int(os.getenv("GENERATE_LINE_MAX_CONCURRENCY", "4")),
+                  timeout=float(os.getenv("GENERATE_LINE_TIMEOUT", "90")))
+
+
+async def run_blocking(lane: str, fn, *args, **kwargs):
+    """在有界执行器中运行阻塞调用,繁忙返回503,超时返回504"""
+    try:
+        return await blocking.run(lane, fn, *args, **kwargs)
+    except ExecutorBusyError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+    except CallTimeoutError as e:
+        raise HTTPException(status_code=504, detail=str(e))
 
 
 # 生命周期管理
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # 启动时初始化
-    global analyzer, tts_generator
+    global analyzer, tts_generator, prefetcher
+    imported = store.import_json_dir(PROJECTS_DIR)
+    if imported:
+        print(f"📦 已导入 {imported} 个JSON工程文件")
+    
     try:
         analyzer = DialogueAnalyzer()
-        tts_generator = TTSGenerator()
+        tts_generator = TTSGenerator(output_dir=str(OUTPUT_DIR), audio_store=audio_store,
+                                     scheduler=tts_scheduler)
+        prefetcher = Prefetcher(tts_generator, tts_scheduler, on_rendered=save_prefetched_line)
         print("✅ 服务初始化成功")
     except Exception as e:
         print(f"⚠️ 初始化警告: {e}")
     
     yield
     
-    # 关闭时清理（如果需要）
+    # 关闭时等待正在执行的生成任务结束(阻塞等待放到线程中,不卡住事件循环)
+    await asyncio.get_running_loop().run_in_executor(None, shutdown_services)
     print("👋 服务关闭")
 
 
+def shutdown_services():
+    """取消排队中的任务,等待执行中的生成结束后依次释放资源"""
+    job_manager.shutdown()
+    if prefetcher:
+        prefetcher.cancel_all()
+    blocking.shutdown()
+    tts_scheduler.shutdown()
+    if tts_generator:
+        tts_generator.close()
+    project_cache.close()
+    store.close()
+
+
 # 初始化FastAPI应用
 app = FastAPI(title="对话TTS编辑器", version="1.0.0", lifespan=lifespan)
 
@@ -60,6 +144,11 @@ class AnalyzeRequest(BaseModel):
     text: str
 
 
+class AnalyzeStreamRequest(BaseModel):
+    text: str
+    synthesize: bool = False
+
+
 class GenerateLineRequest(BaseModel):
     project_id: str
     line_id: str
@@ -71,6 +160,25 @@ class UpdateLineRequest(BaseModel):
     updates: dict
 
 
+class BulkUpdateLinesRequest(BaseModel):
+    # 对话行ID -> 该行要修改的字段
+    lines: Dict[str, dict] = {}
+    # 对 line_ids 中的每一行应用同一组修改
+    line_ids: List[str] = []
+    updates: dict = {}
+
+
+class BulkGenerateLinesRequest(BaseModel):
+    line_ids: List[str]
+    # 是否重新合成(false时参数相同的已有音频直接复用)
+    force: bool = True
+
+
+class PrefetchRequest(BaseModel):
+    line_id: str
+    count: Optional[int] = None
+
+
 # API路由
 
 @app.get("/")
@@ -79,20 +187,96 @@ async def root():
     return FileResponse("static/index.html")
 
 
+# 预先序列化并压缩的配置响应,音色列表变化(版本号变化)时重新生成
+_config_response: dict = {}
+
+
+def config_response() -> dict:
+    """返回配置响应的JSON、gzip压缩结果和ETag"""
+    version = catalog_version()
+    if _config_response.get("version") != version:
+        body = json.dumps({
+            "emotions": {
+                "chinese": CHINESE_EMOTIONS,
+                "english": ENGLISH_EMOTIONS
+            },
+            "voice_types": VOICE_TYPES,
+            "voice_details": VOICE_TYPE_DETAILS,
+            "voice_categories": get_all_voice_categories(),
+            "voices_by_category": VOICE_TYPES_BY_CATEGORY,
+            "tts_params": TTS_PARAM_RANGES
+        }, ensure_ascii=False).encode("utf-8")
+        _config_response.update({
+            "version": version,
+            "body": body,
+            "gzip": gzip.compress(body, compresslevel=9),
+            "etag": '"' + hashlib.sha1(body).hexdigest()[:20] + '"',
+        })
+    return _config_response
+
+
 @app.get("/api/config")
-async def get_config():
-    """获取配置信息(情感列表、音色列表等)"""
-    return {
-        "emotions": {
-            "chinese": CHINESE_EMOTIONS,
-            "english": ENGLISH_EMOTIONS
-        },
-        "voice_types": VOICE_TYPES,
-        "voice_details": VOICE_TYPE_DETAILS,
-        "voice_categories": get_all_voice_categories(),
-        "voices_by_category": VOICE_TYPES_BY_CATEGORY,
-        "tts_params": TTS_PARAM_RANGES
-    }
+async def get_config(
+    if_none_match: Optional[str] = Header(default=None),
+    accept_encoding: Optional[str] = Header(default=None)
+):
+    """获取配置信息(情感列表、音色列表等),内容未变化时返回304"""
+    config = config_response()
+    headers = {"ETag": config["etag"], "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+    if if_none_match and config["etag"] in [tag.strip() for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+    
+    if accept_encoding and "gzip" in accept_encoding:
+        return Response(config["gzip"], media_type="application/json",
+                        headers={**headers, "Content-Encoding": "gzip"})
+    return Response(config["body"], media_type="application/json", headers=headers)
+
+
+@app.get("/api/voices")
+async def find_voices(keyword: str = "", gender: str = "", category: str = "", language: str = ""):
+    """按关键词、性别、分类和语言搜索音色"""
+    voice_ids = search_voices(keyword=keyword, gender=gender, category=category, language=language)
+    return {"voices": [{"id": voice_id, **VOICE_TYPE_DETAILS[voice_id]} for voice_id in voice_ids]}
+
+
+def build_speaker(s: dict) -> Speaker:
+    """由分析结果构建说话人"""
+    return Speaker(
+        id=s["id"],
+        name=s.get("name", "未命名"),
+        gender=s["gender"],
+        age_group=s.get("age_group", "adult"),
+        voice_type=s["voice_type"]
+    )
+
+
+def build_line(index: int, d: dict) -> DialogueLine:
+    """由分析结果构建对话行"""
+    return DialogueLine(
+        id=f"line_{index}",
+        speaker_id=d["speaker_id"],
+        text=d["text"],
+        emotion=d.get("emotion"),
+        context=d.get("context")
+    )
+
+
+def build_project(text: str, result: dict) -> DialogueProject:
+    """由分析结果构建工程对象"""
+    now = datetime.now().isoformat()
+    return DialogueProject(
+        title=f"对话_{datetime.now().strftime('%Y%m%d_%H%M%S')}",
+        original_text=text,
+        speakers=[build_speaker(s) for s in result.get("speakers", [])],
+        dialogues=[build_line(i, d) for i, d in enumerate(result.get("dialogues", []))],
+        created_at=now,
+        updated_at=now
+    )
+
+
+def sse_event(event: str, data: dict) -> str:
+    """格式化一条Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
 
 
 @app.post("/api/analyze")
@@ -102,211 +286,654 @@ async def analyze_text(request: AnalyzeRequest):
         raise HTTPException(status_code=400, detail="文本不能为空")
     
     try:
-        # 使用AI分析
-        if analyzer:
-            result = analyzer.analyze_dialogue(request.text)
-        else:
-            # 如果AI不可用,使用默认分析
-            result = analyzer._get_default_structure(request.text) if analyzer else {}
+        # 剧本格式直接规则解析(毫秒级,不占用分析通道)
+        result = analyzer.parse_script(request.text) if analyzer else None
+        if result is None:
+            if analyzer:
+                # 使用AI分析(LLM请求在线程池中执行,不阻塞事件循环)
+                result = await run_blocking("analyze", analyzer.analyze_dialogue, request.text)
+            else:
+                # 如果AI不可用,使用默认分析
+                result = analyzer._get_default_structure(request.text) if analyzer else {}
         
         # 创建工程对象
         project_id = str(uuid.uuid4())
-        now = datetime.now().isoformat()
-        
-        speakers = [
-            Speaker(
-                id=s["id"],
-                name=s.get("name", "未命名"),
-                gender=s["gender"],
-                age_group=s.get("age_group", "adult"),
-                voice_type=s["voice_type"]
-            )
-            for s in result.get("speakers", [])
-        ]
-        
-        dialogues = [
-            DialogueLine(
-                id=f"line_{i}",
-                speaker_id=d["speaker_id"],
-                text=d["text"],
-                emotion=d.get("emotion"),
-                context=d.get("context")
-            )
-            for i, d in enumerate(result.get("dialogues", []))
-        ]
-        
-        project = DialogueProject(
-            title=f"对话_{datetime.now().strftime('%Y%m%d_%H%M%S')}",
-            original_text=request.text,
-            speakers=speakers,
-            dialogues=dialogues,
-            created_at=now,
-            updated_at=now
-        )
+        project = build_project(request.text, result)
         
-        # 保存工程文件
-        project_file = PROJECTS_DIR / f"{project_id}.json"
-        with open(project_file, "w", encoding="utf-8") as f:
-            json.dump(project.model_dump(), f, ensure_ascii=False, indent=2)
+        # 保存工程
+        project_cache.save(project_id, project)
         
         return {
             "project_id": project_id,
             "project": project.model_dump()
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"分析失败: {str(e)}")
 
 
+@app.post("/api/analyze/stream")
+async def analyze_text_stream(request: AnalyzeStreamRequest):
+    """
+    流式分析对话文本(Server-Sent Events)
+    每解析出一个说话人/一句对话立即推送;synthesize为真时每句对话解析完成后立即开始合成,
+    合成完成推送audio事件。全部完成后保存工程并推送done事件
+    """
+    if not request.text.strip():
+        raise HTTPException(status_code=400, detail="文本不能为空")
+    if not analyzer:
+        raise HTTPException(status_code=503, detail="AI分析服务未初始化")
+    synthesize = request.synthesize and tts_generator is not None
+    
+    loop = asyncio.get_running_loop()
+    events: asyncio.Queue = asyncio.Queue()
+    # 客户端断开时置位,停止接收LLM流
+    cancel_event = threading.Event()
+    
+    def produce():
+        # 在分析通道的线程中消费LLM流,事件转交给事件循环
+        try:
+            for item in analyzer.analyze_dialogue_stream(request.text, cancel_event=cancel_event):
+                if cancel_event.is_set():
+                    break
+                loop.call_soon_threadsafe(events.put_nowait, item)
+        except Exception as e:
+            loop.call_soon_threadsafe(events.put_nowait, ("error", {"error": str(e)}))
+        finally:
+            loop.call_soon_threadsafe(events.put_nowait, None)
+    
+    async def stream():
+        project_id = str(uuid.uuid4())
+        speakers: dict = {}
+        lines: List[DialogueLine] = []
+        result = None
+        synth_tasks = []
+        
+        async def synthesize_line(index: int, line: DialogueLine, voice_type: str) -> str:
+            # 以批量优先级提交,取消任务时尚未开始的合成随之取消
+            audio_file = await asyncio.wrap_future(tts_scheduler.submit(
+                tts_generator.generate_line, line, voice_type, index, priority=BULK, tenant=project_id
+            ))
+            if audio_file:
+                line.audio_file = audio_file
+                return sse_event("audio", {"index": index, "line_id": line.id,
+                                           "audio_url": audio_url(audio_file), "duration": line.duration})
+            return sse_event("audio_failed", {"index": index, "line_id": line.id})
+        
+        producer = asyncio.ensure_future(run_blocking("analyze", produce))
+        getter = None
+        try:
+            yield sse_event("project", {"project_id": project_id})
+            while True:
+                # 等待下一个分析事件,同时转发已完成的合成结果;
+                # 分析通道繁忙或超时时produce不会执行,不会有结束标记,需要同时等待producer
+                getter = asyncio.ensure_future(events.get())
+                pending = {getter, *synth_tasks}
+                if not producer.done():
+                    pending.add(producer)
+                while True:
+                    done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    if producer in done:
+                        pending.discard(producer)
+                        # 正常结束时结束标记已在队列中;失败时直接抛出(HTTPException转为error事件)
+                        producer.result()
+                    for task in done - {getter, producer}:
+                        synth_tasks.remove(task)
+                        pending.discard(task)
+                        yield task.result()
+                    if getter in done:
+                        break
+                item = getter.result()
+                if item is None:
+                    break
+                
+                kind, data = item
+                if kind == "speaker":
+                    speaker = build_speaker(data)
+                    speakers[speaker.id] = speaker
+                    yield sse_event("speaker", speaker.model_dump())
+                elif kind == "dialogue":
+                    index = len(lines)
+                    line = build_line(index, data)
+                    lines.append(line)
+                    yield sse_event("line", {"index": index, **line.model_dump()})
+                    if synthesize:
+                        speaker = speakers.get(line.speaker_id)
+                        voice_type = speaker.voice_type if speaker else get_voice_type("male", "adult")
+                        synth_tasks.append(asyncio.ensure_future(synthesize_line(index, line, voice_type)))
+                elif kind == "done":
+                    result = data
+                elif kind == "error":
+                    yield sse_event("error", data)
+            
+            await producer
+            for task in asyncio.as_completed(synth_tasks):
+                yield await task
+            
+            if result is None:
+                return
+            
+            # 保存工程(合成线程已把音频写入各对话行)
+            project = build_project(request.text, {})
+            project.speakers = list(speakers.values())
+            project.dialogues = lines
+            project_cache.save(project_id, project)
+            yield sse_event("done", {"project_id": project_id, "project": project.model_dump()})
+        except HTTPException as e:
+            yield sse_event("error", {"error": e.detail})
+        finally:
+            # 客户端断开或出错: 停止LLM流和尚未开始的合成
+            cancel_event.set()
+            producer.cancel()
+            if getter:
+                getter.cancel()
+            for task in synth_tasks:
+                task.cancel()
+    
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 @app.get("/api/projects/{project_id}")
 async def get_project(project_id: str):
     """获取工程详情"""
-    project_file = PROJECTS_DIR / f"{project_id}.json"
+    project_data = project_cache.get_data(project_id)
     
-    if not project_file.exists():
+    if project_data is None:
         raise HTTPException(status_code=404, detail="工程不存在")
     
-    with open(project_file, "r", encoding="utf-8") as f:
-        project_data = json.load(f)
-    
     return project_data
 
 
+@app.get("/api/projects/{project_id}/export")
+async def export_project(project_id: str):
+    """导出JSON工程文件"""
+    project_data = project_cache.get_data(project_id)
+    
+    if project_data is None:
+        raise HTTPException(status_code=404, detail="工程不存在")
+    
+    return JSONResponse(
+        project_data,
+        headers={"Content-Disposition": f'attachment; filename="{project_id}.json"'}
+    )
+
+
+@app.post("/api/projects/import")
+async def import_project(project_data: dict = Body(...)):
+    """导入JSON工程文件,返回新的工程ID"""
+    try:
+        project = DialogueProject(**project_data)
+    except ValidationError as e:
+        raise HTTPException(status_code=400, detail=f"工程文件格式错误: {e}")
+    
+    project_id = str(uuid.uuid4())
+    project_cache.save(project_id, project)
+    return {"project_id": project_id, "project": project.model_dump()}
+
+
 @app.put("/api/projects/{project_id}/line/{line_id}")
 async def update_line(project_id: str, line_id: str, updates: dict = Body(...)):
     """更新单句对话参数"""
-    project_file = PROJECTS_DIR / f"{project_id}.json"
-    
-    if not project_file.exists():
+    if not project_cache.exists(project_id):
         raise HTTPException(status_code=404, detail="工程不存在")
     
-    # 读取工程
-    with open(project_file, "r", encoding="utf-8") as f:
-        project_data = json.load(f)
-    
-    # 查找并更新对话行
-    found = False
-    for dialogue in project_data["dialogues"]:
-        if dialogue["id"] == line_id:
-            dialogue.update(updates)
-            found = True
-            break
+    # 按主键直接更新该行(同时刷新工程更新时间)
+    try:
+        line = project_cache.update_line(project_id, line_id, updates)
+    except ValidationError as e:
+        raise HTTPException(status_code=400, detail=f"参数无效: {e}")
     
-    if not found:
+    if line is None:
         raise HTTPException(status_code=404, detail="对话行不存在")
     
-    # 更新时间戳
-    project_data["updated_at"] = datetime.now().isoformat()
+    return {"success": True, "message": "更新成功"}
+
+
+@app.patch("/api/projects/{project_id}/lines")
+async def update_lines(project_id: str, request: BulkUpdateLinesRequest):
+    """
+    批量更新对话参数
+    全部校验通过后一次性生效(任何一行不存在或参数无效时都不修改),稍后在一个事务中写入数据库
+    """
+    if not project_cache.exists(project_id):
+        raise HTTPException(status_code=404, detail="工程不存在")
+    
+    patches: Dict[str, dict] = {line_id: dict(request.updates) for line_id in request.line_ids}
+    for line_id, fields in request.lines.items():
+        patches.setdefault(line_id, {}).update(fields)
+    patches = {line_id: fields for line_id, fields in patches.items() if fields}
+    if not patches:
+        raise HTTPException(status_code=400, detail="没有要更新的内容")
     
-    # 保存
-    with open(project_file, "w", encoding="utf-8") as f:
-        json.dump(project_data, f, ensure_ascii=False, indent=2)
+    project = project_cache.get(project_id)
+    existing = {dialogue.id for dialogue in project.dialogues} if project else set()
+    missing = [line_id for line_id in patches if line_id not in existing]
+    if missing:
+        raise HTTPException(status_code=404, detail=f"对话行不存在: {', '.join(missing)}")
     
-    return {"success": True, "message": "更新成功"}
+    try:
+        updated = project_cache.update_lines(project_id, patches)
+    except ValidationError as e:
+        raise HTTPException(status_code=400, detail=f"参数无效: {e}")
+    
+    return {"success": True, "updated": len(updated), "message": "更新成功"}
 
 
 @app.put("/api/projects/{project_id}/speaker/{speaker_id}")
 async def update_speaker(project_id: str, speaker_id: str, updates: dict = Body(...)):
     """更新说话人信息"""
-    project_file = PROJECTS_DIR / f"{project_id}.json"
-    
-    if not project_file.exists():
+    if not project_cache.exists(project_id):
         raise HTTPException(status_code=404, detail="工程不存在")
     
-    # 读取工程
-    with open(project_file, "r", encoding="utf-8") as f:
-        project_data = json.load(f)
-    
-    # 查找并更新说话人
-    found = False
-    for speaker in project_data["speakers"]:
-        if speaker["id"] == speaker_id:
-            # 验证音色ID是否有效
-            if "voice_type" in updates:
-                from tts_config import VOICE_TYPE_DETAILS
-                if updates["voice_type"] not in VOICE_TYPE_DETAILS:
-                    raise HTTPException(status_code=400, detail="无效的音色ID")
-            
-            speaker.update(updates)
-            found = True
-            break
+    # 验证音色ID是否有效
+    if "voice_type" in updates and updates["voice_type"] not in VOICE_TYPE_DETAILS:
+        raise HTTPException(status_code=400, detail="无效的音色ID")
+    
+    try:
+        speaker = project_cache.update_speaker(project_id, speaker_id, updates)
+    except ValidationError as e:
+        raise HTTPException(status_code=400, detail=f"参数无效: {e}")
     
-    if not found:
+    if speaker is None:
         raise HTTPException(status_code=404, detail="说话人不存在")
     
-    # 更新时间戳
-    project_data["updated_at"] = datetime.now().isoformat()
+    return {"success": True, "message": "更新成功"}
+
+
+def audio_url(audio_file: str) -> str:
+    """音频文件路径转换为 /audio 下的访问地址"""
+    path = Path(audio_file)
+    try:
+        return "/audio/" + path.resolve().relative_to(OUTPUT_DIR.resolve()).as_posix()
+    except ValueError:
+        return f"/audio/{path.name}"
+
+
+def save_render_results(project_id: str, dialogues: List[DialogueLine]):
+    """
+    只保存各句的音频文件、哈希和时长,不覆盖生成期间对其他字段的修改
+    :param project_id: 工程ID
+    :param dialogues: 生成后的对话列表
+    """
+    project_cache.update_lines(project_id, {
+        dialogue.id: {
+            "audio_file": dialogue.audio_file,
+            "content_hash": dialogue.content_hash,
+            "duration": dialogue.duration,
+        }
+        for dialogue in dialogues
+        if dialogue.audio_file
+    })
+
+
+def save_prefetched_line(project_id: str, line: DialogueLine):
+    """
+    保存预取结果;预取期间对话或说话人音色可能又被修改,只有合成参数仍一致时才写回
+    :param project_id: 工程ID
+    :param line: 预取合成后的对话行
+    """
+    project = project_cache.get(project_id)
+    current = next((d for d in project.dialogues if d.id == line.id), None) if project else None
+    if current is None:
+        return
+    speaker = next((sp for sp in project.speakers if sp.id == current.speaker_id), None)
+    voice_type = speaker.voice_type if speaker else "zh_male_wennuanahu_moon_bigtts"
+    if line.rendered_from(current.render_hash(voice_type, **RENDER_PARAMS)):
+        save_render_results(project_id, [line])
+
+
+def refresh_mix(project_id: str) -> bool:
+    """
+    重新生成部分对话后增量更新已有成品(只替换变化的区域,不重新合并全部对话)
+    :param project_id: 工程ID
+    :return: 成品是否已与各句音频一致;没有成品或无法增量更新时返回False,留待下次完整生成
+    """
+    project = project_cache.get(project_id)
+    if project is None or not tts_generator or not project.output_audio:
+        return False
+    return tts_generator.update_mix(project, project.output_audio) is not None
+
+
+def render_project(project_id: str, force: bool = False, job: Optional[GenerationJob] = None) -> dict:
+    """
+    生成工程音频并合并(同步执行,在线程池或任务队列中调用)
+    :param project_id: 工程ID
+    :param force: 是否强制重新生成全部对话
+    :param job: 后台任务,用于报告进度
+    :return: 结果字典
+    """
+    project = project_cache.checkout(project_id)
     
-    # 保存
-    with open(project_file, "w", encoding="utf-8") as f:
-        json.dump(project_data, f, ensure_ascii=False, indent=2)
+    if project is None:
+        raise HTTPException(status_code=404, detail="工程不存在")
     
-    return {"success": True, "message": "更新成功"}
+    # 生成音频
+    if not tts_generator:
+        raise HTTPException(status_code=503, detail="TTS服务未初始化")
+    
+    output_file = str(OUTPUT_DIR / f"{project_id}_final.wav")
+    stale = tts_generator.stale_lines(project)
+    
+    if job:
+        job.start(len(project.dialogues))
+    
+    # 没有任何改动且成品仍在,直接返回
+    if not force and not stale and project.output_audio and Path(project.output_audio).exists():
+        return {
+            "success": True,
+            "audio_url": f"/audio/{project_id}_final.wav",
+            "rendered": 0,
+            "message": "没有改动,无需重新生成"
+        }
+    
+    synthesized = 0
+    counter_lock = threading.Lock()
+    
+    def progress(done: int, total: int, index: int, audio_file: Optional[str], rendered: bool):
+        nonlocal synthesized
+        if rendered:
+            with counter_lock:
+                synthesized += 1
+        if job:
+            job.progress(done, total, index, audio_file, rendered)
+    
+    audio_files = tts_generator.generate_project(
+        project,
+        progress_callback=progress,
+        force=force,
+        tenant=project_id
+    )
+    
+    # 无论合并是否成功,都保存各句的音频和哈希,下次只需补生成失败的部分
+    save_render_results(project_id, project.dialogues)
+    
+    if not audio_files:
+        raise HTTPException(status_code=500, detail="音频生成失败")
+    
+    # 合并音频(同时生成时间轴);已有成品时只替换重新生成的对话,无法增量更新再完整合并
+    if job:
+        job.stage("merge")
+    timeline = None
+    if not force and project.output_audio == output_file:
+        timeline = tts_generator.update_mix(project, output_file)
+    if timeline is None:
+        timeline = tts_generator.merge_project(project, output_file)
+    
+    if timeline is None:
+        raise HTTPException(status_code=500, detail="音频合并失败")
+    
+    # 更新工程
+    project_cache.update_project(project_id, output_audio=output_file)
+    
+    return {
+        "success": True,
+        "audio_url": f"/audio/{project_id}_final.wav",
+        "rendered": synthesized,
+        "message": "生成成功"
+    }
 
 
 @app.post("/api/projects/{project_id}/generate")
-async def generate_project(project_id: str):
-    """生成整个工程的音频"""
-    project_file = PROJECTS_DIR / f"{project_id}.json"
+async def generate_project(project_id: str, force: bool = False):
+    """生成整个工程的音频(只重新合成参数有改动的对话)"""
+    if not project_cache.exists(project_id):
+        raise HTTPException(status_code=404, detail="工程不存在")
     
-    if not project_file.exists():
+    # 与后台任务、流式播放共用任务队列去重: 工程正在生成时等待该次生成的结果
+    try:
+        job, _ = job_manager.submit(project_id, lambda job: render_project(project_id, force, job), force)
+    except JobConflictError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    await job_manager.wait(job)
+    if job.status == "failed":
+        raise HTTPException(status_code=job.status_code, detail=job.error)
+    return job.result
+
+
+@app.post("/api/projects/{project_id}/jobs")
+async def submit_generation_job(project_id: str, force: bool = False):
+    """以后台任务方式生成工程音频,立即返回任务ID"""
+    if not project_cache.exists(project_id):
         raise HTTPException(status_code=404, detail="工程不存在")
     
     try:
-        # 读取工程
-        with open(project_file, "r", encoding="utf-8") as f:
-            project_data = json.load(f)
-        
-        project = DialogueProject(**project_data)
-        
-        # 生成音频
-        if not tts_generator:
-            raise HTTPException(status_code=503, detail="TTS服务未初始化")
-        
-        audio_files = tts_generator.generate_project(project)
-        
+        job, created = job_manager.submit(project_id, lambda job: render_project(project_id, force, job), force)
+    except JobConflictError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return {
+        "job_id": job.id,
+        "status": job.status,
+        "deduplicated": not created,
+        "status_url": f"/api/jobs/{job.id}",
+        "events_url": f"/api/jobs/{job.id}/events"
+    }
+
+
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str):
+    """查询任务状态"""
+    job = job_manager.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    return job.snapshot()
+
+
+@app.get("/api/jobs/{job_id}/events")
+async def stream_job_events(job_id: str, last_event_id: Optional[str] = Header(default=None)):
+    """以Server-Sent Events推送任务进度(支持Last-Event-ID断线续传)"""
+    job = job_manager.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    
+    try:
+        cursor = int(last_event_id) if last_event_id is not None else -1
+    except ValueError:
+        cursor = -1
+    
+    return StreamingResponse(
+        job_manager.stream_events(job, cursor),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@app.get("/api/projects/{project_id}/stream")
+async def stream_project_audio(project_id: str, force: bool = False, gap_ms: Optional[int] = None):
+    """边生成边播放整个工程(WAV分块流,每句就绪后立即输出)"""
+    project = project_cache.checkout(project_id)
+    
+    if project is None:
+        raise HTTPException(status_code=404, detail="工程不存在")
+    
+    if not tts_generator:
+        raise HTTPException(status_code=503, detail="TTS服务未初始化")
+    
+    # 登记为任务,避免与后台任务或同步生成同时合成同一工程
+    try:
+        job, created = job_manager.register(project_id, force)
+    except JobConflictError as e:
+        job, created = e.job, False
+    if not created:
+        raise HTTPException(status_code=409, detail=f"工程正在生成中,可通过 /api/jobs/{job.id}/events 查看进度")
+    job.start(len(project.dialogues))
+    
+    def save_project(audio_files):
+        # 保存各句的音频和哈希,之后合并成品时可直接复用
+        try:
+            save_render_results(project_id, project.dialogues)
+        except Exception as e:
+            job.fail(f"保存生成结果失败: {e}")
+            return
         if not audio_files:
-            raise HTTPException(status_code=500, detail="音频生成失败")
-        
-        # 合并音频
-        output_file = f"dialogue_output/{project_id}_final.wav"
-        success = tts_generator.merge_audio_files(audio_files, output_file)
-        
-        if success:
-            # 更新工程文件
-            project.output_audio = output_file
-            project.updated_at = datetime.now().isoformat()
-            
-            with open(project_file, "w", encoding="utf-8") as f:
-                json.dump(project.model_dump(), f, ensure_ascii=False, indent=2)
-            
-            return {
-                "success": True,
-                "audio_url": f"/audio/{project_id}_final.wav",
-                "message": "生成成功"
-            }
-        else:
-            raise HTTPException(status_code=500, detail="音频合并失败")
-            
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"生成失败: {str(e)}")
+            job.fail("音频生成失败")
+            return
+        job.succeed({"success": True, "streamed": len(audio_files), "rendered": job.synthesized})
+    
+    def fail_project(error: Exception):
+        # 已完成的对话照常保存,下次生成时直接复用
+        try:
+            save_render_results(project_id, project.dialogues)
+        finally:
+            job.fail(f"生成失败: {error}")
+    
+    kwargs = {"force": force, "on_complete": save_project, "on_error": fail_project,
+              "tenant": project_id, "progress_callback": job.progress}
+    if gap_ms is not None:
+        kwargs["gap_ms"] = max(0, gap_ms)
+    
+    return StreamingResponse(
+        tts_generator.stream_project(project, **kwargs),
+        media_type="audio/wav",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+async def peaks_response(audio_file: str, max_peaks: Optional[int], if_none_match: Optional[str]) -> Response:
+    """
+    返回音频的波形峰值(二进制 .peaks 格式,见 waveform_peaks.py),音频未变化时返回304
+    :param audio_file: 音频文件
+    :param max_peaks: 只返回峰值个数不超过该值的一级(通常为绘制宽度的像素数)
+    :param if_none_match: 请求的 If-None-Match 头
+    """
+    path = Path(audio_file)
+    if not path.exists():
+        raise HTTPException(status_code=404, detail="音频文件不存在")
+    
+    stat = path.stat()
+    etag = '"' + hashlib.sha1(
+        f"{path.resolve()}:{stat.st_mtime_ns}:{stat.st_size}:{max_peaks}".encode("utf-8")
+    ).hexdigest()[:20] + '"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if if_none_match and etag in [tag.strip() for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+    
+    try:
+        data = await run_in_threadpool(load_peaks, audio_file, max_peaks)
+    except (OSError, ValueError) as e:
+        raise HTTPException(status_code=500, detail=f"计算波形失败: {e}")
+    return Response(data, media_type="application/octet-stream", headers=headers)
+
+
+@app.get("/api/projects/{project_id}/peaks")
+async def get_project_peaks(
+    project_id: str,
+    max_peaks: Optional[int] = Query(default=None, ge=1),
+    if_none_match: Optional[str] = Header(default=None)
+):
+    """成品音频的波形峰值"""
+    project = project_cache.get(project_id)
+    
+    if project is None:
+        raise HTTPException(status_code=404, detail="工程不存在")
+    
+    if not project.output_audio:
+        raise HTTPException(status_code=404, detail="尚未生成音频")
+    
+    return await peaks_response(project.output_audio, max_peaks, if_none_match)
+
+
+@app.get("/api/projects/{project_id}/line/{line_id}/peaks")
+async def get_line_peaks(
+    project_id: str,
+    line_id: str,
+    max_peaks: Optional[int] = Query(default=None, ge=1),
+    if_none_match: Optional[str] = Header(default=None)
+):
+    """单句对话音频的波形峰值"""
+    project = project_cache.get(project_id)
+    
+    if project is None:
+        raise HTTPException(status_code=404, detail="工程不存在")
+    
+    dialogue = next((d for d in project.dialogues if d.id == line_id), None)
+    if dialogue is None:
+        raise HTTPException(status_code=404, detail="对话行不存在")
+    
+    if not dialogue.audio_file:
+        raise HTTPException(status_code=404, detail="尚未生成音频")
+    
+    return await peaks_response(dialogue.audio_file, max_peaks, if_none_match)
+
+
+def project_timeline(project_id: str):
+    """读取工程成品的时间轴索引,不存在时返回404"""
+    project = project_cache.get(project_id)
+    
+    if project is None:
+        raise HTTPException(status_code=404, detail="工程不存在")
+    
+    index = load_timeline(project.output_audio) if project.output_audio else None
+    if index is None:
+        raise HTTPException(status_code=404, detail="尚未生成音频,没有时间轴")
+    return index
+
+
+@app.get("/api/projects/{project_id}/timeline")
+async def get_timeline(project_id: str):
+    """成品音频的时间轴(每句的偏移以及句/词时间戳)"""
+    return project_timeline(project_id).timeline
+
+
+@app.get("/api/projects/{project_id}/timeline/seek")
+async def seek_timeline(project_id: str, t: Optional[float] = Query(default=None, ge=0),
+                        line_id: Optional[str] = None):
+    """
+    定位: 传 t(秒)返回该时刻的对话和词语,传 line_id 返回该对话在成品中的位置
+    """
+    index = project_timeline(project_id)
+    
+    if line_id is not None:
+        line = index.line(line_id)
+        if line is None:
+            raise HTTPException(status_code=404, detail="对话行不在成品中")
+        return {"line": line}
+    
+    if t is None:
+        raise HTTPException(status_code=400, detail="需要 t 或 line_id 参数")
+    return {"t": t, "line": index.line_at(t), "word": index.word_at(t)}
+
+
+@app.get("/api/projects/{project_id}/subtitles")
+async def export_subtitles(project_id: str, format: str = "srt", level: str = "sentence"):
+    """导出字幕: format 为 srt / vtt / json,level 为 sentence(按句)或 line(按对话)"""
+    if level not in SUBTITLE_LEVELS:
+        raise HTTPException(status_code=400, detail=f"level 只能是: {', '.join(SUBTITLE_LEVELS)}")
+    
+    index = project_timeline(project_id)
+    if format == "srt":
+        content, media_type = index.to_srt(level), "application/x-subrip"
+    elif format == "vtt":
+        content, media_type = index.to_vtt(level), "text/vtt"
+    elif format == "json":
+        content, media_type = json.dumps(index.timeline, ensure_ascii=False, indent=2), "application/json"
+    else:
+        raise HTTPException(status_code=400, detail="format 只能是: srt, vtt, json")
+    
+    return Response(
+        content.encode("utf-8"),
+        media_type=f"{media_type}; charset=utf-8",
+        headers={"Content-Disposition": f'attachment; filename="{project_id}.{format}"'}
+    )
 
 
 @app.post("/api/projects/{project_id}/generate-line/{line_id}")
-async def generate_single_line(project_id: str, line_id: str):
-    """重新生成单句对话"""
-    project_file = PROJECTS_DIR / f"{project_id}.json"
+async def generate_single_line(project_id: str, line_id: str, force: bool = True):
+    """
+    重新生成单句对话
+    默认总是重新合成(合成结果不确定,可以换一个效果);force=false 时参数相同的已有音频直接复用
+    """
+    project = project_cache.checkout(project_id)
     
-    if not project_file.exists():
+    if project is None:
         raise HTTPException(status_code=404, detail="工程不存在")
     
     try:
-        # 读取工程
-        with open(project_file, "r", encoding="utf-8") as f:
-            project_data = json.load(f)
-        
-        project = DialogueProject(**project_data)
-        
         # 查找对话行
         dialogue = None
         line_index = -1
@@ -333,53 +960,319 @@ async def generate_single_line(project_id: str, line_id: str):
         if not tts_generator:
             raise HTTPException(status_code=503, detail="TTS服务未初始化")
         
-        audio_file = tts_generator.generate_line(dialogue, voice_type, line_index)
+        # 单句生成以交互优先级排在整工程生成之前
+        audio_file = await run_blocking("generate_line", tts_scheduler.call, INTERACTIVE, project_id,
+                                        tts_generator.generate_line, dialogue, voice_type, line_index, force)
         
         if audio_file:
-            # 更新工程文件
+            # 只更新该行
             dialogue.audio_file = audio_file
-            project.updated_at = datetime.now().isoformat()
-            
-            with open(project_file, "w", encoding="utf-8") as f:
-                json.dump(project.model_dump(), f, ensure_ascii=False, indent=2)
+            save_render_results(project_id, [dialogue])
+            mix_updated = await run_blocking("generate_line", refresh_mix, project_id)
             
             return {
                 "success": True,
-                "audio_url": f"/audio/{Path(audio_file).name}",
+                "audio_url": audio_url(audio_file),
+                "mix_updated": mix_updated,
                 "message": "生成成功"
             }
         else:
             raise HTTPException(status_code=500, detail="音频生成失败")
             
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"生成失败: {str(e)}")
 
 
-@app.get("/api/projects")
-async def list_projects():
-    """列出所有工程"""
-    projects = []
-    for project_file in PROJECTS_DIR.glob("*.json"):
+def render_lines(project_id: str, line_ids: List[str], force: bool = True) -> dict:
+    """
+    并发重新生成多句对话(同步执行,在线程池中调用)
+    :param project_id: 工程ID
+    :param line_ids: 对话行ID列表
+    :param force: 是否重新合成(不复用音频存储中参数相同的音频)
+    :return: 结果字典,results 按 line_ids 顺序给出每句的结果
+    """
+    project = project_cache.checkout(project_id)
+    
+    if project is None:
+        raise HTTPException(status_code=404, detail="工程不存在")
+    
+    if not tts_generator:
+        raise HTTPException(status_code=503, detail="TTS服务未初始化")
+    
+    by_id = {dialogue.id: dialogue for dialogue in project.dialogues}
+    missing = [line_id for line_id in line_ids if line_id not in by_id]
+    if missing:
+        raise HTTPException(status_code=404, detail=f"对话行不存在: {', '.join(missing)}")
+    
+    # 只包含所选对话的工程副本,复用整工程生成的并发调度和相同参数去重
+    selected = list(dict.fromkeys(line_ids))
+    subset = project.model_copy(update={"dialogues": [by_id[line_id] for line_id in selected]})
+    
+    # 强制生成时每句都会重新合成,参数相同的对话只合成一次
+    tts_generator.generate_project(subset, force=force, tenant=project_id)
+    save_render_results(project_id, subset.dialogues)
+    mix_updated = refresh_mix(project_id)
+    
+    results = [
+        {
+            "line_id": line_id,
+            "success": bool(by_id[line_id].audio_file),
+            "audio_url": audio_url(by_id[line_id].audio_file) if by_id[line_id].audio_file else None,
+            "duration": by_id[line_id].duration,
+        }
+        for line_id in selected
+    ]
+    failed = sum(1 for result in results if not result["success"])
+    return {
+        "success": failed == 0,
+        "results": results,
+        "failed": failed,
+        "mix_updated": mix_updated,
+        "message": "生成成功" if not failed else f"{failed} 句生成失败"
+    }
+
+
+@app.post("/api/projects/{project_id}/generate-lines")
+async def generate_lines(project_id: str, request: BulkGenerateLinesRequest):
+    """批量重新生成多句对话(并发合成,参数相同的对话只合成一次)"""
+    if not request.line_ids:
+        raise HTTPException(status_code=400, detail="没有要生成的对话")
+    try:
+        return await run_blocking("generate", render_lines, project_id, request.line_ids, request.force)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"生成失败: {str(e)}")
+
+
+@app.post("/api/projects/{project_id}/prefetch")
+async def prefetch_lines(project_id: str, request: PrefetchRequest):
+    """
+    推测预取: 用户查看某句时,以最低优先级提前合成其后尚未生成的若干句,
+    同时取消该工程不再需要的预取
+    """
+    project = project_cache.checkout(project_id)
+    
+    if project is None:
+        raise HTTPException(status_code=404, detail="工程不存在")
+    
+    if not prefetcher:
+        raise HTTPException(status_code=503, detail="TTS服务未初始化")
+    
+    if not prefetcher.enabled:
+        return {"enabled": False, "scheduled": [], "ready": [], "over_budget": [], "cancelled": 0}
+    
+    count = None if request.count is None else max(0, min(request.count, MAX_LOOKAHEAD))
+    result = prefetcher.prefetch(project_id, project, request.line_id, count)
+    if result is None:
+        raise HTTPException(status_code=404, detail="对话行不存在")
+    return {"enabled": True, **result}
+
+
+@app.delete("/api/projects/{project_id}/prefetch")
+async def cancel_prefetch(project_id: str):
+    """取消工程尚未开始的预取"""
+    if not prefetcher:
+        return {"cancelled": 0}
+    return {"cancelled": prefetcher.cancel(project_id)}
+
+
+@app.websocket("/ws/projects/{project_id}/preview")
+async def preview_socket(websocket: WebSocket, project_id: str):
+    """
+    编辑时实时预览(WebSocket)
+    客户端发送 {"line_id": ..., "updates": {...}}(updates为尚未保存的修改,可省略),
+    最后一次编辑后经过防抖时间开始合成,新的编辑会取消尚未完成的预览。
+    服务端依次发送 {"type": "start"}、若干二进制PCM块、{"type": "end"};
+    被取代的预览发送 {"type": "cancelled"},失败发送 {"type": "error"}
+    """
+    await websocket.accept()
+    if not project_cache.exists(project_id):
+        await websocket.close(code=4404, reason="工程不存在")
+        return
+    if not tts_generator:
+        await websocket.close(code=4503, reason="TTS服务未初始化")
+        return
+    
+    loop = asyncio.get_running_loop()
+    
+    async def preview(seq: int, line_id: str, updates: dict, cancel_event: threading.Event):
+        await asyncio.sleep(PREVIEW_DEBOUNCE_SECONDS)
+        
+        project = project_cache.get(project_id)
+        line = next((d for d in project.dialogues if d.id == line_id), None) if project else None
+        if line is None:
+            await websocket.send_json({"type": "error", "seq": seq, "error": "对话行不存在"})
+            return
+        try:
+            line = DialogueLine(**{**line.model_dump(), **updates, "id": line.id})
+        except ValidationError as e:
+            await websocket.send_json({"type": "error", "seq": seq, "error": f"参数无效: {e}"})
+            return
+        speaker = next((sp for sp in project.speakers if sp.id == line.speaker_id), None)
+        voice_type = speaker.voice_type if speaker else get_voice_type("male", "adult")
+        
+        chunks: asyncio.Queue = asyncio.Queue()
+        
+        def pump():
+            # 在调度器的工作线程中接收音频块,转交给事件循环发送
+            if cancel_event.is_set():
+                # 排队期间已被新的编辑取代
+                return
+            for chunk in tts_generator.preview_line(line, voice_type, cancel_event):
+                loop.call_soon_threadsafe(chunks.put_nowait, chunk)
+        
+        await websocket.send_json({
+            "type": "start", "seq": seq, "line_id": line_id,
+            "sample_rate": RENDER_PARAMS["sample_rate"], "channels": 1, "sample_width": 2
+        })
+        future = None
         try:
-            with open(project_file, "r", encoding="utf-8") as f:
-                data = json.load(f)
-                projects.append({
-                    "id": project_file.stem,
-                    "title": data.get("title", "未命名"),
-                    "created_at": data.get("created_at"),
-                    "updated_at": data.get("updated_at")
-                })
-        except:
-            continue
-    
-    # 按更新时间倒序排列
-    projects.sort(key=lambda x: x.get("updated_at", ""), reverse=True)
-    return {"projects": projects}
+            # 直接等待调度器的Future,不占用线程池;结束(包括排队中被取消)后送出结束标记
+            future = tts_scheduler.submit(pump, priority=INTERACTIVE, tenant=project_id)
+            worker = asyncio.wrap_future(future)
+            worker.add_done_callback(lambda _: chunks.put_nowait(None))
+            while True:
+                chunk = await chunks.get()
+                if chunk is None:
+                    break
+                await websocket.send_bytes(chunk)
+            await worker
+        except asyncio.CancelledError:
+            cancel_event.set()
+            if future is not None:
+                future.cancel()
+            raise
+        except Exception as e:
+            await websocket.send_json({"type": "error", "seq": seq, "error": f"合成失败: {e}"})
+            return
+        
+        if line.audio_file:
+            await websocket.send_json({
+                "type": "end", "seq": seq, "line_id": line_id,
+                "audio_url": audio_url(line.audio_file), "duration": line.duration
+            })
+        else:
+            await websocket.send_json({"type": "error", "seq": seq, "error": "音频生成失败"})
+    
+    seq = 0
+    current: Optional[asyncio.Task] = None
+    cancel_event = threading.Event()
+    try:
+        while True:
+            try:
+                message = json.loads(await websocket.receive_text())
+                line_id = message["line_id"]
+                updates = message.get("updates") or {}
+            except (ValueError, KeyError, TypeError, AttributeError):
+                await websocket.send_json({"type": "error", "error": "消息格式无效"})
+                continue
+            
+            # 新的编辑取代尚未完成的预览(防抖中或合成中)
+            if current is not None and not current.done():
+                cancel_event.set()
+                current.cancel()
+                try:
+                    await current
+                except asyncio.CancelledError:
+                    pass
+                await websocket.send_json({"type": "cancelled", "seq": seq})
+            
+            seq += 1
+            cancel_event = threading.Event()
+            current = asyncio.ensure_future(preview(seq, line_id, updates, cancel_event))
+    except WebSocketDisconnect:
+        pass
+    finally:
+        cancel_event.set()
+        if current is not None:
+            current.cancel()
+
+
+@app.get("/api/projects")
+async def list_projects(
+    limit: int = Query(default=DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    q: Optional[str] = None,
+    updated_after: Optional[str] = None,
+    updated_before: Optional[str] = None,
+    if_none_match: Optional[str] = Header(default=None)
+):
+    """
+    分页列出工程(按更新时间倒序,只读取摘要索引)
+    cursor 为上一页返回的 next_cursor;q 按标题筛选;updated_after/updated_before 按更新时间筛选
+    """
+    try:
+        position = decode_cursor(cursor) if cursor else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    # 数据版本与查询参数共同决定列表内容,未变化时返回304
+    query = json.dumps([limit, cursor, q, updated_after, updated_before], ensure_ascii=False)
+    # 两次查询都访问数据库(版本号查询前写回未保存的改动),放到线程池中执行
+    version = await run_in_threadpool(project_cache.listing_version)
+    etag = '"' + hashlib.sha1(f"{version}|{query}".encode("utf-8")).hexdigest()[:20] + '"'
+    if if_none_match and etag in [tag.strip() for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers={"ETag": etag})
+    
+    # 多取一条用于判断是否还有下一页
+    projects = await run_in_threadpool(
+        project_cache.list_summaries, flush=False,
+        limit=limit + 1, cursor=position, title=q,
+        updated_after=updated_after, updated_before=updated_before
+    )
+    next_cursor = None
+    if len(projects) > limit:
+        projects = projects[:limit]
+        last = projects[-1]
+        next_cursor = encode_cursor(last["updated_at"], last["id"])
+    
+    return JSONResponse(
+        {"projects": projects, "next_cursor": next_cursor},
+        headers={"ETag": etag, "Cache-Control": "no-cache"}
+    )
+
+
+@app.get("/api/status")
+async def get_status():
+    """阻塞调用通道和TTS调度器的并发和排队情况"""
+    return {
+        "lanes": blocking.stats(),
+        "tts_scheduler": tts_scheduler.stats(),
+        "prefetch": prefetcher.stats() if prefetcher else None
+    }
+
+
+@app.get("/api/storage")
+async def get_storage_usage():
+    """音频存储的磁盘占用(含未被引用的音频和去重节省的空间)"""
+    def collect():
+        project_cache.flush()
+        usage = audio_store.disk_usage(store.audio_ref_counts())
+        mixes = [path.stat().st_size for path in OUTPUT_DIR.glob("*_final.wav")]
+        usage["final_mixes"] = {"files": len(mixes), "bytes": sum(mixes)}
+        return usage
+    
+    return await run_in_threadpool(collect)
+
+
+@app.post("/api/storage/gc")
+async def collect_audio_garbage(grace_seconds: float = Query(default=3600, ge=0), dry_run: bool = False):
+    """回收没有被任何对话引用的音频"""
+    def collect():
+        # 先写回缓存中的改动,保证引用计数是最新的
+        project_cache.flush()
+        return audio_store.collect_garbage(store.audio_ref_counts(), grace_seconds, dry_run)
+    
+    result = await run_in_threadpool(collect)
+    return {"success": True, "dry_run": dry_run, **result}
 
 
 # 静态文件服务
 app.mount("/static", StaticFiles(directory="static"), name="static")
-app.mount("/audio", StaticFiles(directory="dialogue_output"), name="audio")
+app.mount("/audio", StaticFiles(directory=str(OUTPUT_DIR)), name="audio")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,154 @@
+"""
+按内容寻址的音频存储
+对话音频以合成参数哈希(DialogueLine.content_hash)命名,存放在 objects/ab/abcdef....wav,
+参数完全相同的对话(包括不同工程之间)共用同一个文件,不会重复合成。
+强制重新合成的版本以 "哈希-版本号" 单独存储,已有文件一旦写入不再被替换。
+引用关系记录在工程数据库中,没有任何对话引用的音频由垃圾回收清理
+"""
+import os
+import time
+import uuid
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, Optional, Union
+
+# 新写入的音频在此时长内即使没有引用也不回收(合成中或尚未写回数据库的引用)
+DEFAULT_GC_GRACE_SECONDS = 3600
+
+
+class AudioStore:
+    """内容寻址音频存储"""
+
+    def __init__(self, root: Union[str, Path] = "dialogue_output/objects", suffix: str = ".wav"):
+        """
+        初始化
+        :param root: 存储根目录
+        :param suffix: 音频文件扩展名
+        """
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.suffix = suffix
+
+    def path_for(self, content_hash: str) -> Path:
+        """返回哈希对应的存储路径(按前两位分目录,避免单目录文件过多)"""
+        return self.root / content_hash[:2] / f"{content_hash}{self.suffix}"
+
+    def get(self, content_hash: str) -> Optional[str]:
+        """
+        查找已存储的音频
+        :return: 文件路径,不存在时返回None
+        """
+        path = self.path_for(content_hash)
+        return str(path) if path.exists() else None
+
+    def temp_path(self, content_hash: str) -> Path:
+        """返回用于写入新音频的临时路径(与最终路径同目录,保证可原子替换)"""
+        path = self.path_for(content_hash)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        return path.with_name(f".{content_hash}.{uuid.uuid4().hex[:8]}.tmp{self.suffix}")
+
+    def put(self, content_hash: str, source: Union[str, Path]) -> str:
+        """
+        把写好的音频文件移入存储(原子替换,并发写入同一哈希也是安全的)
+        :param content_hash: 内容哈希
+        :param source: 已写好的音频文件(通常来自 temp_path)
+        :return: 存储路径
+        """
+        path = self.path_for(content_hash)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(source, path)
+        return str(path)
+
+    def iter_objects(self) -> Iterator[Path]:
+        """遍历全部已存储的音频(不含临时文件)"""
+        for path in self.root.glob(f"??/*{self.suffix}"):
+            if not path.name.startswith("."):
+                yield path
+
+    def hash_of(self, path: Union[str, Path]) -> str:
+        return Path(path).name[:-len(self.suffix)]
+
+    def collect_garbage(self, referenced: Iterable[str],
+                        grace_seconds: float = DEFAULT_GC_GRACE_SECONDS,
+                        dry_run: bool = False) -> Dict:
+        """
+        删除没有被任何对话引用的音频
+        :param referenced: 仍被引用的内容哈希
+        :param grace_seconds: 修改时间在此时长内的文件不删除
+        :param dry_run: 只统计不删除
+        :return: 回收结果 {"removed": 文件数, "freed_bytes": 字节数}
+        """
+        referenced = set(referenced)
+        cutoff = time.time() - grace_seconds
+        removed = freed = 0
+
+        for path in self.iter_objects():
+            if self.hash_of(path) in referenced:
+                continue
+            try:
+                stat = path.stat()
+                if stat.st_mtime > cutoff:
+                    continue
+                if not dry_run:
+                    path.unlink()
+            except FileNotFoundError:
+                continue
+            removed += 1
+            freed += stat.st_size
+            freed += self._remove_sidecars(path, dry_run)
+
+        # 清理中断遗留的临时文件
+        if not dry_run:
+            for tmp in self.root.glob("??/.*.tmp*"):
+                try:
+                    if tmp.stat().st_mtime <= cutoff:
+                        tmp.unlink()
+                except FileNotFoundError:
+                    pass
+
+        return {"removed": removed, "freed_bytes": freed}
+
+    @staticmethod
+    def _remove_sidecars(path: Path, dry_run: bool = False) -> int:
+        """删除音频旁的附属文件(如波形峰值 .peaks),返回其字节数"""
+        freed = 0
+        for sidecar in path.parent.glob(f"{path.stem}.*"):
+            if sidecar == path:
+                continue
+            try:
+                freed += sidecar.stat().st_size
+                if not dry_run:
+                    sidecar.unlink()
+            except FileNotFoundError:
+                pass
+        return freed
+
+    def disk_usage(self, ref_counts: Optional[Dict[str, int]] = None) -> Dict:
+        """
+        统计磁盘占用
+        :param ref_counts: 内容哈希 -> 引用次数,提供时额外统计未被引用的部分和去重节省的空间
+        :return: 统计结果
+        """
+        objects = total = orphaned = orphaned_bytes = saved = 0
+        for path in self.iter_objects():
+            try:
+                size = path.stat().st_size
+            except FileNotFoundError:
+                continue
+            objects += 1
+            total += size
+            if ref_counts is not None:
+                refs = ref_counts.get(self.hash_of(path), 0)
+                if refs == 0:
+                    orphaned += 1
+                    orphaned_bytes += size
+                else:
+                    saved += size * (refs - 1)
+
+        usage = {"objects": objects, "bytes": total}
+        if ref_counts is not None:
+            usage.update({
+                "orphaned_objects": orphaned,
+                "orphaned_bytes": orphaned_bytes,
+                "dedup_saved_bytes": saved,
+            })
+        return usage
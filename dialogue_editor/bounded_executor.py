@@ -0,0 +1,127 @@
+"""
+阻塞调用的有界执行器
+LLM分析、TTS合成等同步阻塞调用按用途分到不同的通道(lane),每个通道有独立的线程池、
+并发上限、排队超时和执行超时,慢调用不会占满事件循环或挤占其他通道
+"""
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+
+class ExecutorBusyError(Exception):
+    """通道已满且排队超时"""
+
+
+class CallTimeoutError(TimeoutError):
+    """调用超过执行超时(后台线程仍会执行完,但请求不再等待)"""
+
+
+class _Lane:
+    """单个通道"""
+
+    def __init__(self, name: str, max_concurrency: int, timeout: Optional[float], queue_timeout: float):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.queue_timeout = queue_timeout
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix=f"lane-{name}")
+        self.semaphore: Optional[asyncio.Semaphore] = None
+
+        # 统计
+        self.running = 0
+        self.waiting = 0
+        self.completed = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+    def get_semaphore(self) -> asyncio.Semaphore:
+        # 在事件循环中首次使用时创建,避免绑定到导入时的事件循环
+        if self.semaphore is None:
+            self.semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self.semaphore
+
+
+class BoundedExecutor:
+    """按通道限流的阻塞调用执行器"""
+
+    def __init__(self):
+        self._lanes: Dict[str, _Lane] = {}
+
+    def add_lane(self, name: str, max_concurrency: int, timeout: Optional[float] = None,
+                 queue_timeout: float = 10.0):
+        """
+        注册通道
+        :param name: 通道名称
+        :param max_concurrency: 同时执行的调用数
+        :param timeout: 单次调用的执行超时(秒),为空表示不限
+        :param queue_timeout: 通道已满时最多排队等待的时间(秒)
+        """
+        self._lanes[name] = _Lane(name, max(1, max_concurrency), timeout, queue_timeout)
+
+    async def run(self, lane_name: str, fn: Callable[..., Any], *args,
+                  timeout: Optional[float] = None, **kwargs) -> Any:
+        """
+        在指定通道的线程池中执行阻塞函数
+        :param lane_name: 通道名称
+        :param fn: 阻塞函数
+        :param timeout: 覆盖通道的执行超时
+        :return: 函数返回值
+        :raises ExecutorBusyError: 排队超时
+        :raises CallTimeoutError: 执行超时
+        """
+        lane = self._lanes[lane_name]
+        semaphore = lane.get_semaphore()
+        timeout = lane.timeout if timeout is None else timeout
+
+        lane.waiting += 1
+        try:
+            await asyncio.wait_for(semaphore.acquire(), lane.queue_timeout)
+        except asyncio.TimeoutError:
+            lane.rejected += 1
+            raise ExecutorBusyError(f"{lane_name} 通道繁忙,请稍后重试")
+        finally:
+            lane.waiting -= 1
+
+        lane.running += 1
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(lane.executor, functools.partial(fn, *args, **kwargs))
+
+        def release(_=None):
+            lane.running -= 1
+            semaphore.release()
+
+        try:
+            result = await asyncio.wait_for(asyncio.shield(future), timeout)
+        except asyncio.TimeoutError:
+            # 线程无法中断: 直到它真正结束才归还并发名额
+            lane.timed_out += 1
+            future.add_done_callback(release)
+            raise CallTimeoutError(f"{lane_name} 调用超时({timeout:.0f}秒)")
+        except BaseException:
+            if future.done():
+                release()
+            else:
+                future.add_done_callback(release)
+            raise
+        release()
+        lane.completed += 1
+        return result
+
+    def stats(self) -> Dict[str, Dict]:
+        """各通道的当前状态"""
+        return {
+            name: {
+                "max_concurrency": lane.max_concurrency,
+                "running": lane.running,
+                "waiting": lane.waiting,
+                "completed": lane.completed,
+                "rejected": lane.rejected,
+                "timed_out": lane.timed_out,
+            }
+            for name, lane in self._lanes.items()
+        }
+
+    def shutdown(self, wait: bool = True):
+        for lane in self._lanes.values():
+            lane.executor.shutdown(wait=wait)
@@ -0,0 +1,295 @@
+"""
+后台生成任务队列
+工程生成以任务形式提交到工作线程池执行,客户端通过任务ID查询状态或订阅SSE进度,
+断开连接不影响任务继续执行;同一工程未完成的任务不会重复提交
+(同步生成和流式播放也登记为任务,与后台任务互相去重)
+"""
+import asyncio
+import json
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+# 保留的已结束任务数量(超出后丢弃最早的)
+MAX_FINISHED_JOBS = 200
+
+# SSE保活注释的发送间隔(秒)
+SSE_KEEPALIVE_SECONDS = 15.0
+
+# SSE轮询新事件的间隔(秒)
+SSE_POLL_SECONDS = 0.25
+
+
+class JobConflictError(Exception):
+    """工程正在执行的生成不满足新的请求(如正在增量生成时请求强制全部重新生成)"""
+
+    def __init__(self, job: "GenerationJob"):
+        super().__init__(f"工程正在生成中(任务 {job.id}),结束后再重新提交")
+        self.job = job
+
+
+class GenerationJob:
+    """单个生成任务的状态与事件记录"""
+
+    def __init__(self, project_id: str, force: bool = False):
+        self.id = str(uuid.uuid4())
+        self.project_id = project_id
+        self.force = force
+        self.status = "queued"  # queued / running / done / failed
+        self.total = 0
+        self.done = 0
+        self.synthesized = 0
+        self.failures: List[int] = []
+        self.result: Optional[dict] = None
+        self.error: Optional[str] = None
+        self.status_code = 500
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+        self._events: List[Tuple[str, dict]] = []
+        self._done_callbacks: List[Callable[[], None]] = []
+        self._lock = threading.Lock()
+        self._emit("queued", {})
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("done", "failed")
+
+    def eta(self) -> Optional[float]:
+        """按实际合成的对话的平均耗时估算剩余秒数(复用已有音频的对话几乎不耗时,不计入平均)"""
+        if self.status != "running" or not self.synthesized or not self.started_at:
+            return None
+        elapsed = time.time() - self.started_at
+        return elapsed / self.synthesized * (self.total - self.done)
+
+    def snapshot(self) -> dict:
+        """返回可序列化的任务状态"""
+        eta = self.eta()
+        return {
+            "job_id": self.id,
+            "project_id": self.project_id,
+            "status": self.status,
+            "total": self.total,
+            "done": self.done,
+            "synthesized": self.synthesized,
+            "failures": list(self.failures),
+            "eta_seconds": round(eta, 1) if eta is not None else None,
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+    # ---- 由工作线程调用 ----
+
+    def start(self, total: int):
+        self.status = "running"
+        self.total = total
+        self.started_at = time.time()
+        self._emit("started", {"total": total})
+
+    def progress(self, done: int, total: int, index: int, audio_file: Optional[str],
+                 synthesized: bool = False):
+        """与 TTSGenerator 的进度回调签名一致(合成线程并发调用)"""
+        with self._lock:
+            self.done = done
+            self.total = total
+            if synthesized:
+                self.synthesized += 1
+            if not audio_file:
+                self.failures.append(index)
+        eta = self.eta()
+        self._emit("line", {
+            "index": index,
+            "done": done,
+            "total": total,
+            "success": bool(audio_file),
+            "eta_seconds": round(eta, 1) if eta is not None else None,
+        })
+
+    def stage(self, name: str):
+        """报告进入新的处理阶段(如合并音频)"""
+        self._emit("stage", {"stage": name})
+
+    def succeed(self, result: dict):
+        self.result = result
+        self.status = "done"
+        self.finished_at = time.time()
+        self._emit("done", result)
+        self._notify_done()
+
+    def fail(self, error: str, status_code: int = 500):
+        self.error = error
+        self.status_code = status_code
+        self.status = "failed"
+        self.finished_at = time.time()
+        self._emit("failed", {"error": error})
+        self._notify_done()
+
+    def add_done_callback(self, fn: Callable[[], None]):
+        """任务结束时调用fn(在结束任务的线程中);已结束时立即调用"""
+        with self._lock:
+            if not self.finished:
+                self._done_callbacks.append(fn)
+                return
+        fn()
+
+    def _notify_done(self):
+        with self._lock:
+            callbacks, self._done_callbacks = self._done_callbacks, []
+        for fn in callbacks:
+            fn()
+
+    # ---- 事件 ----
+
+    def _emit(self, event: str, data: dict):
+        with self._lock:
+            self._events.append((event, data))
+
+    def events_since(self, cursor: int) -> List[Tuple[int, str, dict]]:
+        """返回序号不小于cursor的事件(序号, 事件名, 数据)"""
+        cursor = max(0, cursor)
+        with self._lock:
+            return [(i, event, data) for i, (event, data) in enumerate(self._events[cursor:], cursor)]
+
+
+class JobManager:
+    """生成任务管理器"""
+
+    def __init__(self, max_workers: int = 2):
+        """
+        初始化
+        :param max_workers: 同时执行的工程数(每个工程内部仍会并发合成)
+        """
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._jobs: "OrderedDict[str, GenerationJob]" = OrderedDict()
+        self._active_by_project: Dict[str, str] = {}
+        self._pending: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, project_id: str, fn: Callable[[GenerationJob], dict],
+               force: bool = False) -> Tuple[GenerationJob, bool]:
+        """
+        提交工程生成任务
+        :param project_id: 工程ID
+        :param fn: 任务函数,接收任务对象用于报告进度,返回结果字典
+        :param force: 任务是否强制全部重新生成
+        :return: (任务, 是否新建);同一工程已有满足要求的未结束任务时返回该任务
+        :raises JobConflictError: 已有的任务不满足要求(正在增量生成时请求强制生成)
+        """
+        job, created = self.register(project_id, force)
+        if created:
+            future = self._executor.submit(self._run, job, fn)
+            with self._lock:
+                self._pending[job.id] = future
+            future.add_done_callback(lambda _: self._pending.pop(job.id, None))
+        return job, created
+
+    def register(self, project_id: str, force: bool = False) -> Tuple[GenerationJob, bool]:
+        """
+        登记工程生成但不提交执行(流式播放等自行执行生成的场景),与 submit 共用去重
+        :param project_id: 工程ID
+        :param force: 是否强制全部重新生成;强制生成的任务也满足普通请求,反之不满足
+        :return: (任务, 是否新建);新建时调用方负责报告进度并调用 succeed 或 fail
+        :raises JobConflictError: 已有的任务不满足要求
+        """
+        with self._lock:
+            active = self._jobs.get(self._active_by_project.get(project_id, ""))
+            if active and not active.finished:
+                if force and not active.force:
+                    raise JobConflictError(active)
+                return active, False
+
+            job = GenerationJob(project_id, force)
+            self._jobs[job.id] = job
+            self._active_by_project[project_id] = job.id
+            self._prune()
+        return job, True
+
+    def _run(self, job: GenerationJob, fn: Callable[[GenerationJob], dict]):
+        try:
+            job.succeed(fn(job))
+        except Exception as e:
+            job.fail(str(getattr(e, "detail", e)), getattr(e, "status_code", 500))
+        finally:
+            with self._lock:
+                if self._active_by_project.get(job.project_id) == job.id:
+                    del self._active_by_project[job.project_id]
+
+    def _prune(self):
+        """丢弃过多的已结束任务(调用方持有锁)"""
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished]
+        for job_id in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self._jobs[job_id]
+
+    def get(self, job_id: str) -> Optional[GenerationJob]:
+        return self._jobs.get(job_id)
+
+    def active_job(self, project_id: str) -> Optional[GenerationJob]:
+        """返回工程当前未结束的任务"""
+        job = self._jobs.get(self._active_by_project.get(project_id, ""))
+        return job if job and not job.finished else None
+
+    async def wait(self, job: GenerationJob) -> GenerationJob:
+        """等待任务结束(不占用线程,任务结束时由结束任务的线程唤醒)"""
+        loop = asyncio.get_running_loop()
+        finished = loop.create_future()
+
+        def wake():
+            if not finished.done():
+                finished.set_result(None)
+
+        def on_done():
+            try:
+                loop.call_soon_threadsafe(wake)
+            except RuntimeError:
+                # 事件循环已关闭(等待方已不存在)
+                pass
+
+        job.add_done_callback(on_done)
+        await finished
+        return job
+
+    async def stream_events(self, job: GenerationJob, last_event_id: int = -1) -> AsyncIterator[str]:
+        """
+        以SSE格式持续输出任务事件,任务结束后停止
+        :param job: 任务
+        :param last_event_id: 客户端已收到的最后一个事件序号(断线重连时续传)
+        """
+        cursor = max(0, last_event_id + 1)
+        last_sent = time.monotonic()
+
+        while True:
+            events = job.events_since(cursor)
+            for index, event, data in events:
+                payload = json.dumps(data, ensure_ascii=False)
+                yield f"id: {index}\nevent: {event}\ndata: {payload}\n\n"
+                cursor = index + 1
+                last_sent = time.monotonic()
+                if event in ("done", "failed"):
+                    return
+
+            if not events:
+                if job.finished:
+                    return
+                if time.monotonic() - last_sent >= SSE_KEEPALIVE_SECONDS:
+                    yield ": keepalive\n\n"
+                    last_sent = time.monotonic()
+                await asyncio.sleep(SSE_POLL_SECONDS)
+
+    def shutdown(self, wait: bool = True):
+        """
+        停止接收新任务,尚未开始的任务标记为失败
+        :param wait: 是否等待正在执行的任务结束(阻塞,在事件循环中应放到线程里调用)
+        """
+        with self._lock:
+            pending = list(self._pending.items())
+        for job_id, future in pending:
+            if future.cancel():
+                self._jobs[job_id].fail("服务关闭,任务已取消", 503)
+        self._executor.shutdown(wait=wait)
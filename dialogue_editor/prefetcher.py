@@ -0,0 +1,217 @@
+"""
+推测预取
+用户在编辑器中查看第N句时,接下来通常会依次播放第N+1到N+k句。预取器以最低优先级(PREFETCH)
+提前合成其中尚未生成的对话,音频存入音频存储并写回工程,播放下一句时直接命中。
+预取要消耗上游配额,因此受每小时预算限制;用户转到别处时取消尚未开始的预取
+"""
+import os
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional, Tuple
+
+from project_schema import DialogueLine, DialogueProject
+from tts_generator import RENDER_PARAMS, TTSGenerator
+from tts_scheduler import PREFETCH, TTSScheduler
+
+# 默认预取当前对话之后的句数(0表示关闭预取)
+DEFAULT_LOOKAHEAD = int(os.getenv("PREFETCH_LOOKAHEAD", "3"))
+
+# 单次请求最多预取的句数
+MAX_LOOKAHEAD = 10
+
+# 每小时最多预取合成的句数(复用已有音频不计入)
+DEFAULT_BUDGET_PER_HOUR = int(os.getenv("PREFETCH_BUDGET_PER_HOUR", "200"))
+
+# 预取完成回调: (工程ID, 合成后的对话行)
+RenderedCallback = Callable[[str, DialogueLine], None]
+
+
+class _Budget:
+    """令牌桶: 容量为每小时预算,按时间匀速补充"""
+
+    def __init__(self, per_hour: int):
+        self.capacity = max(0, per_hour)
+        self.rate = self.capacity / 3600
+        self.tokens = float(self.capacity)
+        self.updated_at = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def take(self) -> bool:
+        self._refill()
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+    def refund(self):
+        self.tokens = min(self.capacity, self.tokens + 1)
+
+    def remaining(self) -> int:
+        self._refill()
+        return int(self.tokens)
+
+
+class Prefetcher:
+    """以预取优先级提前合成即将播放的对话"""
+
+    def __init__(self, generator: TTSGenerator, scheduler: TTSScheduler,
+                 on_rendered: Optional[RenderedCallback] = None,
+                 lookahead: int = DEFAULT_LOOKAHEAD,
+                 budget_per_hour: int = DEFAULT_BUDGET_PER_HOUR):
+        """
+        初始化
+        :param generator: TTS生成器(合成结果存入其音频存储)
+        :param scheduler: TTS调度器,预取任务以PREFETCH优先级提交,只使用空闲名额
+        :param on_rendered: 每句预取完成后的回调,用于把音频写回工程
+        :param lookahead: 默认预取的句数,0表示关闭
+        :param budget_per_hour: 每小时最多预取合成的句数
+        """
+        self.generator = generator
+        self.scheduler = scheduler
+        self.on_rendered = on_rendered
+        self.lookahead = max(0, min(lookahead, MAX_LOOKAHEAD))
+
+        # 取消或完成的回调可能在持有锁的线程中同步执行,需要可重入
+        self._lock = threading.RLock()
+        self._budget = _Budget(budget_per_hour)
+        # 工程ID -> {对话ID: (参数哈希, Future, 是否消耗了预算)}
+        self._pending: Dict[str, Dict[str, Tuple[str, Future, bool]]] = {}
+
+        # 统计
+        self.rendered = 0
+        self.cancelled = 0
+        self.over_budget = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.lookahead > 0
+
+    def prefetch(self, project_id: str, project: DialogueProject, line_id: str,
+                 count: Optional[int] = None) -> Optional[Dict]:
+        """
+        预取指定对话之后的若干句,并取消该工程不再需要的预取
+        :param project_id: 工程ID
+        :param project: 工程(调用方持有的副本)
+        :param line_id: 用户当前查看的对话ID
+        :param count: 预取句数,默认为lookahead
+        :return: {"scheduled": [...], "ready": [...], "over_budget": [...], "cancelled": n};
+                 对话不存在时返回None
+        """
+        index = next((i for i, d in enumerate(project.dialogues) if d.id == line_id), None)
+        if index is None:
+            return None
+
+        count = self.lookahead if count is None else max(0, min(count, MAX_LOOKAHEAD))
+        speaker_voices = {speaker.id: speaker.voice_type for speaker in project.speakers}
+        window: List[Tuple[int, DialogueLine, str, str]] = []
+        for i in range(index + 1, min(index + 1 + count, len(project.dialogues))):
+            line = project.dialogues[i]
+            voice_type = speaker_voices.get(line.speaker_id, "zh_male_wennuanahu_moon_bigtts")
+            window.append((i, line, voice_type, line.render_hash(voice_type, **RENDER_PARAMS)))
+
+        scheduled, ready, over_budget = [], [], []
+        with self._lock:
+            pending = self._pending.setdefault(project_id, {})
+            # 用户已经转到别处或对话已被修改: 取消尚未开始的旧预取
+            wanted = {line.id: content_hash for _, line, _, content_hash in window}
+            cancelled = sum(
+                self._cancel(pending, pending_id)
+                for pending_id, (content_hash, _, _) in list(pending.items())
+                if wanted.get(pending_id) != content_hash
+            )
+
+            for i, line, voice_type, content_hash in window:
+                entry = pending.get(line.id)
+                if entry and entry[0] == content_hash:
+                    scheduled.append(line.id)
+                    continue
+                if self.generator.is_up_to_date(line, voice_type):
+                    ready.append(line.id)
+                    continue
+                # 参数相同的音频已在存储中时只需写回工程,不消耗预算
+                charged = self.generator.audio_store.get(content_hash) is None
+                if charged and not self._budget.take():
+                    over_budget.append(line.id)
+                    self.over_budget += 1
+                    continue
+
+                future = self.scheduler.submit(self._render, project_id, line, voice_type, i,
+                                               priority=PREFETCH, tenant=project_id)
+                pending[line.id] = (content_hash, future, charged)
+                future.add_done_callback(
+                    lambda f, line_id=line.id: self._finished(project_id, line_id, f)
+                )
+                scheduled.append(line.id)
+
+            if not pending:
+                self._pending.pop(project_id, None)
+
+        return {"scheduled": scheduled, "ready": ready, "over_budget": over_budget, "cancelled": cancelled}
+
+    def cancel(self, project_id: str) -> int:
+        """
+        取消工程尚未开始的预取(已在合成的会完成并写回)
+        :return: 取消的数量
+        """
+        with self._lock:
+            pending = self._pending.pop(project_id, {})
+            cancelled = sum(self._cancel(pending, line_id) for line_id in list(pending))
+            if pending:
+                self._pending[project_id] = pending
+            return cancelled
+
+    def cancel_all(self) -> int:
+        with self._lock:
+            return sum(
+                self._cancel(pending, line_id)
+                for pending in self._pending.values()
+                for line_id in list(pending)
+            )
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "lookahead": self.lookahead,
+                "budget_per_hour": self._budget.capacity,
+                "budget_remaining": self._budget.remaining(),
+                "pending": sum(len(pending) for pending in self._pending.values()),
+                "rendered": self.rendered,
+                "cancelled": self.cancelled,
+                "over_budget": self.over_budget,
+            }
+
+    def _cancel(self, pending: Dict[str, Tuple[str, Future, bool]], line_id: str) -> bool:
+        """取消一个预取(调用方持有锁);已开始执行的无法取消,保留等它完成"""
+        entry = pending.pop(line_id)
+        _, future, charged = entry
+        if not future.cancel():
+            pending[line_id] = entry
+            return False
+        if charged:
+            self._budget.refund()
+        self.cancelled += 1
+        return True
+
+    def _render(self, project_id: str, line: DialogueLine, voice_type: str, index: int) -> Optional[str]:
+        """在调度器的工作线程中合成一句(generate_line 把结果存入音频存储)"""
+        audio_file = self.generator.generate_line(line, voice_type, index)
+        if audio_file:
+            line.audio_file = audio_file
+            print(f"🔮 已预取 [{index+1}]: {line.text[:20]}...")
+            if self.on_rendered:
+                self.on_rendered(project_id, line)
+        return audio_file
+
+    def _finished(self, project_id: str, line_id: str, future: Future):
+        with self._lock:
+            pending = self._pending.get(project_id)
+            if pending and line_id in pending and pending[line_id][1] is future:
+                del pending[line_id]
+            if not future.cancelled() and future.exception() is None and future.result():
+                self.rendered += 1
@@ -0,0 +1,379 @@
+"""
+工程写回缓存
+已加载的工程对象常驻内存,编辑只修改内存中的对象并记录改动字段,
+连续编辑合并后在短暂防抖后(或服务关闭时)批量写入数据库。
+缓存的工程按写时复制更新,读取直接返回共享快照,需要修改的调用方用 checkout 取得副本。
+按间隔检查数据库的 data_version,其他连接写入过时才逐个核对 updated_at,
+被外部修改的工程先写回本地改动再重新加载
+"""
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from project_schema import DialogueLine, DialogueProject, Speaker
+from project_store import PROJECT_FIELDS, ProjectStore
+
+# 最后一次编辑后等待多久写回数据库(秒)
+DEFAULT_DEBOUNCE_SECONDS = 0.5
+
+# 持续编辑时最多延迟多久必须写回(秒)
+DEFAULT_MAX_DELAY_SECONDS = 3.0
+
+# 最多缓存的工程数(只淘汰没有未写回改动的工程)
+DEFAULT_MAX_PROJECTS = 64
+
+# 检查数据库是否被其他连接修改的最短间隔(秒)
+DEFAULT_REVALIDATE_SECONDS = 1.0
+
+
+class _CacheEntry:
+    """单个工程的缓存状态"""
+
+    def __init__(self, project_id: str, project: DialogueProject, db_updated_at: Optional[str]):
+        self.lock = threading.RLock()
+        self.project_id = project_id
+        self.project = project
+        # 已被新加载的缓存项取代(持有旧引用的调用方需要重新获取)
+        self.stale = False
+        # 数据库中的版本(用于识别外部修改)
+        self.db_updated_at = db_updated_at
+        # 数据库被其他连接写入后置为False,下次访问时核对 updated_at
+        self.verified = True
+        self.line_index = {line.id: i for i, line in enumerate(project.dialogues)}
+        self.speaker_index = {speaker.id: i for i, speaker in enumerate(project.speakers)}
+
+        # 未写回的改动: ID -> 合并后的修改字段
+        self.dirty_lines: Dict[str, dict] = {}
+        self.dirty_speakers: Dict[str, dict] = {}
+        self.dirty_fields: dict = {}
+        self.first_dirty: Optional[float] = None
+        self.last_dirty: Optional[float] = None
+
+    @property
+    def dirty(self) -> bool:
+        return self.first_dirty is not None
+
+    def mark_dirty(self):
+        now = time.monotonic()
+        if self.first_dirty is None:
+            self.first_dirty = now
+        self.last_dirty = now
+
+    def clear_dirty(self):
+        self.dirty_lines = {}
+        self.dirty_speakers = {}
+        self.dirty_fields = {}
+        self.first_dirty = None
+        self.last_dirty = None
+
+
+class ProjectCache:
+    """工程写回缓存,接口与 ProjectStore 一致"""
+
+    def __init__(self, store: ProjectStore,
+                 debounce: float = DEFAULT_DEBOUNCE_SECONDS,
+                 max_delay: float = DEFAULT_MAX_DELAY_SECONDS,
+                 max_projects: int = DEFAULT_MAX_PROJECTS,
+                 revalidate_interval: float = DEFAULT_REVALIDATE_SECONDS):
+        """
+        初始化
+        :param store: 底层工程存储
+        :param debounce: 最后一次编辑后的写回延迟(秒)
+        :param max_delay: 持续编辑时的最长写回延迟(秒)
+        :param max_projects: 最多缓存的工程数
+        :param revalidate_interval: 检查外部修改的最短间隔(秒),0表示每次访问都检查
+        """
+        self.store = store
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.max_projects = max_projects
+        self.revalidate_interval = revalidate_interval
+        self._data_version: Optional[int] = None
+        self._checked_at = float("-inf")
+
+        self._entries: "OrderedDict[str, _CacheEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._closed = False
+        self._flusher = threading.Thread(target=self._flush_loop, name="project-flush", daemon=True)
+        self._flusher.start()
+
+    # ---- 读取 ----
+
+    def exists(self, project_id: str) -> bool:
+        return self._entry(project_id) is not None
+
+    def get(self, project_id: str) -> Optional[DialogueProject]:
+        """
+        返回工程的只读快照(不复制;之后的编辑不影响已返回的快照)
+        调用方不得修改快照,需要修改时(如生成时写入audio_file)使用 checkout
+        """
+        with self._locked(project_id) as entry:
+            return entry.project if entry else None
+
+    def checkout(self, project_id: str) -> Optional[DialogueProject]:
+        """返回工程的独立副本(可在生成线程中修改,不影响缓存)"""
+        with self._locked(project_id) as entry:
+            return entry.project.model_copy(deep=True) if entry else None
+
+    def get_data(self, project_id: str) -> Optional[dict]:
+        with self._locked(project_id) as entry:
+            return entry.project.model_dump() if entry else None
+
+    def get_updated_at(self, project_id: str) -> Optional[str]:
+        with self._locked(project_id) as entry:
+            return entry.project.updated_at if entry else None
+
+    def list_summaries(self, flush: bool = True, **filters) -> List[dict]:
+        """
+        返回工程摘要列表,其余参数见 ProjectStore.list_summaries
+        :param flush: 是否先写回未保存的改动(保证更新时间准确);刚调用过 listing_version 时可跳过
+        """
+        if flush:
+            self.flush()
+        return self.store.list_summaries(**filters)
+
+    def listing_version(self) -> str:
+        """写回未保存的改动后返回数据版本号"""
+        self.flush()
+        return self.store.listing_version()
+
+    # ---- 写入 ----
+
+    def save(self, project_id: str, project: DialogueProject):
+        """保存整个工程(直接写入数据库,丢弃旧的缓存和未写回改动)"""
+        self._discard(project_id)
+        self.store.save(project_id, project)
+
+    def delete(self, project_id: str) -> bool:
+        self._discard(project_id)
+        return self.store.delete(project_id)
+
+    def update_line(self, project_id: str, line_id: str, updates: dict) -> Optional[DialogueLine]:
+        """
+        修改单句对话(只改内存,稍后写回)
+        :return: 更新后的对话,工程或对话不存在时返回None
+        """
+        return self.update_lines(project_id, {line_id: updates}).get(line_id)
+
+    def update_lines(self, project_id: str, updates: Dict[str, dict]) -> Dict[str, DialogueLine]:
+        """
+        修改多句对话,全部校验通过后才生效
+        :return: 对话行ID -> 更新后的对话(不存在的行不在结果中)
+        """
+        with self._locked(project_id) as entry:
+            if entry is None:
+                return {}
+            updated = {}
+            for line_id, fields in updates.items():
+                index = entry.line_index.get(line_id)
+                if index is None:
+                    continue
+                current = updated.get(line_id) or entry.project.dialogues[index]
+                updated[line_id] = DialogueLine(**{**current.model_dump(), **fields, "id": line_id})
+
+            if updated:
+                dialogues = list(entry.project.dialogues)
+                for line_id, line in updated.items():
+                    dialogues[entry.line_index[line_id]] = line
+                    entry.dirty_lines.setdefault(line_id, {}).update(updates[line_id])
+                self._touch(project_id, entry, dialogues=dialogues)
+        return updated
+
+    def update_speaker(self, project_id: str, speaker_id: str, updates: dict) -> Optional[Speaker]:
+        """
+        修改说话人(只改内存,稍后写回)
+        :return: 更新后的说话人,工程或说话人不存在时返回None
+        """
+        with self._locked(project_id) as entry:
+            if entry is None:
+                return None
+            index = entry.speaker_index.get(speaker_id)
+            if index is None:
+                return None
+            speaker = Speaker(**{**entry.project.speakers[index].model_dump(), **updates, "id": speaker_id})
+            speakers = list(entry.project.speakers)
+            speakers[index] = speaker
+            entry.dirty_speakers.setdefault(speaker_id, {}).update(updates)
+            self._touch(project_id, entry, speakers=speakers)
+        return speaker
+
+    def update_project(self, project_id: str, **fields) -> bool:
+        """
+        修改工程字段(如 output_audio)
+        :return: 工程是否存在
+        """
+        unknown = set(fields) - set(PROJECT_FIELDS)
+        if unknown:
+            raise ValueError(f"未知的工程字段: {', '.join(sorted(unknown))}")
+
+        with self._locked(project_id) as entry:
+            if entry is None:
+                return False
+            entry.dirty_fields.update(fields)
+            self._touch(project_id, entry, **fields)
+        return True
+
+    # ---- 写回 ----
+
+    def flush(self, project_id: Optional[str] = None):
+        """
+        立即写回未保存的改动
+        :param project_id: 工程ID,为空时写回全部工程
+        """
+        with self._lock:
+            if project_id is None:
+                entries = list(self._entries.values())
+            else:
+                entries = [self._entries[project_id]] if project_id in self._entries else []
+        for entry in entries:
+            self._flush_entry(entry)
+
+    def close(self):
+        """停止后台写回线程并写回全部改动(服务关闭时调用)"""
+        with self._wakeup:
+            self._closed = True
+            self._wakeup.notify()
+        self._flusher.join()
+        self.flush()
+
+    # ---- 内部 ----
+
+    @contextmanager
+    def _locked(self, project_id: str) -> Iterator[Optional[_CacheEntry]]:
+        """取得缓存项并持有其锁;工程不存在时得到None"""
+        while True:
+            entry = self._entry(project_id)
+            if entry is None:
+                yield None
+                return
+            with entry.lock:
+                if entry.stale:
+                    continue
+                yield entry
+                return
+
+    def _entry(self, project_id: str) -> Optional[_CacheEntry]:
+        """取得缓存项,未缓存或数据库已被外部修改时(重新)加载"""
+        with self._lock:
+            entry = self._entries.get(project_id)
+            if entry is not None:
+                self._entries.move_to_end(project_id)
+
+        if entry is None:
+            return self._load(project_id)
+
+        self._check_external_writes()
+        if entry.verified:
+            return entry
+
+        db_updated_at = self.store.get_updated_at(project_id)
+        with entry.lock:
+            if entry.stale or db_updated_at == entry.db_updated_at:
+                entry.verified = True
+                return entry
+            # 外部修改: 先写回本地改动(按字段合并),再从数据库重新加载
+            self._flush_entry(entry)
+            entry.stale = True
+            return self._load(project_id)
+
+    def _check_external_writes(self):
+        """按间隔检查数据库是否被其他连接写入过,写入过时各缓存项在下次访问时核对更新时间"""
+        now = time.monotonic()
+        with self._lock:
+            if now - self._checked_at < self.revalidate_interval:
+                return
+            self._checked_at = now
+        version = self.store.data_version()
+        with self._lock:
+            if version != self._data_version:
+                self._data_version = version
+                for entry in self._entries.values():
+                    entry.verified = False
+
+    def _load(self, project_id: str) -> Optional[_CacheEntry]:
+        project = self.store.get(project_id)
+        with self._lock:
+            if project is None:
+                self._entries.pop(project_id, None)
+                return None
+            fresh = _CacheEntry(project_id, project, project.updated_at)
+            self._entries[project_id] = fresh
+            self._evict()
+        return fresh
+
+    def _discard(self, project_id: str):
+        """移除缓存项并丢弃其未写回的改动"""
+        with self._lock:
+            entry = self._entries.pop(project_id, None)
+        if entry is not None:
+            with entry.lock:
+                entry.stale = True
+                entry.clear_dirty()
+
+    def _touch(self, project_id: str, entry: _CacheEntry, **changes):
+        """
+        应用改动并安排写回(调用方持有entry.lock)
+        写时复制: 替换为新的工程对象,已返回给调用方的快照不受影响
+        :param changes: 要替换的工程字段(dialogues/speakers 为新列表)
+        """
+        updated_at = datetime.now().isoformat()
+        entry.project = entry.project.model_copy(update={**changes, "updated_at": updated_at})
+        entry.dirty_fields["updated_at"] = updated_at
+        entry.mark_dirty()
+        with self._wakeup:
+            self._wakeup.notify()
+
+    def _flush_entry(self, entry: _CacheEntry):
+        with entry.lock:
+            if not entry.dirty:
+                return
+            try:
+                db_updated_at = self.store.apply_changes(
+                    entry.project_id, entry.dirty_lines, entry.dirty_speakers, entry.dirty_fields
+                )
+            except Exception as e:
+                print(f"⚠️ 工程写回失败 {entry.project_id}: {e}")
+                return
+            entry.db_updated_at = db_updated_at
+            entry.clear_dirty()
+
+    def _evict(self):
+        """淘汰最久未使用且没有未写回改动的工程(调用方持有self._lock)"""
+        overflow = len(self._entries) - self.max_projects
+        for project_id in list(self._entries):
+            if overflow <= 0:
+                break
+            if not self._entries[project_id].dirty:
+                del self._entries[project_id]
+                overflow -= 1
+
+    def _due_entries(self, now: float) -> Tuple[List[_CacheEntry], Optional[float]]:
+        """返回到期需要写回的工程,以及下一个到期时间(调用方持有self._lock)"""
+        due, next_deadline = [], None
+        for entry in self._entries.values():
+            first, last = entry.first_dirty, entry.last_dirty
+            if first is None or last is None:
+                continue
+            deadline = min(last + self.debounce, first + self.max_delay)
+            if deadline <= now:
+                due.append(entry)
+            elif next_deadline is None or deadline < next_deadline:
+                next_deadline = deadline
+        return due, next_deadline
+
+    def _flush_loop(self):
+        while True:
+            with self._wakeup:
+                if self._closed:
+                    return
+                due, next_deadline = self._due_entries(time.monotonic())
+                if not due:
+                    timeout = None if next_deadline is None else max(0.0, next_deadline - time.monotonic())
+                    self._wakeup.wait(timeout)
+                    continue
+            for entry in due:
+                self._flush_entry(entry)
@@ -1,6 +1,8 @@
 """
 对话TTS工程文件的数据模型定义
 """
+import hashlib
+import json
 from typing import List, Optional, Literal
 from pydantic import BaseModel, Field
 from tts_config import (
@@ -37,7 +39,36 @@ class DialogueLine(BaseModel):
     
     # 音频输出
     audio_file: Optional[str] = Field(default=None, description="生成的音频文件路径")
+    content_hash: Optional[str] = Field(default=None, description="audio_file在音频存储中的键(合成参数哈希,重新合成的版本带后缀)")
     duration: Optional[float] = Field(default=None, description="音频时长(秒)")
+    
+    def render_hash(self, voice_type: str, **render_params) -> str:
+        """
+        计算影响合成结果的全部参数的哈希
+        :param voice_type: 说话人音色
+        :param render_params: 其他合成参数(采样率、格式等)
+        :return: 十六进制哈希字符串
+        """
+        payload = {
+            "text": self.text,
+            "voice_type": voice_type,
+            "emotion": self.emotion,
+            "speed_ratio": self.speed_ratio,
+            "volume_ratio": self.volume_ratio,
+            "pitch_ratio": self.pitch_ratio,
+            "context": self.context,
+            **render_params,
+        }
+        encoded = json.dumps(payload, ensure_ascii=False, sort_keys=True).encode("utf-8")
+        return hashlib.sha256(encoded).hexdigest()
+    
+    def rendered_from(self, render_hash: str) -> bool:
+        """
+        现有音频是否按该参数哈希合成
+        强制重新合成的版本以 "参数哈希-版本号" 存储(不覆盖其他工程共用的音频),同样视为一致
+        :param render_hash: 当前参数的 render_hash
+        """
+        return bool(self.content_hash) and self.content_hash.split("-", 1)[0] == render_hash
 
 
 class DialogueProject(BaseModel):
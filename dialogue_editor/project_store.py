@@ -0,0 +1,456 @@
+"""
+工程存储 - SQLite
+工程、说话人、对话分表存储,按(工程ID, 行ID)主键直接定位单句对话,
+修改单句/单个说话人时只更新对应的行,每次写入都在一个事务中完成。
+仍支持与原 projects/{id}.json 工程文件互相导入导出
+"""
+import base64
+import json
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Union
+
+from project_schema import DialogueLine, DialogueProject, Speaker
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS projects (
+    id TEXT PRIMARY KEY,
+    version TEXT NOT NULL,
+    title TEXT NOT NULL,
+    original_text TEXT NOT NULL,
+    output_audio TEXT,
+    created_at TEXT,
+    updated_at TEXT,
+    line_count INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_projects_updated ON projects (updated_at, id);
+
+CREATE TABLE IF NOT EXISTS speakers (
+    project_id TEXT NOT NULL REFERENCES projects (id) ON DELETE CASCADE,
+    id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (project_id, id)
+);
+
+CREATE TABLE IF NOT EXISTS lines (
+    project_id TEXT NOT NULL REFERENCES projects (id) ON DELETE CASCADE,
+    id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (project_id, id)
+);
+CREATE INDEX IF NOT EXISTS idx_lines_position ON lines (project_id, position);
+
+CREATE TABLE IF NOT EXISTS audio_refs (
+    project_id TEXT NOT NULL REFERENCES projects (id) ON DELETE CASCADE,
+    line_id TEXT NOT NULL,
+    content_hash TEXT NOT NULL,
+    PRIMARY KEY (project_id, line_id)
+);
+CREATE INDEX IF NOT EXISTS idx_audio_refs_hash ON audio_refs (content_hash);
+"""
+
+# 可通过 update_project 直接修改的工程字段
+PROJECT_FIELDS = ("version", "title", "original_text", "output_audio", "created_at", "updated_at")
+
+
+def encode_cursor(updated_at: str, project_id: str) -> str:
+    """把列表位置(最后一项的更新时间和ID)编码为分页游标"""
+    raw = json.dumps([updated_at, project_id], ensure_ascii=False).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[str, str]:
+    """
+    解码分页游标
+    :raises ValueError: 游标无效
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        updated_at, project_id = json.loads(raw)
+    except Exception:
+        raise ValueError("无效的分页游标")
+    return str(updated_at), str(project_id)
+
+
+class ProjectStore:
+    """基于SQLite的工程存储"""
+
+    def __init__(self, db_path: Union[str, Path] = "projects/projects.db"):
+        """
+        初始化
+        :param db_path: 数据库文件路径
+        """
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+
+        # 单连接 + 锁,可在线程池中安全调用
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.RLock()
+        # 本连接的写入次数,与 data_version 一起作为列表的版本号
+        self.revision = 0
+
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute("PRAGMA foreign_keys=ON")
+            self._conn.executescript(SCHEMA)
+            # 分页按 (updated_at, id) 排序,补齐旧数据中为空的更新时间
+            with self._conn:
+                self._conn.execute(
+                    "UPDATE projects SET updated_at = COALESCE(created_at, '') WHERE updated_at IS NULL"
+                )
+                # 补齐音频引用(旧数据库中没有 audio_refs 表)
+                self._conn.execute(
+                    "INSERT OR IGNORE INTO audio_refs (project_id, line_id, content_hash) "
+                    "SELECT project_id, id, json_extract(data, '$.content_hash') FROM lines "
+                    "WHERE json_extract(data, '$.content_hash') IS NOT NULL "
+                    "AND json_extract(data, '$.audio_file') IS NOT NULL"
+                )
+
+    # ---- 整个工程 ----
+
+    def exists(self, project_id: str) -> bool:
+        with self._lock:
+            row = self._conn.execute("SELECT 1 FROM projects WHERE id = ?", (project_id,)).fetchone()
+        return row is not None
+
+    def save(self, project_id: str, project: DialogueProject):
+        """
+        保存(覆盖)整个工程
+        :param project_id: 工程ID
+        :param project: 工程对象
+        """
+        with self._write():
+            self._conn.execute(
+                "INSERT INTO projects "
+                "(id, version, title, original_text, output_audio, created_at, updated_at, line_count) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (id) DO UPDATE SET version = excluded.version, title = excluded.title, "
+                "original_text = excluded.original_text, output_audio = excluded.output_audio, "
+                "created_at = excluded.created_at, updated_at = excluded.updated_at, "
+                "line_count = excluded.line_count",
+                (project_id, project.version, project.title, project.original_text, project.output_audio,
+                 project.created_at, project.updated_at or project.created_at or datetime.now().isoformat(),
+                 len(project.dialogues))
+            )
+            self._conn.execute("DELETE FROM speakers WHERE project_id = ?", (project_id,))
+            self._conn.execute("DELETE FROM lines WHERE project_id = ?", (project_id,))
+            self._conn.execute("DELETE FROM audio_refs WHERE project_id = ?", (project_id,))
+            self._conn.executemany(
+                "INSERT INTO speakers (project_id, id, position, data) VALUES (?, ?, ?, ?)",
+                [(project_id, s.id, i, self._dumps(s.model_dump())) for i, s in enumerate(project.speakers)]
+            )
+            self._conn.executemany(
+                "INSERT INTO lines (project_id, id, position, data) VALUES (?, ?, ?, ?)",
+                [(project_id, d.id, i, self._dumps(d.model_dump())) for i, d in enumerate(project.dialogues)]
+            )
+            self._conn.executemany(
+                "INSERT INTO audio_refs (project_id, line_id, content_hash) VALUES (?, ?, ?)",
+                [(project_id, d.id, d.content_hash) for d in project.dialogues if d.audio_file and d.content_hash]
+            )
+
+    def get_data(self, project_id: str) -> Optional[dict]:
+        """
+        读取工程数据(与JSON工程文件结构相同)
+        :return: 工程字典,不存在时返回None
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM projects WHERE id = ?", (project_id,)).fetchone()
+            if row is None:
+                return None
+            speakers = self._conn.execute(
+                "SELECT data FROM speakers WHERE project_id = ? ORDER BY position", (project_id,)
+            ).fetchall()
+            lines = self._conn.execute(
+                "SELECT data FROM lines WHERE project_id = ? ORDER BY position", (project_id,)
+            ).fetchall()
+
+        data = {field: row[field] for field in PROJECT_FIELDS}
+        data["speakers"] = [json.loads(s["data"]) for s in speakers]
+        data["dialogues"] = [json.loads(d["data"]) for d in lines]
+        return data
+
+    def get(self, project_id: str) -> Optional[DialogueProject]:
+        """读取工程对象,不存在时返回None"""
+        data = self.get_data(project_id)
+        return DialogueProject(**data) if data is not None else None
+
+    def delete(self, project_id: str) -> bool:
+        with self._write():
+            cursor = self._conn.execute("DELETE FROM projects WHERE id = ?", (project_id,))
+        return cursor.rowcount > 0
+
+    def update_project(self, project_id: str, **fields) -> bool:
+        """
+        更新工程字段(如 output_audio),同时刷新 updated_at
+        :return: 工程是否存在
+        """
+        unknown = set(fields) - set(PROJECT_FIELDS)
+        if unknown:
+            raise ValueError(f"未知的工程字段: {', '.join(sorted(unknown))}")
+
+        fields.setdefault("updated_at", datetime.now().isoformat())
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self._write():
+            cursor = self._conn.execute(
+                f"UPDATE projects SET {assignments} WHERE id = ?", (*fields.values(), project_id)
+            )
+        return cursor.rowcount > 0
+
+    # ---- 单句对话 / 说话人 ----
+
+    def get_line(self, project_id: str, line_id: str) -> Optional[DialogueLine]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data FROM lines WHERE project_id = ? AND id = ?", (project_id, line_id)
+            ).fetchone()
+        return DialogueLine(**json.loads(row["data"])) if row else None
+
+    def update_line(self, project_id: str, line_id: str, updates: dict) -> Optional[DialogueLine]:
+        """
+        部分更新单句对话(校验后写入)
+        :param project_id: 工程ID
+        :param line_id: 对话行ID
+        :param updates: 要修改的字段
+        :return: 更新后的对话,不存在时返回None
+        """
+        return self.update_lines(project_id, {line_id: updates}).get(line_id)
+
+    def update_lines(self, project_id: str, updates: Dict[str, dict]) -> Dict[str, DialogueLine]:
+        """
+        在一个事务中部分更新多句对话,任意一句校验失败时全部不生效
+        :param project_id: 工程ID
+        :param updates: 对话行ID -> 要修改的字段
+        :return: 对话行ID -> 更新后的对话(不存在的行不在结果中)
+        """
+        updated = {}
+        with self._write():
+            for line_id, fields in updates.items():
+                line = self._merge_row("lines", DialogueLine, project_id, line_id, fields)
+                if line is not None:
+                    updated[line_id] = line
+            if updated:
+                self._touch(project_id)
+        return updated
+
+    def get_speaker(self, project_id: str, speaker_id: str) -> Optional[Speaker]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data FROM speakers WHERE project_id = ? AND id = ?", (project_id, speaker_id)
+            ).fetchone()
+        return Speaker(**json.loads(row["data"])) if row else None
+
+    def update_speaker(self, project_id: str, speaker_id: str, updates: dict) -> Optional[Speaker]:
+        """
+        部分更新说话人(校验后写入)
+        :return: 更新后的说话人,不存在时返回None
+        """
+        with self._write():
+            speaker = self._merge_row("speakers", Speaker, project_id, speaker_id, updates)
+            if speaker is not None:
+                self._touch(project_id)
+        return speaker
+
+    def get_updated_at(self, project_id: str) -> Optional[str]:
+        """读取工程更新时间(用于判断缓存是否被外部修改),不存在时返回None"""
+        with self._lock:
+            row = self._conn.execute("SELECT updated_at FROM projects WHERE id = ?", (project_id,)).fetchone()
+        return row["updated_at"] if row else None
+
+    def apply_changes(self, project_id: str, lines: Optional[Dict[str, dict]] = None,
+                      speakers: Optional[Dict[str, dict]] = None,
+                      fields: Optional[dict] = None) -> Optional[str]:
+        """
+        在一个事务中写入对话、说话人和工程字段的部分修改
+        :param project_id: 工程ID
+        :param lines: 对话行ID -> 要修改的字段
+        :param speakers: 说话人ID -> 要修改的字段
+        :param fields: 工程字段
+        :return: 写入后的 updated_at,工程不存在时返回None
+        """
+        with self._write():
+            if not self.exists(project_id):
+                return None
+            for line_id, updates in (lines or {}).items():
+                self._merge_row("lines", DialogueLine, project_id, line_id, updates)
+            for speaker_id, updates in (speakers or {}).items():
+                self._merge_row("speakers", Speaker, project_id, speaker_id, updates)
+
+            fields = dict(fields or {})
+            fields.setdefault("updated_at", datetime.now().isoformat())
+            unknown = set(fields) - set(PROJECT_FIELDS)
+            if unknown:
+                raise ValueError(f"未知的工程字段: {', '.join(sorted(unknown))}")
+            assignments = ", ".join(f"{name} = ?" for name in fields)
+            self._conn.execute(
+                f"UPDATE projects SET {assignments} WHERE id = ?", (*fields.values(), project_id)
+            )
+        return fields["updated_at"]
+
+    # ---- 列表 ----
+
+    def list_summaries(self, limit: Optional[int] = None, cursor: Optional[Tuple[str, str]] = None,
+                       title: Optional[str] = None, updated_after: Optional[str] = None,
+                       updated_before: Optional[str] = None) -> List[dict]:
+        """
+        返回工程摘要列表(按更新时间倒序),不读取说话人和对话
+        使用 (updated_at, id) 游标分页,每页只扫描索引中的一段
+        :param limit: 最多返回的条数,为空时返回全部
+        :param cursor: 上一页最后一项的 (updated_at, id)
+        :param title: 标题包含的文字
+        :param updated_after: 只返回此时间(含)之后更新的工程(ISO格式)
+        :param updated_before: 只返回此时间之前更新的工程(ISO格式)
+        :return: 摘要列表
+        """
+        conditions, params = [], []
+        if cursor is not None:
+            conditions.append("(updated_at, id) < (?, ?)")
+            params.extend(cursor)
+        if title:
+            conditions.append("title LIKE ? ESCAPE '\\'")
+            escaped = title.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            params.append(f"%{escaped}%")
+        if updated_after:
+            conditions.append("updated_at >= ?")
+            params.append(updated_after)
+        if updated_before:
+            conditions.append("updated_at < ?")
+            params.append(updated_before)
+
+        sql = "SELECT id, title, created_at, updated_at, line_count FROM projects"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY updated_at DESC, id DESC"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [dict(row) for row in rows]
+
+    def listing_version(self) -> str:
+        """
+        数据版本号,任何写入(包括其他进程)后都会变化,用于生成列表的ETag
+        """
+        return f"{self.revision}-{self.data_version()}"
+
+    def data_version(self) -> int:
+        """其他连接(进程)提交写入后变化的版本号,本连接的写入不改变它"""
+        with self._lock:
+            return self._conn.execute("PRAGMA data_version").fetchone()[0]
+
+    # ---- 音频引用 ----
+
+    def audio_ref_counts(self) -> Dict[str, int]:
+        """返回每个音频内容哈希被多少句对话引用"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT content_hash, COUNT(*) AS refs FROM audio_refs GROUP BY content_hash"
+            ).fetchall()
+        return {row["content_hash"]: row["refs"] for row in rows}
+
+    # ---- JSON导入导出 ----
+
+    def import_json(self, project_file: Union[str, Path], project_id: Optional[str] = None) -> str:
+        """
+        导入JSON工程文件
+        :param project_file: 工程文件路径
+        :param project_id: 工程ID,默认取文件名
+        :return: 工程ID
+        """
+        project_file = Path(project_file)
+        with open(project_file, "r", encoding="utf-8") as f:
+            project = DialogueProject(**json.load(f))
+        project_id = project_id or project_file.stem
+        self.save(project_id, project)
+        return project_id
+
+    def import_json_dir(self, directory: Union[str, Path]) -> int:
+        """
+        导入目录中尚未入库的JSON工程文件(启动时迁移旧数据)
+        :return: 导入的工程数
+        """
+        imported = 0
+        for project_file in sorted(Path(directory).glob("*.json")):
+            if self.exists(project_file.stem):
+                continue
+            try:
+                self.import_json(project_file)
+                imported += 1
+            except Exception as e:
+                print(f"⚠️ 跳过无法导入的工程文件 {project_file.name}: {e}")
+        return imported
+
+    def export_json(self, project_id: str, project_file: Union[str, Path]) -> bool:
+        """
+        导出为JSON工程文件
+        :return: 工程是否存在
+        """
+        data = self.get_data(project_id)
+        if data is None:
+            return False
+        with open(project_file, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        return True
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    # ---- 内部 ----
+
+    def _touch(self, project_id: str):
+        """刷新工程更新时间(调用方持有锁并处于事务中)"""
+        self._conn.execute(
+            "UPDATE projects SET updated_at = ? WHERE id = ?", (datetime.now().isoformat(), project_id)
+        )
+
+    def _merge_row(self, table: str, model, project_id: str, row_id: str, updates: dict):
+        """
+        把部分修改合并到一行数据并校验后写回(调用方持有锁并处于事务中)
+        :return: 更新后的模型对象,行不存在时返回None
+        """
+        row = self._conn.execute(
+            f"SELECT data FROM {table} WHERE project_id = ? AND id = ?", (project_id, row_id)
+        ).fetchone()
+        if row is None:
+            return None
+        item = model(**{**json.loads(row["data"]), **updates, "id": row_id})
+        self._conn.execute(
+            f"UPDATE {table} SET data = ? WHERE project_id = ? AND id = ?",
+            (self._dumps(item.model_dump()), project_id, row_id)
+        )
+        if table == "lines":
+            self._sync_audio_ref(project_id, item)
+        return item
+
+    def _sync_audio_ref(self, project_id: str, line: DialogueLine):
+        """按对话当前的音频更新引用记录(调用方持有锁并处于事务中)"""
+        if line.audio_file and line.content_hash:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO audio_refs (project_id, line_id, content_hash) VALUES (?, ?, ?)",
+                (project_id, line.id, line.content_hash)
+            )
+        else:
+            self._conn.execute(
+                "DELETE FROM audio_refs WHERE project_id = ? AND line_id = ?", (project_id, line.id)
+            )
+
+    @contextmanager
+    def _write(self):
+        """写事务: 持有锁,成功提交后递增版本号"""
+        with self._lock:
+            with self._conn:
+                yield
+            self.revision += 1
+
+    @staticmethod
+    def _dumps(data: dict) -> str:
+        return json.dumps(data, ensure_ascii=False, separators=(",", ":"))
@@ -0,0 +1,245 @@
+"""
+基于规则的剧本解析器
+已经标注了说话人的文本(如 `小明: 你好`、`【小红】你好`、`[旁白] 很久以前`)不需要调用LLM,
+逐行匹配即可得到说话人和对话,按名称词典推断性别和年龄段。
+无法可靠解析的文本(无标注的散文、匹配率低)返回None,由调用方交给LLM分析
+"""
+import os
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+from tts_config import CHINESE_EMOTION_NAMES, get_voice_type
+
+# 规则解析结果的最低置信度,低于此值时交给LLM分析
+MIN_CONFIDENCE = float(os.getenv("SCRIPT_PARSER_MIN_CONFIDENCE", "0.8"))
+
+# 规则解析支持的最多说话人数(更多通常说明匹配到的不是说话人)
+MAX_SPEAKERS = 8
+
+# 说话人名称: 不含空白、标点和括号,最长12个字符
+_NAME = r"[^\s:：【】\[\]()（）「」『』“”\"'，,。.!！?？;；、]{1,12}"
+
+# 名称后的舞台提示,如 `小明(笑): ...`
+_DIRECTION = r"(?:\s*[(（](?P<direction>[^)）]{1,12})[)）])?"
+
+_LINE_PATTERNS = [
+    # 【小明】你好 / 【小明】: 你好
+    re.compile(rf"^【(?P<name>{_NAME})】{_DIRECTION}\s*[:：]?\s*(?P<text>.+)$"),
+    # [小明] 你好 / [小明]: 你好
+    re.compile(rf"^\[(?P<name>{_NAME})\]{_DIRECTION}\s*[:：]?\s*(?P<text>.+)$"),
+    # 小明: 你好 / 小明：你好 / 小明(笑): 你好 (冒号后紧跟 // 的是URL,如 `http://...`)
+    re.compile(rf"^(?P<name>{_NAME}){_DIRECTION}\s*[:：](?!//)\s*(?P<text>.+)$"),
+]
+
+# 单独成行的舞台提示,如 `(两人沉默)`,不计入对话也不影响置信度
+_STAGE_LINE = re.compile(r"^[(（].*[)）]$")
+
+# 对话开头的舞台提示,如 `小明: (叹气)算了`
+_LEADING_DIRECTION = re.compile(r"^[(（](?P<direction>[^)）]{1,12})[)）]\s*")
+
+# 包裹整句的引号
+_QUOTES = {"“": "”", "「": "」", "『": "』", "\"": "\""}
+
+# 不会是说话人的名称(如 `注意: ...`、`时间: ...`)
+_NON_SPEAKERS = {"注意", "备注", "说明", "提示", "时间", "地点", "场景", "第一幕", "第二幕", "第三幕", "Note", "Scene"}
+
+# 按称谓/身份推断性别(按名称中是否包含关键词判断,先匹配的优先)
+_GENDER_KEYWORDS: List[Tuple[str, str]] = [
+    (kw, "female") for kw in (
+        "女士", "小姐", "妈", "母亲", "奶奶", "外婆", "姥姥", "姐", "妹", "阿姨", "姑", "婶", "嫂",
+        "女", "公主", "王后", "皇后", "老婆", "妻", "夫人", "太太", "媳妇", "闺蜜",
+    )
+] + [
+    (kw, "male") for kw in (
+        "先生", "爸", "父亲", "爷爷", "外公", "姥爷", "哥", "弟", "叔", "伯", "舅", "男",
+        "王子", "国王", "皇帝", "老公", "丈夫", "儿子", "少爷", "公子", "大爷", "老爷",
+    )
+]
+
+# 英文称谓
+_ENGLISH_GENDER = {
+    "mr": "male", "sir": "male", "mister": "male", "king": "male", "prince": "male",
+    "mrs": "female", "ms": "female", "miss": "female", "madam": "female", "queen": "female", "princess": "female",
+}
+
+# 常见名字用字(取名称最后一个字判断)
+_FEMALE_CHARS = set("芳娜丽婷静敏燕玲娟霞梅琳雪慧萍红月莉美琴倩璐婉妍怡嫣晶欣薇蕾颖丹花兰凤秀珍莹")
+_MALE_CHARS = set("伟强磊军勇杰涛斌超明刚辉鹏飞鑫波宇浩凯健俊帆帅旭龙峰建国东亮成彪虎雄武")
+
+# 常见英文名
+_ENGLISH_NAMES = {
+    "tom": "male", "jack": "male", "john": "male", "mike": "male", "david": "male", "james": "male",
+    "peter": "male", "bob": "male", "sam": "male", "harry": "male", "ben": "male", "paul": "male",
+    "mary": "female", "lucy": "female", "lily": "female", "alice": "female", "emma": "female", "anna": "female",
+    "linda": "female", "amy": "female", "kate": "female", "sarah": "female", "jane": "female", "lisa": "female",
+}
+
+# 按称谓推断年龄段
+_AGE_KEYWORDS: List[Tuple[str, str]] = [
+    (kw, "elder") for kw in ("爷爷", "奶奶", "外公", "外婆", "姥姥", "姥爷", "老爷", "老太", "老人", "大爷", "大妈", "老奶奶", "老头")
+] + [
+    (kw, "child") for kw in ("宝宝", "孩子", "小孩", "儿童", "小朋友", "男孩", "女孩", "娃")
+] + [
+    (kw, "teenager") for kw in ("少年", "少女", "学生", "同学", "小伙", "姑娘")
+]
+
+# 舞台提示 -> 情感
+_DIRECTION_EMOTIONS: List[Tuple[str, str]] = [
+    ("笑", "开心"), ("高兴", "开心"), ("开心", "开心"), ("兴奋", "激动"), ("激动", "激动"),
+    ("哭", "悲伤"), ("难过", "悲伤"), ("伤心", "悲伤"), ("叹", "沮丧"), ("失望", "沮丧"),
+    ("怒", "生气"), ("生气", "生气"), ("吼", "生气"), ("惊", "惊讶"), ("怕", "恐惧"), ("颤抖", "恐惧"),
+    ("冷", "冷漠"), ("害羞", "害羞"), ("脸红", "害羞"), ("撒娇", "撒娇"), ("紧张", "紧张"),
+    ("温柔", "温柔"), ("轻声", "温柔"), ("安慰", "安慰"), ("厌恶", "厌恶"), ("嫌弃", "厌恶"),
+]
+
+
+class ScriptParser:
+    """剧本格式解析器,线性时间逐行匹配"""
+
+    def __init__(self, min_confidence: float = MIN_CONFIDENCE):
+        """
+        初始化
+        :param min_confidence: 接受解析结果的最低置信度(0-1)
+        """
+        self.min_confidence = min_confidence
+
+    def try_parse(self, text: str) -> Optional[Dict[str, Any]]:
+        """
+        尝试按剧本格式解析
+        :param text: 原始对话文本
+        :return: 与 DialogueAnalyzer.analyze_dialogue 相同结构的结果,置信度不足时返回None
+        """
+        result, confidence = self.parse(text)
+        if confidence < self.min_confidence:
+            return None
+        return result
+
+    def parse(self, text: str) -> Tuple[Dict[str, Any], float]:
+        """
+        逐行解析剧本
+        :param text: 原始对话文本
+        :return: (分析结果, 置信度);置信度为带说话人标注的行占全部对话行的比例,
+                 说话人超过 MAX_SPEAKERS 或只有一句对话时为0
+        """
+        speakers: Dict[str, Dict[str, Any]] = {}
+        dialogues: List[Dict[str, Any]] = []
+        unmatched = 0
+
+        for raw in text.splitlines():
+            line = raw.strip()
+            if not line or _STAGE_LINE.match(line):
+                continue
+            match = self._match(line)
+            if match is None:
+                unmatched += 1
+                continue
+
+            name, direction, content = match
+            speaker = speakers.get(name)
+            if speaker is None:
+                speaker = {"id": f"speaker_{len(speakers) + 1}", "name": name}
+                speakers[name] = speaker
+
+            dialogues.append({
+                "speaker_id": speaker["id"],
+                "text": content,
+                "emotion": self._emotion(direction),
+                "context": dialogues[-1]["text"] if dialogues else None,
+            })
+
+        result = {"speakers": self._assign_voices(list(speakers.values())), "dialogues": dialogues}
+
+        matched = len(dialogues)
+        if matched < 2 or len(speakers) > MAX_SPEAKERS:
+            return result, 0.0
+        return result, matched / (matched + unmatched)
+
+    @staticmethod
+    def _match(line: str) -> Optional[Tuple[str, Optional[str], str]]:
+        """匹配单行,返回 (说话人名称, 舞台提示, 对话文本)"""
+        for pattern in _LINE_PATTERNS:
+            m = pattern.match(line)
+            if m is None:
+                continue
+            name = m.group("name")
+            if name in _NON_SPEAKERS or name.isdigit():
+                return None
+
+            direction = m.group("direction")
+            content = m.group("text").strip()
+            leading = _LEADING_DIRECTION.match(content)
+            if leading:
+                direction = direction or leading.group("direction")
+                content = content[leading.end():]
+            content = _strip_quotes(content)
+            if not content:
+                return None
+            return name, direction, content
+        return None
+
+    @staticmethod
+    def _emotion(direction: Optional[str]) -> str:
+        if direction:
+            for keyword, emotion in _DIRECTION_EMOTIONS:
+                if keyword in direction and emotion in CHINESE_EMOTION_NAMES:
+                    return emotion
+        return "中性"
+
+    @staticmethod
+    def _assign_voices(speakers: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """推断性别和年龄段并分配音色;无法推断性别的说话人男女交替,使相邻说话人音色不同"""
+        alternate = ["male", "female"]
+        unknown = 0
+        for speaker in speakers:
+            gender, age_group = infer_gender(speaker["name"]), infer_age_group(speaker["name"])
+            if gender is None:
+                gender = alternate[unknown % 2]
+                unknown += 1
+            speaker["gender"] = gender
+            speaker["age_group"] = age_group
+            speaker["voice_type"] = get_voice_type(gender, age_group)
+        return speakers
+
+
+def infer_gender(name: str) -> Optional[str]:
+    """
+    按称谓和名字用字推断性别
+    :param name: 说话人名称
+    :return: "male"/"female",无法判断时返回None
+    """
+    for keyword, gender in _GENDER_KEYWORDS:
+        if keyword in name:
+            return gender
+
+    words = re.findall(r"[a-z]+", name.lower())
+    for word in words:
+        if word in _ENGLISH_GENDER:
+            return _ENGLISH_GENDER[word]
+        if word in _ENGLISH_NAMES:
+            return _ENGLISH_NAMES[word]
+
+    last = name[-1]
+    if last in _FEMALE_CHARS:
+        return "female"
+    if last in _MALE_CHARS:
+        return "male"
+    return None
+
+
+def infer_age_group(name: str) -> str:
+    """
+    按称谓推断年龄段
+    :param name: 说话人名称
+    :return: "child"/"teenager"/"adult"/"elder",默认adult
+    """
+    for keyword, age_group in _AGE_KEYWORDS:
+        if keyword in name:
+            return age_group
+    return "adult"
+
+
+def _strip_quotes(text: str) -> str:
+    """去掉包裹整句的引号"""
+    if len(text) >= 2 and _QUOTES.get(text[0]) == text[-1]:
+        return text[1:-1].strip()
+    return text
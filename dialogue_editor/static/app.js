@@ -28,6 +28,7 @@ const elements = {
     
     // 预览
     finalAudio: document.getElementById('finalAudio'),
+    finalWaveform: document.getElementById('finalWaveform'),
     downloadLink: document.getElementById('downloadLink'),
     backToEditBtn: document.getElementById('backToEditBtn'),
     
@@ -338,6 +339,8 @@ function renderDialogues(dialogues, speakers) {
                 
                 <textarea class="dialogue-text" data-field="text">${dialogue.text}</textarea>
                 
+                <canvas class="waveform" data-line-id="${dialogue.id}" hidden></canvas>
+                
                 <div class="dialogue-params">
                     <div class="param-group">
                         <label>情感</label>
@@ -375,6 +378,7 @@ function renderDialogues(dialogues, speakers) {
     }).join('');
     
     elements.dialoguesList.innerHTML = html;
+    prefetch.lineId = null;
     
     // 绑定对话编辑事件
     bindDialogueEvents();
@@ -404,6 +408,124 @@ function bindDialogueEvents() {
     document.querySelectorAll('.btn-regenerate').forEach(btn => {
         btn.addEventListener('click', handleRegenerateLine);
     });
+    
+    // 查看某句时预取其后的几句
+    document.querySelectorAll('.dialogue-item').forEach(item => {
+        item.addEventListener('focusin', () => schedulePrefetch(item.dataset.lineId));
+    });
+    
+    // 已生成音频的对话在滚动到可见区域时加载波形
+    waveformObserver.disconnect();
+    state.currentProject.dialogues
+        .filter(dialogue => dialogue.audio_file)
+        .forEach(dialogue => waveformObserver.observe(lineWaveform(dialogue.id)));
+}
+
+// 波形: 读取服务端预先计算的峰值(.peaks)绘制,不需要下载和解码音频
+const waveformObserver = new IntersectionObserver(entries => {
+    entries.filter(entry => entry.isIntersecting).forEach(entry => {
+        waveformObserver.unobserve(entry.target);
+        loadLineWaveform(entry.target.dataset.lineId);
+    });
+}, { rootMargin: '200px' });
+
+function lineWaveform(lineId) {
+    return document.querySelector(`canvas.waveform[data-line-id="${lineId}"]`);
+}
+
+function loadLineWaveform(lineId) {
+    const canvas = lineWaveform(lineId);
+    if (canvas) {
+        loadWaveform(canvas, `/api/projects/${state.currentProjectId}/line/${lineId}/peaks`);
+    }
+}
+
+async function loadWaveform(canvas, url) {
+    canvas.hidden = false;
+    const width = canvas.clientWidth || 600;
+    try {
+        const response = await fetch(`${url}?max_peaks=${width}`);
+        if (!response.ok) {
+            throw new Error(`HTTP ${response.status}`);
+        }
+        drawWaveform(canvas, parsePeaks(await response.arrayBuffer()));
+    } catch (error) {
+        canvas.hidden = true;
+        console.warn('加载波形失败:', error);
+    }
+}
+
+function parsePeaks(buffer) {
+    // 格式见 waveform_peaks.py: 文件头、级别表、各级 (最小值, 最大值) 的int16数组
+    const view = new DataView(buffer);
+    const magic = String.fromCharCode(...new Uint8Array(buffer, 0, 4));
+    if (magic !== 'PEAK') {
+        throw new Error('无效的峰值数据');
+    }
+    const levelCount = view.getUint16(6, true);
+    const samplesPerPeak = view.getUint32(20, true);
+    const count = view.getUint32(24, true);
+    const dataOffset = 20 + levelCount * 8;
+    return {
+        sampleRate: view.getUint32(8, true),
+        samplesPerPeak,
+        peaks: new Int16Array(buffer.slice(dataOffset, dataOffset + count * 4))
+    };
+}
+
+function drawWaveform(canvas, data) {
+    const ratio = window.devicePixelRatio || 1;
+    const width = canvas.clientWidth;
+    const height = canvas.clientHeight;
+    canvas.width = width * ratio;
+    canvas.height = height * ratio;
+    
+    const ctx = canvas.getContext('2d');
+    ctx.scale(ratio, ratio);
+    ctx.clearRect(0, 0, width, height);
+    ctx.fillStyle = getComputedStyle(document.documentElement).getPropertyValue('--primary-color');
+    
+    // 每个像素取对应范围内峰值的最小/最大值
+    const count = data.peaks.length / 2;
+    const middle = height / 2;
+    for (let x = 0; x < width; x++) {
+        const start = Math.floor(x * count / width);
+        const end = Math.max(start + 1, Math.floor((x + 1) * count / width));
+        let min = 0;
+        let max = 0;
+        for (let i = start; i < end && i < count; i++) {
+            min = Math.min(min, data.peaks[i * 2]);
+            max = Math.max(max, data.peaks[i * 2 + 1]);
+        }
+        const top = middle - (max / 32768) * middle;
+        const bottom = middle - (min / 32768) * middle;
+        ctx.fillRect(x, top, 1, Math.max(1, bottom - top));
+    }
+}
+
+// 推测预取: 焦点停留片刻后请求服务端以低优先级提前合成后面的对话
+const prefetch = {
+    timer: null,
+    lineId: null
+};
+
+function schedulePrefetch(lineId) {
+    if (lineId === prefetch.lineId) {
+        return;
+    }
+    prefetch.lineId = lineId;
+    clearTimeout(prefetch.timer);
+    prefetch.timer = setTimeout(async () => {
+        try {
+            await fetch(`/api/projects/${state.currentProjectId}/prefetch`, {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({ line_id: lineId })
+            });
+        } catch (error) {
+            console.warn('预取失败:', error);
+        }
+    }, 500);
 }
 
 // 处理对话更新
@@ -431,11 +553,126 @@ async function handleDialogueUpdate(event) {
         
         console.log(`✅ 已更新 ${field}: ${value}`);
         
+        // 试听修改后的效果
+        requestLinePreview(lineId);
+        
     } catch (error) {
         showError('更新失败: ' + error.message);
     }
 }
 
+// 实时预览: 通过WebSocket边接收PCM块边用Web Audio播放
+const preview = {
+    socket: null,
+    projectId: null,
+    context: null,
+    format: null,
+    playhead: 0,
+    remainder: null,
+    sources: []
+};
+
+function connectPreview() {
+    const reusable = preview.socket
+        && preview.projectId === state.currentProjectId
+        && preview.socket.readyState <= WebSocket.OPEN;
+    if (reusable) {
+        return preview.socket;
+    }
+    if (preview.socket) {
+        preview.socket.close();
+    }
+    
+    const protocol = location.protocol === 'https:' ? 'wss' : 'ws';
+    const socket = new WebSocket(`${protocol}://${location.host}/ws/projects/${state.currentProjectId}/preview`);
+    socket.binaryType = 'arraybuffer';
+    socket.onmessage = handlePreviewMessage;
+    preview.socket = socket;
+    preview.projectId = state.currentProjectId;
+    return socket;
+}
+
+function requestLinePreview(lineId) {
+    // 在用户操作中创建/恢复音频上下文(浏览器自动播放限制)
+    preview.context = preview.context || new AudioContext();
+    preview.context.resume();
+    
+    const socket = connectPreview();
+    const send = () => socket.send(JSON.stringify({ line_id: lineId }));
+    if (socket.readyState === WebSocket.OPEN) {
+        send();
+    } else {
+        socket.addEventListener('open', send, { once: true });
+    }
+}
+
+function stopPreviewPlayback() {
+    preview.sources.forEach(source => source.stop());
+    preview.sources = [];
+    preview.remainder = null;
+}
+
+function handlePreviewMessage(event) {
+    if (typeof event.data !== 'string') {
+        playPreviewChunk(event.data);
+        return;
+    }
+    
+    const message = JSON.parse(event.data);
+    if (message.type === 'start') {
+        stopPreviewPlayback();
+        preview.format = message;
+        preview.playhead = preview.context.currentTime + 0.05;
+    } else if (message.type === 'end') {
+        loadLineWaveform(message.line_id);
+    } else if (message.type === 'cancelled') {
+        stopPreviewPlayback();
+        preview.format = null;
+    } else if (message.type === 'error') {
+        console.warn('预览失败:', message.error);
+    }
+}
+
+function playPreviewChunk(data) {
+    if (!preview.format) {
+        return;
+    }
+    
+    // 16位PCM按2字节对齐,不完整的字节留到下一块
+    let bytes = new Uint8Array(data);
+    if (preview.remainder) {
+        const merged = new Uint8Array(preview.remainder.length + bytes.length);
+        merged.set(preview.remainder);
+        merged.set(bytes, preview.remainder.length);
+        bytes = merged;
+    }
+    const usable = bytes.length - (bytes.length % 2);
+    preview.remainder = usable < bytes.length ? bytes.slice(usable) : null;
+    if (!usable) {
+        return;
+    }
+    
+    const pcm = new Int16Array(bytes.slice(0, usable).buffer);
+    const context = preview.context;
+    const buffer = context.createBuffer(1, pcm.length, preview.format.sample_rate);
+    const channel = buffer.getChannelData(0);
+    for (let i = 0; i < pcm.length; i++) {
+        channel[i] = pcm[i] / 32768;
+    }
+    
+    // 各块按顺序首尾相接排队播放
+    const source = context.createBufferSource();
+    source.buffer = buffer;
+    source.connect(context.destination);
+    preview.playhead = Math.max(preview.playhead, context.currentTime);
+    source.start(preview.playhead);
+    preview.playhead += buffer.duration;
+    preview.sources.push(source);
+    source.onended = () => {
+        preview.sources = preview.sources.filter(item => item !== source);
+    };
+}
+
 // 处理重新生成单句
 async function handleRegenerateLine(event) {
     const lineId = event.currentTarget.dataset.lineId;
@@ -457,9 +694,15 @@ async function handleRegenerateLine(event) {
         
         const data = await response.json();
         showSuccess('音频生成成功!');
-        
-        // 可以在这里添加音频预览功能
-        
+
+        loadLineWaveform(lineId);
+
+        // 成品已增量更新: 重新加载播放器和波形
+        if (data.mix_updated && elements.finalAudio.getAttribute('src')) {
+            elements.finalAudio.src = elements.finalAudio.getAttribute('src').split('?')[0] + `?t=${Date.now()}`;
+            loadWaveform(elements.finalWaveform, `/api/projects/${state.currentProjectId}/peaks`);
+        }
+
     } catch (error) {
         showError('生成失败: ' + error.message);
     } finally {
@@ -486,6 +729,7 @@ async function handlePreviewAudio() {
         
         // 显示预览页面
         showStep('preview');
+        loadWaveform(elements.finalWaveform, `/api/projects/${state.currentProjectId}/peaks`);
         showSuccess('已加载生成的音频');
         
     } catch (error) {
@@ -526,6 +770,7 @@ async function handleGenerateAll() {
         
         // 显示预览页面
         showStep('preview');
+        loadWaveform(elements.finalWaveform, `/api/projects/${state.currentProjectId}/peaks`);
         showSuccess('全部音频生成完成!');
         
     } catch (error) {
@@ -552,28 +797,8 @@ async function handleLoadProject() {
     try {
         showLoading('加载工程列表...');
         
-        const response = await fetch('/api/projects');
-        const data = await response.json();
-        
-        // 渲染工程列表
-        const html = data.projects.map(project => `
-            <div class="project-list-item" data-project-id="${project.id}">
-                <h4>${project.title}</h4>
-                <p>创建时间: ${formatDate(project.created_at)}</p>
-                <p>更新时间: ${formatDate(project.updated_at)}</p>
-            </div>
-        `).join('');
-        
-        elements.projectsListContainer.innerHTML = html || '<p>暂无工程</p>';
-        
-        // 绑定点击事件
-        document.querySelectorAll('.project-list-item').forEach(item => {
-            item.addEventListener('click', async () => {
-                const projectId = item.dataset.projectId;
-                await loadProject(projectId);
-                elements.projectsModal.classList.add('hidden');
-            });
-        });
+        elements.projectsListContainer.innerHTML = '';
+        await appendProjectPage(null);
         
         // 显示模态框
         elements.projectsModal.classList.remove('hidden');
@@ -585,6 +810,60 @@ async function handleLoadProject() {
     }
 }
 
+// 加载一页工程列表并追加到列表末尾
+async function appendProjectPage(cursor) {
+    const params = new URLSearchParams({ limit: '50' });
+    if (cursor) params.set('cursor', cursor);
+    
+    const response = await fetch(`/api/projects?${params}`);
+    const data = await response.json();
+    
+    // 渲染工程列表
+    const html = data.projects.map(project => `
+        <div class="project-list-item" data-project-id="${project.id}">
+            <h4>${project.title}</h4>
+            <p>创建时间: ${formatDate(project.created_at)}</p>
+            <p>更新时间: ${formatDate(project.updated_at)}</p>
+        </div>
+    `).join('');
+    
+    const container = elements.projectsListContainer;
+    container.querySelector('.load-more-projects')?.remove();
+    container.insertAdjacentHTML('beforeend', html);
+    
+    if (!container.querySelector('.project-list-item')) {
+        container.innerHTML = '<p>暂无工程</p>';
+        return;
+    }
+    
+    // 绑定点击事件
+    container.querySelectorAll('.project-list-item:not([data-bound])').forEach(item => {
+        item.dataset.bound = '1';
+        item.addEventListener('click', async () => {
+            const projectId = item.dataset.projectId;
+            await loadProject(projectId);
+            elements.projectsModal.classList.add('hidden');
+        });
+    });
+    
+    // 还有更多工程时显示"加载更多"
+    if (data.next_cursor) {
+        const button = document.createElement('button');
+        button.className = 'btn btn-secondary load-more-projects';
+        button.textContent = '加载更多';
+        button.addEventListener('click', async () => {
+            button.disabled = true;
+            try {
+                await appendProjectPage(data.next_cursor);
+            } catch (error) {
+                button.disabled = false;
+                showError('加载失败: ' + error.message);
+            }
+        });
+        container.appendChild(button);
+    }
+}
+
 // 加载工程
 async function loadProject(projectId) {
     try {
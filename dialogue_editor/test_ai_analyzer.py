@@ -0,0 +1,63 @@
+"""
+ai_analyzer 单元测试 - 增量JSON解析器(LLM流式输出逐个提取说话人和对话)
+"""
+import json
+
+import pytest
+
+from ai_analyzer import JsonArrayStreamParser
+
+RESULT = {
+    "speakers": [
+        {"id": "speaker_1", "name": "小明", "gender": "male"},
+        {"id": "speaker_2", "name": "小红", "gender": "female"},
+    ],
+    "dialogues": [
+        {"speaker_id": "speaker_1", "text": "你好{\"引号\"}[括号]", "emotion": "开心"},
+        {"speaker_id": "speaker_2", "text": "反斜杠\\\\结尾\\", "tags": ["a", {"b": 1}]},
+        {"speaker_id": "speaker_1", "text": "再见", "context": None},
+    ],
+}
+
+
+def _expected():
+    return [("speakers", item) for item in RESULT["speakers"]] + \
+           [("dialogues", item) for item in RESULT["dialogues"]]
+
+
+def _feed_all(text: str, size: int):
+    parser = JsonArrayStreamParser(("speakers", "dialogues"))
+    items = []
+    for i in range(0, len(text), size):
+        items.extend(parser.feed(text[i:i + size]))
+    return items
+
+
+@pytest.mark.parametrize("size", [1, 2, 7, 10_000])
+def test_items_independent_of_chunking(size):
+    """任意切分输入,按出现顺序得到全部完整元素"""
+    text = json.dumps(RESULT, ensure_ascii=False, indent=2)
+    assert _feed_all(text, size) == _expected()
+
+
+def test_item_emitted_as_soon_as_complete():
+    """元素闭合后立即返回,不等待整个JSON结束"""
+    parser = JsonArrayStreamParser(("dialogues",))
+    assert parser.feed('{"dialogues": [{"text": "一"}, {"te') == [("dialogues", {"text": "一"})]
+    assert parser.feed('xt": "二"}') == [("dialogues", {"text": "二"})]
+    assert parser.feed("]}") == []
+
+
+def test_ignores_other_keys_and_nested_arrays():
+    """只提取指定键下数组的直接子元素"""
+    text = json.dumps({
+        "meta": [{"skip": True}],
+        "dialogues": [{"text": "a", "words": [{"nested": 1}]}],
+    })
+    assert _feed_all(text, 5) == [("dialogues", {"text": "a", "words": [{"nested": 1}]})]
+
+
+def test_markdown_wrapped_output():
+    """LLM输出被代码块包裹时仍能解析"""
+    text = "```json\n" + json.dumps(RESULT, ensure_ascii=False) + "\n```"
+    assert _feed_all(text, 3) == _expected()
@@ -0,0 +1,51 @@
+"""
+project_store 单元测试 - 分页游标编解码和按游标翻页
+"""
+import pytest
+
+from project_schema import DialogueProject
+from project_store import ProjectStore, decode_cursor, encode_cursor
+
+
+def test_cursor_roundtrip():
+    """游标编码后解码得到原来的更新时间和ID"""
+    cursor = encode_cursor("2024-05-01T12:00:00.123456", "工程-1/é")
+    assert decode_cursor(cursor) == ("2024-05-01T12:00:00.123456", "工程-1/é")
+
+
+def test_cursor_is_url_safe():
+    """游标只包含URL安全字符,不带填充"""
+    cursor = encode_cursor("2024-05-01T12:00:00", "??>>~~")
+    assert "=" not in cursor
+    assert all(ch.isalnum() or ch in "-_" for ch in cursor)
+
+
+@pytest.mark.parametrize("cursor", ["", "!!!", "bm90IGpzb24", encode_cursor("a", "b")[:-3]])
+def test_invalid_cursor(cursor):
+    """无法解码的游标抛出ValueError"""
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
+
+
+def test_paging_with_cursor(tmp_path):
+    """按游标翻页不重复不遗漏,更新时间相同的工程按ID排序"""
+    store = ProjectStore(tmp_path / "projects.db")
+    expected = []
+    for i in range(7):
+        # 每两个工程共用一个更新时间
+        updated_at = f"2024-01-0{i // 2 + 1}T00:00:00"
+        project = DialogueProject(title=f"工程{i}", original_text="", updated_at=updated_at)
+        store.save(f"p{i}", project)
+        expected.append((updated_at, f"p{i}"))
+    expected.sort(reverse=True)
+
+    seen, cursor = [], None
+    while True:
+        page = store.list_summaries(limit=3, cursor=cursor)
+        if not page:
+            break
+        seen.extend((item["updated_at"], item["id"]) for item in page)
+        cursor = decode_cursor(encode_cursor(page[-1]["updated_at"], page[-1]["id"]))
+
+    assert seen == expected
+    store.close()
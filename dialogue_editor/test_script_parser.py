@@ -0,0 +1,98 @@
+"""
+script_parser 单元测试 - 规则解析剧本格式、置信度和性别/年龄推断
+"""
+import pytest
+
+from script_parser import ScriptParser, infer_age_group, infer_gender
+
+
+@pytest.fixture
+def parser():
+    return ScriptParser(min_confidence=0.8)
+
+
+def _names(result):
+    return [speaker["name"] for speaker in result["speakers"]]
+
+
+def test_parse_label_styles(parser):
+    """支持冒号、【】和[]三种标注,同名说话人合并"""
+    result = parser.try_parse("小明: 你好\n【小红】你好呀\n[小明]：最近怎么样?\n小红： 挺好的")
+
+    assert result is not None
+    assert _names(result) == ["小明", "小红"]
+    assert [d["text"] for d in result["dialogues"]] == ["你好", "你好呀", "最近怎么样?", "挺好的"]
+    assert [d["speaker_id"] for d in result["dialogues"]] == ["speaker_1", "speaker_2", "speaker_1", "speaker_2"]
+    assert result["dialogues"][0]["context"] is None
+    assert result["dialogues"][1]["context"] == "你好"
+
+
+def test_directions_and_quotes(parser):
+    """舞台提示转为情感,整句引号被去掉,单独成行的提示被跳过"""
+    result = parser.try_parse("小明(笑): “太好了”\n(两人沉默)\n小红: (叹气)算了吧")
+
+    assert [d["text"] for d in result["dialogues"]] == ["太好了", "算了吧"]
+    assert [d["emotion"] for d in result["dialogues"]] == ["开心", "沮丧"]
+
+
+def test_short_script_with_one_line_per_speaker(parser):
+    """每人只说一句的短剧本完全匹配时直接接受"""
+    result, confidence = parser.parse("小明: 早\n小红: 早上好\n老王: 大家早")
+
+    assert confidence == 1.0
+    assert _names(result) == ["小明", "小红", "老王"]
+    assert parser.try_parse("小明: 早\n小红: 早上好\n老王: 大家早") is not None
+
+
+def test_confidence_is_matched_share(parser):
+    """置信度为带标注的行所占比例,低于阈值时交给LLM"""
+    _, confidence = parser.parse("小明: 你好\n小红: 你好\n今天天气不错\n小明: 是啊")
+    assert confidence == pytest.approx(0.75)
+    assert parser.try_parse("小明: 你好\n小红: 你好\n今天天气不错\n小明: 是啊") is None
+
+
+@pytest.mark.parametrize("text", [
+    "今天天气很好。\n我们去公园吧。",
+    "小明: 只有一句",
+    "\n".join(f"角色{i}: 台词" for i in range(9)),
+])
+def test_rejects_prose_single_line_and_too_many_speakers(parser, text):
+    assert parser.try_parse(text) is None
+
+
+def test_url_is_not_a_speaker(parser):
+    """URL的协议名不会被当作说话人"""
+    result, confidence = parser.parse("小明: 看这个 https://example.com/a\nhttp://example.com\n小红: 好")
+
+    assert _names(result) == ["小明", "小红"]
+    assert result["dialogues"][0]["text"] == "看这个 https://example.com/a"
+    assert confidence == pytest.approx(2 / 3)
+
+
+def test_non_speaker_labels(parser):
+    """`注意:`、`时间:` 和纯数字不作为说话人"""
+    result, _ = parser.parse("时间: 傍晚\n小明: 走吧\n12: 30\n小红: 好")
+    assert _names(result) == ["小明", "小红"]
+
+
+def test_voice_assignment(parser):
+    """推断出性别的按性别分配,无法推断的男女交替"""
+    result = parser.try_parse("妈妈: 吃饭了\n甲: 来了\n乙: 马上")
+    genders = [speaker["gender"] for speaker in result["speakers"]]
+    assert genders == ["female", "male", "female"]
+    assert all(speaker["voice_type"] for speaker in result["speakers"])
+
+
+@pytest.mark.parametrize("name, gender", [
+    ("王先生", "male"), ("李阿姨", "female"), ("Mr. Smith", "male"),
+    ("Lucy", "female"), ("张伟", "male"), ("小芳", "female"), ("甲", None),
+])
+def test_infer_gender(name, gender):
+    assert infer_gender(name) == gender
+
+
+@pytest.mark.parametrize("name, age_group", [
+    ("王爷爷", "elder"), ("小朋友", "child"), ("女学生", "teenager"), ("经理", "adult"),
+])
+def test_infer_age_group(name, age_group):
+    assert infer_age_group(name) == age_group
@@ -0,0 +1,117 @@
+"""
+timeline 单元测试 - 构建时间轴、按时间定位、局部替换后平移以及字幕导出
+"""
+import copy
+
+import pytest
+
+from project_schema import DialogueLine, DialogueProject, Speaker
+from timeline import (
+    TimelineIndex,
+    build_timeline,
+    load_timeline,
+    save_line_timing,
+    save_timeline,
+    splice_timeline,
+)
+
+RATE = 1000
+
+
+@pytest.fixture
+def project(tmp_path):
+    speakers = [
+        Speaker(id="s1", name="小明", gender="male", voice_type="v1"),
+        Speaker(id="s2", name="小红", gender="female", voice_type="v2"),
+    ]
+    lines = [
+        DialogueLine(id="l1", speaker_id="s1", text="你好 世界", audio_file=str(tmp_path / "a.wav"), content_hash="h1"),
+        DialogueLine(id="l2", speaker_id="s2", text="你好", audio_file=str(tmp_path / "b.wav"), content_hash="h2"),
+        DialogueLine(id="l3", speaker_id="s1", text="再见", audio_file=str(tmp_path / "c.wav"), content_hash="h3"),
+    ]
+    # 第一句有服务端返回的句/词时间戳(相对该句音频开头)
+    save_line_timing(lines[0].audio_file, [{
+        "text": "你好 世界", "start": 0.1, "end": 0.9,
+        "words": [{"word": "你好", "start": 0.1, "end": 0.4}, {"word": "世界", "start": 0.5, "end": 0.9}],
+    }])
+    return DialogueProject(title="测试", original_text="", speakers=speakers, dialogues=lines)
+
+
+@pytest.fixture
+def timeline(project):
+    # 三句分别为 1秒、0.5秒、2秒
+    return build_timeline(project, project.dialogues, [1000, 500, 2000], RATE, audio_file="final.wav")
+
+
+def test_build_offsets(timeline):
+    """每句的起止时间按前面各句的采样数累加,句/词时间换算为绝对时间"""
+    assert timeline["total_samples"] == 3500
+    assert timeline["duration"] == 3.5
+    assert [(e["start"], e["end"]) for e in timeline["lines"]] == [(0.0, 1.0), (1.0, 1.5), (1.5, 3.5)]
+    assert [e["speaker"] for e in timeline["lines"]] == ["小明", "小红", "小明"]
+    assert timeline["lines"][0]["sentences"][0]["words"][1] == {"word": "世界", "start": 0.5, "end": 0.9}
+    # 没有时间戳的对话整句作为一个句子
+    assert timeline["lines"][2]["sentences"] == [{"text": "再见", "start": 1.5, "end": 3.5, "words": []}]
+
+
+def test_index_lookup(timeline):
+    """按时刻定位对话和词语,词语之间的空隙返回None"""
+    index = TimelineIndex(timeline)
+
+    assert index.duration == 3.5
+    assert index.line("l2")["start_sample"] == 1000
+    assert index.line("missing") is None
+    assert index.line_at(0.0)["line_id"] == "l1"
+    assert index.line_at(1.2)["line_id"] == "l2"
+    assert index.line_at(3.49)["line_id"] == "l3"
+    assert index.line_at(3.5) is None
+    assert index.line_at(-1) is None
+
+    assert index.word_at(0.2) == {"word": "你好", "start": 0.1, "end": 0.4, "line_id": "l1"}
+    assert index.word_at(0.45) is None
+    assert index.word_at(0.05) is None
+
+
+def test_splice_shifts_following_lines(project, timeline):
+    """替换中间一句后重新计算该句,之后的对话平移,之前的条目不变,原时间轴不被修改"""
+    original = copy.deepcopy(timeline)
+    replaced = project.dialogues[1].model_copy(update={"content_hash": "h2-new", "text": "你好呀"})
+
+    spliced = splice_timeline(timeline, project, {"l2": replaced}, {"l2": 1500})
+
+    assert timeline == original
+    assert spliced["total_samples"] == 4500
+    assert spliced["duration"] == 4.5
+    first, second, third = spliced["lines"]
+    assert first is timeline["lines"][0]
+    assert (second["text"], second["content_hash"], second["start"], second["end"]) == ("你好呀", "h2-new", 1.0, 2.5)
+    assert (third["start_sample"], third["start"], third["end"]) == (2500, 2.5, 4.5)
+    assert third["sentences"][0]["start"] == 2.5
+
+    index = TimelineIndex(spliced)
+    assert index.line_at(2.4)["line_id"] == "l2"
+    assert index.line_at(2.6)["line_id"] == "l3"
+
+
+def test_subtitles(timeline):
+    """按句或按对话导出SRT/WebVTT"""
+    index = TimelineIndex(timeline)
+
+    srt = index.to_srt()
+    assert srt.startswith("1\n00:00:00,100 --> 00:00:00,900\n小明: 你好 世界\n")
+    assert "3\n00:00:01,500 --> 00:00:03,500\n小明: 再见\n" in srt
+
+    vtt = index.to_vtt(level="line")
+    assert vtt.startswith("WEBVTT\n")
+    assert "00:00:01.000 --> 00:00:01.500\n<v 小红>你好\n" in vtt
+
+
+def test_save_and_load(tmp_path, timeline):
+    """保存后读取得到相同的时间轴,文件未变化时复用索引"""
+    output = tmp_path / "final.wav"
+    save_timeline(output, timeline)
+
+    index = load_timeline(output)
+    assert index.timeline == timeline
+    assert load_timeline(output) is index
+    assert load_timeline(tmp_path / "missing.wav") is None
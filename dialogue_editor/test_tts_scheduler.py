@@ -0,0 +1,114 @@
+"""
+tts_scheduler 单元测试 - 优先级、租户加权公平排队、交互预留名额和取消
+"""
+import threading
+
+import pytest
+
+from tts_scheduler import BULK, INTERACTIVE, PREFETCH, TTSScheduler
+
+
+@pytest.fixture
+def scheduler():
+    scheduler = TTSScheduler(max_concurrency=1)
+    yield scheduler
+    scheduler.shutdown()
+
+
+def _block(scheduler, priority=BULK, tenant="gate"):
+    """占住一个名额直到返回的事件被置位"""
+    started, release = threading.Event(), threading.Event()
+
+    def hold():
+        started.set()
+        release.wait(5)
+
+    future = scheduler.submit(hold, priority=priority, tenant=tenant)
+    assert started.wait(5)
+    return release, future
+
+
+def _run_queued(scheduler, submissions):
+    """在唯一名额被占用时提交任务,放行后返回实际执行顺序"""
+    release, _ = _block(scheduler)
+    order = []
+    futures = [
+        scheduler.submit(order.append, label, priority=priority, tenant=tenant)
+        for label, priority, tenant in submissions
+    ]
+    release.set()
+    for future in futures:
+        future.result(timeout=5)
+    return order
+
+
+def test_priority_order(scheduler):
+    """交互先于批量,批量先于预取,与提交顺序无关"""
+    order = _run_queued(scheduler, [
+        ("prefetch", PREFETCH, "a"),
+        ("bulk", BULK, "a"),
+        ("interactive", INTERACTIVE, "a"),
+    ])
+    assert order == ["interactive", "bulk", "prefetch"]
+
+
+def test_fair_queueing_between_tenants(scheduler):
+    """先提交大量任务的租户不会让后来的租户一直排队"""
+    submissions = [(f"a{i}", BULK, "a") for i in range(6)] + [(f"b{i}", BULK, "b") for i in range(2)]
+    order = _run_queued(scheduler, submissions)
+    assert order == ["a0", "b0", "a1", "b1", "a2", "a3", "a4", "a5"]
+
+
+def test_weighted_share(scheduler):
+    """权重为2的租户获得两倍的份额"""
+    scheduler.set_weight("b", 2)
+    submissions = [(f"a{i}", BULK, "a") for i in range(4)] + [(f"b{i}", BULK, "b") for i in range(6)]
+    order = _run_queued(scheduler, submissions)
+    assert order[:6] == ["b0", "a0", "b1", "b2", "a1", "b3"]
+
+
+def test_interactive_reserved_slot():
+    """批量任务占满可用名额时,交互请求仍可使用预留名额"""
+    scheduler = TTSScheduler(max_concurrency=2, interactive_reserved=1)
+    try:
+        release, _ = _block(scheduler, BULK)
+        bulk = scheduler.submit(lambda: "bulk", priority=BULK)
+        assert scheduler.submit(lambda: "interactive", priority=INTERACTIVE).result(timeout=5) == "interactive"
+        assert not bulk.done()
+        release.set()
+        assert bulk.result(timeout=5) == "bulk"
+    finally:
+        scheduler.shutdown()
+
+
+def test_cancelled_tasks_leave_queue(scheduler):
+    """取消的任务不计入排队深度,也不再阻塞预取"""
+    release, _ = _block(scheduler)
+    bulk = [scheduler.submit(lambda: None, priority=BULK, tenant="a") for _ in range(3)]
+    prefetch = scheduler.submit(lambda: "prefetch", priority=PREFETCH, tenant="b")
+    assert scheduler.queue_depth() == 4
+    assert scheduler.queue_depth(BULK) == 3
+
+    for future in bulk:
+        assert future.cancel()
+    assert scheduler.queue_depth() == 1
+    assert scheduler.stats()["classes"][BULK]["queued_by_tenant"] == {}
+
+    release.set()
+    assert prefetch.result(timeout=5) == "prefetch"
+    assert scheduler.queue_depth() == 0
+
+
+def test_shutdown_cancels_queued():
+    """关闭时取消排队中的任务,之后不再接收新任务"""
+    scheduler = TTSScheduler(max_concurrency=1)
+    release, running = _block(scheduler)
+    queued = scheduler.submit(lambda: None)
+    release.set()
+    scheduler.shutdown()
+
+    assert running.done() and not running.cancelled()
+    assert queued.cancelled() or queued.done()
+    assert scheduler.queue_depth() == 0
+    with pytest.raises(RuntimeError):
+        scheduler.submit(lambda: None)
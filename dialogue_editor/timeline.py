@@ -0,0 +1,316 @@
+"""
+对话时间轴
+合成时记录的句/词时间戳(相对每句音频开头)与合并成品时每句的偏移组合为整个工程的时间轴,
+保存在成品音频旁(.timeline.json)。定位某一时刻的对话或词语用二分查找,无需重新分析音频;
+可导出SRT/WebVTT字幕或JSON
+"""
+import bisect
+import json
+import os
+import threading
+import uuid
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+from project_schema import DialogueLine, DialogueProject
+
+TIMELINE_VERSION = 1
+
+# 单句音频旁的时间戳文件(与音频同名,随音频一起被垃圾回收)
+TIMING_SUFFIX = ".timing.json"
+
+# 成品音频旁的时间轴文件
+TIMELINE_SUFFIX = ".timeline.json"
+
+# 字幕粒度
+SUBTITLE_LEVELS = ("sentence", "line")
+
+
+def timing_path(audio_file: Union[str, Path]) -> Path:
+    return Path(audio_file).with_suffix(TIMING_SUFFIX)
+
+
+def timeline_path(output_file: Union[str, Path]) -> Path:
+    return Path(output_file).with_suffix(TIMELINE_SUFFIX)
+
+
+def _write_json(path: Path, data) -> None:
+    """先写临时文件再原子替换"""
+    tmp = path.with_name(f".{path.name}.{uuid.uuid4().hex[:8]}.tmp")
+    try:
+        tmp.write_text(json.dumps(data, ensure_ascii=False, separators=(",", ":")), encoding="utf-8")
+        os.replace(tmp, path)
+    finally:
+        if tmp.exists():
+            tmp.unlink()
+
+
+def save_line_timing(audio_file: Union[str, Path], sentences: List[Dict]) -> None:
+    """
+    保存单句音频的时间戳
+    :param audio_file: 音频文件
+    :param sentences: TTSHttpClient.parse_sentence 的结果列表
+    """
+    _write_json(timing_path(audio_file), sentences)
+
+
+def load_line_timing(audio_file: Union[str, Path]) -> Optional[List[Dict]]:
+    """读取单句音频的时间戳,没有记录时返回None"""
+    try:
+        return json.loads(timing_path(audio_file).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+
+
+def _round(seconds: float) -> float:
+    return round(seconds, 3)
+
+
+def _line_entry(line: DialogueLine, speaker_name: str, start_sample: int, samples: int,
+                sample_rate: int) -> Dict:
+    """一句对话在时间轴中的条目(句/词时间换算为成品中的绝对时间)"""
+    start = start_sample / sample_rate
+    end = (start_sample + samples) / sample_rate
+
+    def absolute(t: float) -> float:
+        return _round(min(start + t, end))
+
+    timing = load_line_timing(line.audio_file) if line.audio_file else None
+    if timing:
+        sentences = [
+            {
+                "text": sentence["text"],
+                "start": absolute(sentence["start"]),
+                "end": absolute(sentence["end"]),
+                "words": [
+                    {"word": word["word"], "start": absolute(word["start"]), "end": absolute(word["end"])}
+                    for word in sentence.get("words", [])
+                ],
+            }
+            for sentence in timing
+        ]
+    else:
+        # 没有时间戳(关闭了时间戳或旧音频)时整句作为一个句子
+        sentences = [{"text": line.text, "start": _round(start), "end": _round(end), "words": []}]
+
+    return {
+        "line_id": line.id,
+        "speaker_id": line.speaker_id,
+        "speaker": speaker_name,
+        "text": line.text,
+        "content_hash": line.content_hash,
+        "start_sample": start_sample,
+        "samples": samples,
+        "start": _round(start),
+        "end": _round(end),
+        "sentences": sentences,
+    }
+
+
+def build_timeline(project: DialogueProject, lines: Sequence[DialogueLine], segments: Sequence[int],
+                   sample_rate: int, channels: int = 1, sample_width: int = 2,
+                   audio_file: Optional[str] = None) -> Dict:
+    """
+    由合并时每句的采样数构建时间轴
+    :param project: 对话工程(用于说话人名称)
+    :param lines: 按合并顺序排列的对话
+    :param segments: 每句在成品中的采样数(与lines一一对应)
+    :param sample_rate: 成品采样率
+    :param channels: 成品声道数
+    :param sample_width: 成品采样字节数
+    :param audio_file: 成品音频文件
+    :return: 时间轴字典
+    """
+    speaker_names = {speaker.id: speaker.name for speaker in project.speakers}
+    entries = []
+    offset = 0
+    for line, samples in zip(lines, segments):
+        entries.append(_line_entry(line, speaker_names.get(line.speaker_id, ""), offset, samples, sample_rate))
+        offset += samples
+    return {
+        "version": TIMELINE_VERSION,
+        "audio": audio_file,
+        "sample_rate": sample_rate,
+        "channels": channels,
+        "sample_width": sample_width,
+        "total_samples": offset,
+        "duration": _round(offset / sample_rate),
+        "lines": entries,
+    }
+
+
+def splice_timeline(timeline: Dict, project: DialogueProject, replaced: Dict[str, DialogueLine],
+                    samples: Dict[str, int]) -> Dict:
+    """
+    替换部分对话后的时间轴: 被替换的对话重新计算,之后的对话按新的偏移平移
+    :param timeline: 原时间轴
+    :param project: 对话工程(用于说话人名称)
+    :param replaced: 对话ID -> 新的对话(已写入audio_file和content_hash)
+    :param samples: 对话ID -> 新音频的采样数
+    :return: 新的时间轴(不修改原时间轴)
+    """
+    sample_rate = timeline["sample_rate"]
+    speaker_names = {speaker.id: speaker.name for speaker in project.speakers}
+    entries = []
+    offset = 0
+    for entry in timeline["lines"]:
+        line = replaced.get(entry["line_id"])
+        if line is not None:
+            name = speaker_names.get(line.speaker_id, entry["speaker"])
+            entries.append(_line_entry(line, name, offset, samples[line.id], sample_rate))
+        else:
+            entries.append(_shift_entry(entry, offset, sample_rate))
+        offset += entries[-1]["samples"]
+    return {**timeline, "lines": entries, "total_samples": offset, "duration": _round(offset / sample_rate)}
+
+
+def _shift_entry(entry: Dict, start_sample: int, sample_rate: int) -> Dict:
+    """把时间轴条目平移到新的起始采样"""
+    if entry["start_sample"] == start_sample:
+        return entry
+    delta = (start_sample - entry["start_sample"]) / sample_rate
+
+    def shift(t: float) -> float:
+        return _round(t + delta)
+
+    return {
+        **entry,
+        "start_sample": start_sample,
+        "start": _round(start_sample / sample_rate),
+        "end": _round((start_sample + entry["samples"]) / sample_rate),
+        "sentences": [
+            {
+                **sentence,
+                "start": shift(sentence["start"]),
+                "end": shift(sentence["end"]),
+                "words": [
+                    {**word, "start": shift(word["start"]), "end": shift(word["end"])}
+                    for word in sentence["words"]
+                ],
+            }
+            for sentence in entry["sentences"]
+        ],
+    }
+
+
+def save_timeline(output_file: Union[str, Path], timeline: Dict) -> Path:
+    """保存成品音频的时间轴"""
+    path = timeline_path(output_file)
+    _write_json(path, timeline)
+    return path
+
+
+class TimelineIndex:
+    """时间轴索引: 按时间定位对话和词语(二分查找),按ID定位对话"""
+
+    def __init__(self, timeline: Dict):
+        self.timeline = timeline
+        self.lines: List[Dict] = timeline["lines"]
+        self._line_starts = [line["start"] for line in self.lines]
+        self._by_id = {line["line_id"]: i for i, line in enumerate(self.lines)}
+
+        # 全部词语按开始时间展开
+        self._words: List[Tuple[Dict, int]] = [
+            (word, i)
+            for i, line in enumerate(self.lines)
+            for sentence in line["sentences"]
+            for word in sentence["words"]
+        ]
+        self._words.sort(key=lambda item: item[0]["start"])
+        self._word_starts = [word["start"] for word, _ in self._words]
+
+    @property
+    def duration(self) -> float:
+        return self.timeline["duration"]
+
+    def line(self, line_id: str) -> Optional[Dict]:
+        """按ID查找对话在成品中的位置"""
+        i = self._by_id.get(line_id)
+        return self.lines[i] if i is not None else None
+
+    def line_at(self, t: float) -> Optional[Dict]:
+        """查找时刻t(秒)所在的对话"""
+        i = bisect.bisect_right(self._line_starts, t) - 1
+        if i < 0 or t >= self.lines[i]["end"]:
+            return None
+        return self.lines[i]
+
+    def word_at(self, t: float) -> Optional[Dict]:
+        """查找时刻t(秒)正在读的词语,返回词语及所在对话ID"""
+        i = bisect.bisect_right(self._word_starts, t) - 1
+        if i < 0:
+            return None
+        word, line_index = self._words[i]
+        if t >= word["end"]:
+            return None
+        return {**word, "line_id": self.lines[line_index]["line_id"]}
+
+    def cues(self, level: str = "sentence") -> List[Tuple[float, float, str, str]]:
+        """
+        字幕条目
+        :param level: sentence 每句话一条(有时间戳时按服务端分句),line 每句对话一条
+        :return: [(开始秒数, 结束秒数, 说话人, 文本), ...]
+        """
+        if level == "line":
+            return [(line["start"], line["end"], line["speaker"], line["text"]) for line in self.lines]
+        return [
+            (sentence["start"], sentence["end"], line["speaker"], sentence["text"])
+            for line in self.lines
+            for sentence in line["sentences"]
+            if sentence["text"].strip() and sentence["end"] > sentence["start"]
+        ]
+
+    def to_srt(self, level: str = "sentence") -> str:
+        blocks = []
+        for n, (start, end, speaker, text) in enumerate(self.cues(level), 1):
+            label = f"{speaker}: {text}" if speaker else text
+            blocks.append(f"{n}\n{_timestamp(start, ',')} --> {_timestamp(end, ',')}\n{label}\n")
+        return "\n".join(blocks)
+
+    def to_vtt(self, level: str = "sentence") -> str:
+        blocks = ["WEBVTT\n"]
+        for start, end, speaker, text in self.cues(level):
+            label = f"<v {speaker}>{text}" if speaker else text
+            blocks.append(f"{_timestamp(start, '.')} --> {_timestamp(end, '.')}\n{label}\n")
+        return "\n".join(blocks)
+
+
+def _timestamp(seconds: float, separator: str) -> str:
+    """秒数格式化为 HH:MM:SS,mmm(SRT)或 HH:MM:SS.mmm(WebVTT)"""
+    millis = int(round(seconds * 1000))
+    hours, millis = divmod(millis, 3_600_000)
+    minutes, millis = divmod(millis, 60_000)
+    secs, millis = divmod(millis, 1000)
+    return f"{hours:02d}:{minutes:02d}:{secs:02d}{separator}{millis:03d}"
+
+
+# 已加载的索引: 时间轴文件路径 -> (修改时间, 索引)
+_index_cache: Dict[str, Tuple[int, TimelineIndex]] = {}
+_index_lock = threading.Lock()
+
+
+def load_timeline(output_file: Union[str, Path]) -> Optional[TimelineIndex]:
+    """
+    读取成品音频的时间轴索引(文件未变化时复用已建好的索引)
+    :param output_file: 成品音频文件
+    :return: 索引,没有时间轴时返回None
+    """
+    path = timeline_path(output_file)
+    try:
+        mtime = path.stat().st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+    key = str(path.resolve())
+    with _index_lock:
+        cached = _index_cache.get(key)
+        if cached and cached[0] == mtime:
+            return cached[1]
+
+    try:
+        index = TimelineIndex(json.loads(path.read_text(encoding="utf-8")))
+    except (OSError, ValueError, KeyError):
+        return None
+    with _index_lock:
+        _index_cache[key] = (mtime, index)
+    return index
@@ -3,6 +3,8 @@ TTS配置文件 - 情感列表和音色配置
 这个文件包含了火山引擎TTS支持的所有情感和音色配置
 可以根据需要随时修改
 """
+import re
+import threading
 
 # ============================================
 # 情感配置 (Emotion Configuration)
@@ -296,39 +298,44 @@ def get_all_voice_categories() -> list:
     return list(VOICE_TYPES_BY_CATEGORY.keys())
 
 
-def search_voices(keyword: str = "", gender: str = "", category: str = "") -> list:
+def search_voices(keyword: str = "", gender: str = "", category: str = "", language: str = "") -> list:
     """
-    搜索符合条件的音色
+    搜索符合条件的音色(使用倒排索引,不逐个扫描音色)
     
     Args:
         keyword: 关键词（在名称和描述中搜索）
         gender: 性别筛选
         category: 分类筛选
+        language: 语言筛选，如"中文"、"英语"
         
     Returns:
-        符合条件的音色ID列表
+        符合条件的音色ID列表(按音色列表中的顺序)
     """
-    results = []
-    
-    for voice_id, info in VOICE_TYPE_DETAILS.items():
-        # 性别筛选
-        if gender and info.get("gender") != gender:
-            continue
-        
-        # 分类筛选
-        if category and info.get("category") != category:
-            continue
+    with _voice_index_lock:
+        candidates = None
+        for field, value in (("gender", gender), ("category", category), ("language", language)):
+            if value:
+                candidates = _intersect(candidates, _voice_index[field].get(value, set()))
         
-        # 关键词搜索
         if keyword:
             keyword_lower = keyword.lower()
-            if (keyword_lower not in info.get("name", "").lower() and
-                keyword_lower not in info.get("description", "").lower()):
-                continue
+            grams = _keyword_grams(keyword_lower)
+            postings = _voice_index["gram"]
+            # 从最短的倒排列表开始求交集,尽早缩小范围
+            for gram in sorted(grams, key=lambda g: len(postings.get(g, ()))):
+                candidates = _intersect(candidates, postings.get(gram, set()))
+                if not candidates:
+                    break
+            # 双字索引只能筛出候选,最后确认关键词确实是名称或描述的子串
+            candidates = {
+                voice_id for voice_id in candidates
+                if keyword_lower in VOICE_TYPE_DETAILS[voice_id].get("name", "").lower()
+                or keyword_lower in VOICE_TYPE_DETAILS[voice_id].get("description", "").lower()
+            }
         
-        results.append(voice_id)
-    
-    return results
+        if candidates is None:
+            return list(VOICE_TYPE_DETAILS)
+        return sorted(candidates, key=_voice_order.__getitem__)
 
 
 def is_valid_emotion(emotion: str, language: str = "chinese") -> bool:
@@ -359,6 +366,118 @@ def is_valid_voice(voice_id: str) -> bool:
     return voice_id in VOICE_TYPE_DETAILS
 
 
+# ============================================
+# 音色索引 (Voice Index)
+# 导入时为音色列表建立倒排索引,自定义音色较多时搜索也不需要逐个扫描
+# ============================================
+
+# 索引名 -> 取值 -> 音色ID集合;gram为名称/描述中的单字和相邻双字(小写)
+_voice_index = {
+    "gram": {},
+    "gender": {},
+    "category": {},
+    "language": {},
+}
+
+# 音色ID -> 在 VOICE_TYPE_DETAILS 中的顺序(搜索结果按此排序)
+_voice_order = {}
+
+# 音色列表版本号,每次修改后递增(用于缓存配置响应)
+_catalog_version = 0
+
+_voice_index_lock = threading.RLock()
+
+
+def _intersect(candidates, voice_ids: set) -> set:
+    return set(voice_ids) if candidates is None else candidates & voice_ids
+
+
+def _keyword_grams(text: str) -> set:
+    """关键词对应的索引项: 单字关键词查单字,否则查全部相邻双字"""
+    if len(text) <= 1:
+        return {text}
+    return {text[i:i + 2] for i in range(len(text) - 1)}
+
+
+def _text_grams(text: str) -> set:
+    text = text.lower()
+    return set(text) | {text[i:i + 2] for i in range(len(text) - 1)}
+
+
+def _voice_languages(info: dict) -> list:
+    """拆分语言字段，如"中文、英语" -> ["中文", "英语"]"""
+    return [lang.strip() for lang in re.split(r"[、,，/]", info.get("language", "")) if lang.strip()]
+
+
+def _index_voice(voice_id: str, info: dict):
+    _voice_order.setdefault(voice_id, len(_voice_order))
+    for gram in _text_grams(info.get("name", "")) | _text_grams(info.get("description", "")):
+        _voice_index["gram"].setdefault(gram, set()).add(voice_id)
+    for field in ("gender", "category"):
+        if info.get(field):
+            _voice_index[field].setdefault(info[field], set()).add(voice_id)
+    for language in _voice_languages(info):
+        _voice_index["language"].setdefault(language, set()).add(voice_id)
+
+
+def rebuild_voice_index():
+    """
+    按 VOICE_TYPE_DETAILS 重建音色索引
+    
+    直接修改 VOICE_TYPE_DETAILS 后需要调用;通过 register_voice 添加的音色会自动更新索引
+    """
+    global _catalog_version
+    with _voice_index_lock:
+        for index in _voice_index.values():
+            index.clear()
+        _voice_order.clear()
+        for voice_id, info in VOICE_TYPE_DETAILS.items():
+            _index_voice(voice_id, info)
+        _catalog_version += 1
+
+
+def register_voice(voice_id: str, info: dict):
+    """
+    添加或替换音色(如自定义复刻音色),同时更新分类列表和索引
+    
+    Args:
+        voice_id: 音色ID
+        info: 音色信息，字段与 VOICE_TYPE_DETAILS 相同
+    """
+    global _catalog_version
+    with _voice_index_lock:
+        previous = VOICE_TYPE_DETAILS.get(voice_id)
+        VOICE_TYPE_DETAILS[voice_id] = info
+        
+        if previous and previous.get("category") != info.get("category"):
+            old_list = VOICE_TYPES_BY_CATEGORY.get(previous.get("category"), [])
+            if voice_id in old_list:
+                old_list.remove(voice_id)
+        category = info.get("category")
+        if category and voice_id not in VOICE_TYPES_BY_CATEGORY.setdefault(category, []):
+            VOICE_TYPES_BY_CATEGORY[category].append(voice_id)
+        
+        if previous:
+            # 替换已有音色时旧的索引项无法逐个撤销,整体重建
+            rebuild_voice_index()
+        else:
+            _index_voice(voice_id, info)
+            _catalog_version += 1
+
+
+def catalog_version() -> int:
+    """
+    返回音色列表版本号,音色变化后递增
+    
+    Returns:
+        版本号
+    """
+    return _catalog_version
+
+
+rebuild_voice_index()
+
+
 # ============================================
 # TTS参数配置 (TTS Parameters)
 # ============================================
@@ -2,89 +2,337 @@
 TTS音频生成器
 """
 import os
+import queue
+import struct
 import sys
+import threading
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
-from typing import List, Optional
+from typing import BinaryIO, Callable, Dict, Iterator, List, Optional, Tuple
 
 # 添加父目录到路径以导入TTS模块
 sys.path.append(str(Path(__file__).parent.parent))
 
 from tts_http_v3 import TTSHttpClient
+from wav_writer import StreamingWavWriter, build_wav_header
+from audio_probe import probe_audio, probe_duration
+from waveform_peaks import write_peaks_file
+from timeline import build_timeline, load_timeline, save_line_timing, save_timeline, splice_timeline, timing_path
 from project_schema import DialogueLine, DialogueProject
+from audio_store import AudioStore
+from tts_scheduler import BULK, TTSScheduler
+
+# 默认的并发合成数(受上游TTS并发配额限制)
+DEFAULT_MAX_CONCURRENCY = int(os.getenv("TTS_MAX_CONCURRENCY", "4"))
+
+# 生成参数(参与内容哈希,修改后所有对话都会重新生成)
+RENDER_PARAMS = {
+    "audio_format": "wav",
+    "sample_rate": 24000,
+}
+
+# 合成时是否请求句/词时间戳(用于时间轴和字幕,不影响音频内容)
+CAPTURE_TIMESTAMPS = os.getenv("TTS_CAPTURE_TIMESTAMPS", "true").lower() in ("1", "true", "yes")
+
+# 合并成品时每次复制的字节数
+MERGE_BLOCK_SIZE = 1024 * 1024
+
+# 流式播放时相邻两句之间插入的静音(毫秒)
+DEFAULT_LINE_GAP_MS = int(os.getenv("DIALOGUE_LINE_GAP_MS", "0"))
+
+# 流式播放时每次输出的数据块大小
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# 进度回调: (已完成数, 总数, 对话索引, 音频文件或None, 是否实际调用了合成)
+ProgressCallback = Callable[[int, int, int, Optional[str], bool], None]
+
+# 成品文件 -> 写锁(完整合并与增量更新同一成品时互斥)
+_mix_locks: Dict[str, threading.Lock] = {}
+_mix_locks_guard = threading.Lock()
+
+
+def _mix_lock(output_file: str) -> threading.Lock:
+    key = str(Path(output_file).resolve())
+    with _mix_locks_guard:
+        return _mix_locks.setdefault(key, threading.Lock())
 
 
 class TTSGenerator:
     """TTS音频生成器"""
     
-    def __init__(self, output_dir: str = "dialogue_output"):
+    def __init__(self, output_dir: str = "dialogue_output",
+                 max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+                 serialize_context_lines: bool = False,
+                 audio_store: Optional[AudioStore] = None,
+                 scheduler: Optional[TTSScheduler] = None):
         """
         初始化
         :param output_dir: 音频输出目录
+        :param audio_store: 对话音频存储,默认为 output_dir/objects
+        :param max_concurrency: 整个工程生成时的最大并发合成数
+        :param serialize_context_lines: 同一说话人带上下文的对话是否按顺序合成
+                                        (上下文目前以文本传递,默认不需要串行)
+        :param scheduler: 共享的TTS调度器;提供时整个工程的合成以批量优先级提交给它,
+                          不再为每个工程单独创建线程池
         """
         self.output_dir = Path(output_dir)
         self.output_dir.mkdir(exist_ok=True)
+        self.audio_store = audio_store or AudioStore(self.output_dir / "objects")
+        self.max_concurrency = max(1, max_concurrency)
+        self.serialize_context_lines = serialize_context_lines
+        self.scheduler = scheduler
         
-        # 初始化TTS客户端
+        # requests.Session不保证线程安全,每个线程使用独立的TTS客户端;
+        # 全部客户端登记在_clients中,关闭生成器时统一关闭连接
+        self._local = threading.local()
+        self._clients: List[TTSHttpClient] = []
+        self._clients_lock = threading.Lock()
+        # 没有调度器时整个工程合成使用的线程池(长期复用,各线程的连接保持keep-alive)
+        self._executor: Optional[ThreadPoolExecutor] = None
+        
+        # 初始化TTS客户端(同时校验配置)
         try:
-            self.tts_client = TTSHttpClient()
+            self.tts_client
         except Exception as e:
             raise ValueError(f"TTS客户端初始化失败: {e}")
     
+    @property
+    def tts_client(self) -> TTSHttpClient:
+        """当前线程的TTS客户端"""
+        client = getattr(self._local, "client", None)
+        if client is None:
+            client = self._local.client = TTSHttpClient()
+            with self._clients_lock:
+                self._clients.append(client)
+        return client
+    
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._clients_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="tts")
+            return self._executor
+    
+    def close(self):
+        """关闭线程池和各线程的TTS客户端(服务关闭时调用)"""
+        with self._clients_lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+        with self._clients_lock:
+            clients, self._clients = self._clients, []
+        for client in clients:
+            client.close()
+    
     def generate_line(self, line: DialogueLine, voice_type: str, 
-                     line_index: int) -> Optional[str]:
+                     line_index: int, force: bool = False) -> Optional[str]:
         """
         生成单句对话的音频
         :param line: 对话行
         :param voice_type: 音色类型
-        :param line_index: 对话索引
+        :param line_index: 对话索引(用于日志)
+        :param force: 是否忽略已存储的音频重新合成(合成结果不确定,用于换一个效果),
+                      新音频作为该对话自己的版本单独存储,不改动其他对话共用的音频
         :return: 音频文件路径
         """
+        return self._render_line(line, voice_type, line_index, force)[0]
+    
+    def _render_line(self, line: DialogueLine, voice_type: str, line_index: int,
+                     force: bool = False) -> Tuple[Optional[str], bool]:
+        """
+        生成单句对话的音频
+        :return: (音频文件路径, 是否实际调用了合成)
+        """
+        tmp_file = None
         try:
-            # 构建输出文件名
-            output_file = self.output_dir / f"line_{line_index:03d}.wav"
-            
-            # 构建请求参数
-            kwargs = {
-                "speed_ratio": line.speed_ratio,
-                "volume_ratio": line.volume_ratio,
-                "pitch_ratio": line.pitch_ratio,
-            }
-            
-            # 添加情感参数(如果有)
-            if line.emotion:
-                kwargs["emotion"] = line.emotion
+            # 音频按合成参数哈希存储,参数相同的对话(包括其他工程中的)直接复用
+            content_hash = line.render_hash(voice_type, **RENDER_PARAMS)
+            if not force:
+                if self.is_up_to_date(line, voice_type):
+                    return line.audio_file, False
+                existing = self.audio_store.get(content_hash)
+                if existing:
+                    print(f"♻️ 复用已有音频 [{line_index+1}]: {line.text[:20]}...")
+                    line.duration = probe_duration(existing)
+                    line.content_hash = content_hash
+                    return existing, False
+            else:
+                # 同一参数哈希的音频可能被其他对话(包括其他工程)共用,重新合成的版本单独存储
+                content_hash = f"{content_hash}-{uuid.uuid4().hex[:8]}"
             
-            # 添加上下文参数(如果有)
-            if line.context:
-                kwargs["pure_text"] = line.context
+            tmp_file = self.audio_store.temp_path(content_hash)
+            sentences = []
             
             # 生成音频
             success = self.tts_client.synthesize_speech(
                 text=line.text,
-                output_file=str(output_file),
+                output_file=str(tmp_file),
                 speaker=voice_type,
-                audio_format="wav",
-                sample_rate=24000,
-                **kwargs
+                on_sentence=sentences.append if CAPTURE_TIMESTAMPS else None,
+                **RENDER_PARAMS,
+                **self._synthesis_kwargs(line)
             )
             
             if success:
-                return str(output_file)
+                output_file = self.audio_store.put(content_hash, tmp_file)
+                self._write_sidecars(output_file, sentences)
+                # 只读文件头获取时长,无需解码整段音频
+                line.duration = probe_duration(output_file)
+                line.content_hash = content_hash
+                return output_file, True
             else:
                 print(f"生成失败: {line.text[:20]}...")
-                return None
+                return None, True
                 
         except Exception as e:
             print(f"生成音频时出错: {e}")
-            return None
+            return None, True
+        finally:
+            if tmp_file is not None and tmp_file.exists():
+                tmp_file.unlink()
+    
+    def preview_line(self, line: DialogueLine, voice_type: str,
+                     cancel_event: Optional[threading.Event] = None) -> Iterator[bytes]:
+        """
+        边合成边输出单句对话的PCM音频(编辑时预览用)
+        
+        已有相同参数的音频时直接读取;新合成的音频完整接收后存入音频存储,
+        之后生成或预览同样参数的对话直接复用。被取消或中途失败的合成不保存。
+        
+        :param line: 对话行(合成完成后写入audio_file、content_hash和duration)
+        :param voice_type: 音色类型
+        :param cancel_event: 取消事件,置位后停止合成
+        :return: PCM数据块迭代器(采样率见RENDER_PARAMS,单声道16位)
+        """
+        sample_rate = RENDER_PARAMS["sample_rate"]
+        content_hash = line.render_hash(voice_type, **RENDER_PARAMS)
+        # 该对话自己的音频(可能是重新合成的版本)仍有效时直接读取,其次复用参数相同的共用音频
+        if not self.is_up_to_date(line, voice_type):
+            existing = self.audio_store.get(content_hash)
+            if existing:
+                line.audio_file = existing
+                line.content_hash = content_hash
+        if self.is_up_to_date(line, voice_type):
+            line.duration = probe_duration(line.audio_file)
+            yield from self._read_pcm(line.audio_file, (sample_rate, 1, 16))
+            return
+        
+        tmp_file = self.audio_store.temp_path(content_hash)
+        writer = StreamingWavWriter(tmp_file, sample_rate=sample_rate, channels=1, sample_width=2)
+        sentences = []
+        completed = False
+        try:
+            writer.begin_response()
+            for chunk in self.tts_client.stream_speech(
+                text=line.text,
+                speaker=voice_type,
+                audio_format="pcm",
+                sample_rate=sample_rate,
+                cancel_event=cancel_event,
+                on_sentence=sentences.append if CAPTURE_TIMESTAMPS else None,
+                **self._synthesis_kwargs(line)
+            ):
+                writer.write_response_chunk(chunk)
+                yield chunk
+            completed = writer.data_size > 0 and not (cancel_event and cancel_event.is_set())
+        finally:
+            writer.close()
+            if completed:
+                line.audio_file = self.audio_store.put(content_hash, tmp_file)
+                line.content_hash = content_hash
+                line.duration = probe_duration(line.audio_file)
+                self._write_sidecars(line.audio_file, sentences)
+            else:
+                tmp_file.unlink(missing_ok=True)
+    
+    @classmethod
+    def _write_sidecars(cls, audio_file: str, sentences: List[dict]):
+        """在新存入的音频旁保存波形峰值和合成时记录的时间戳"""
+        cls._write_peaks(audio_file)
+        try:
+            if sentences:
+                save_line_timing(audio_file, sentences)
+            else:
+                # 重新合成的音频没有时间戳时,删除上一次合成留下的
+                timing_path(audio_file).unlink(missing_ok=True)
+        except OSError as e:
+            print(f"保存时间戳失败: {audio_file} ({e})")
     
-    def generate_project(self, project: DialogueProject) -> List[str]:
+    @staticmethod
+    def _write_peaks(audio_file: str):
+        """在音频旁保存波形峰值,编辑器绘制波形时无需下载整段音频(失败不影响生成)"""
+        try:
+            write_peaks_file(audio_file)
+        except (OSError, ValueError, struct.error) as e:
+            print(f"计算波形峰值失败: {audio_file} ({e})")
+    
+    @staticmethod
+    def _synthesis_kwargs(line: DialogueLine) -> dict:
+        """对话行对应的合成参数(不含音色和RENDER_PARAMS)"""
+        kwargs = {
+            "speed_ratio": line.speed_ratio,
+            "volume_ratio": line.volume_ratio,
+            "pitch_ratio": line.pitch_ratio,
+        }
+        
+        # 添加情感参数(如果有)
+        if line.emotion:
+            kwargs["emotion"] = line.emotion
+        
+        # 添加上下文参数(如果有)
+        if line.context:
+            kwargs["pure_text"] = line.context
+        return kwargs
+    
+    def is_up_to_date(self, line: DialogueLine, voice_type: str) -> bool:
         """
-        生成整个工程的音频
+        判断对话的现有音频是否仍然有效(参数哈希未变且文件存在)
+        :param line: 对话行
+        :param voice_type: 音色类型
+        :return: 是否无需重新生成
+        """
+        return bool(
+            line.audio_file
+            and line.rendered_from(line.render_hash(voice_type, **RENDER_PARAMS))
+            and Path(line.audio_file).exists()
+        )
+    
+    def stale_lines(self, project: DialogueProject) -> List[int]:
+        """
+        返回需要重新生成的对话索引
+        :param project: 对话工程
+        :return: 索引列表
+        """
+        speaker_voices = {speaker.id: speaker.voice_type for speaker in project.speakers}
+        return [
+            i for i, dialogue in enumerate(project.dialogues)
+            if not self.is_up_to_date(
+                dialogue, speaker_voices.get(dialogue.speaker_id, "zh_male_wennuanahu_moon_bigtts")
+            )
+        ]
+    
+    def generate_project(self, project: DialogueProject,
+                         progress_callback: Optional[ProgressCallback] = None,
+                         executor=None, force: bool = False, tenant: str = "default") -> List[str]:
+        """
+        并发生成整个工程的音频
+        
+        参数哈希未变且音频文件仍存在的对话直接复用,只合成有改动的对话。
+        开启serialize_context_lines时,同一说话人带上下文(context)的对话按顺序依次合成,
+        其余对话直接并发合成。返回结果始终按对话顺序排列。
+        
         :param project: 对话工程
-        :return: 生成的音频文件列表
+        :param progress_callback: 进度回调(已完成数, 总数, 对话索引, 音频文件或None, 是否实际调用了合成)
+        :param executor: 自定义执行器(需提供submit方法),默认提交给调度器(批量优先级),
+                         没有调度器时使用生成器自己长期复用的max_concurrency个线程
+        :param force: 是否强制全部重新合成(忽略哈希和已存储的音频,参数相同的对话只合成一次)
+        :param tenant: 提交给调度器时的租户(通常为工程ID)
+        :return: 生成的音频文件列表(按对话顺序)
         """
-        audio_files = []
+        total = len(project.dialogues)
+        results: List[Optional[str]] = [None] * total
+        if not total:
+            return []
         
         # 创建说话人ID到音色的映射
         speaker_voices = {
@@ -92,22 +340,443 @@ class TTSGenerator:
             for speaker in project.speakers
         }
         
-        # 生成每一句对话
-        for i, dialogue in enumerate(project.dialogues):
+        lock = threading.Lock()
+        done_count = 0
+        
+        def finish(i: int, audio_file: Optional[str], synthesized: bool = False):
+            nonlocal done_count
+            results[i] = audio_file
+            with lock:
+                done_count += 1
+                finished = done_count
+            if progress_callback:
+                progress_callback(finished, total, i, audio_file, synthesized)
+        
+        # 强制重新生成时每种参数新合成的版本,参数相同的其余对话直接共用
+        takes: Dict[str, DialogueLine] = {}
+        
+        def render(i: int, dialogue: DialogueLine, force_line: bool) -> Optional[str]:
             voice_type = speaker_voices.get(dialogue.speaker_id, "zh_male_wennuanahu_moon_bigtts")
+            content_hash = dialogue.render_hash(voice_type, **RENDER_PARAMS)
+            print(f"正在生成 [{i+1}/{total}]: {dialogue.text[:30]}...")
             
-            print(f"正在生成 [{i+1}/{len(project.dialogues)}]: {dialogue.text[:30]}...")
-            
-            audio_file = self.generate_line(dialogue, voice_type, i)
+            take = takes.get(content_hash) if force and not force_line else None
+            if take is not None:
+                dialogue.content_hash, dialogue.duration = take.content_hash, take.duration
+                audio_file, synthesized = take.audio_file, False
+            else:
+                audio_file, synthesized = self._render_line(dialogue, voice_type, i, force_line)
+                if force_line and audio_file:
+                    takes[content_hash] = dialogue
             
             if audio_file:
-                audio_files.append(audio_file)
                 # 更新对话对象
                 dialogue.audio_file = audio_file
             else:
                 print(f"跳过第 {i+1} 句")
+            
+            finish(i, audio_file, synthesized)
+            return audio_file
+        
+        # 参数未变的对话直接复用现有音频,不占用合成并发
+        pending = []
+        for i, dialogue in enumerate(project.dialogues):
+            voice_type = speaker_voices.get(dialogue.speaker_id, "zh_male_wennuanahu_moon_bigtts")
+            if not force and self.is_up_to_date(dialogue, voice_type):
+                finish(i, dialogue.audio_file)
+            else:
+                pending.append(i)
+        
+        if not pending:
+            return [audio_file for audio_file in results if audio_file]
+        
+        if executor is None:
+            executor = (self.scheduler.executor(BULK, tenant) if self.scheduler is not None
+                        else self._get_executor())
+        
+        futures = []
+        # 每个说话人最近一句带上下文对话的Future,用于串行链接
+        speaker_chains = {}
+        # 每种合成参数第一次出现的Future,参数相同的对话等它完成后直接复用音频
+        first_by_hash = {}
+        
+        for i in pending:
+            dialogue = project.dialogues[i]
+            ordered = self.serialize_context_lines and bool(dialogue.context)
+            previous = speaker_chains.get(dialogue.speaker_id) if ordered else None
+            voice_type = speaker_voices.get(dialogue.speaker_id, "zh_male_wennuanahu_moon_bigtts")
+            content_hash = dialogue.render_hash(voice_type, **RENDER_PARAMS)
+            # 强制重新生成时只有每种参数的第一句重新合成,其余复用它的新音频
+            force_line = force and content_hash not in first_by_hash
+            previous = first_by_hash.get(content_hash, previous)
+            if previous is None:
+                future = executor.submit(render, i, dialogue, force_line)
+            else:
+                future = self._submit_after(executor, previous, render, i, dialogue, force_line)
+            if ordered:
+                speaker_chains[dialogue.speaker_id] = future
+            first_by_hash.setdefault(content_hash, future)
+            futures.append(future)
+        
+        for future in futures:
+            future.exception()
+        
+        return [audio_file for audio_file in results if audio_file]
+    
+    def stream_project(self, project: DialogueProject, force: bool = False,
+                       gap_ms: int = DEFAULT_LINE_GAP_MS,
+                       on_complete: Optional[Callable[[List[str]], None]] = None,
+                       tenant: str = "default",
+                       progress_callback: Optional[ProgressCallback] = None,
+                       on_error: Optional[Callable[[Exception], None]] = None) -> Iterator[bytes]:
+        """
+        边生成边输出整个工程的WAV音频流
+        
+        调用时即在后台线程开始生成。返回的迭代器先输出长度为占位值的WAV头,
+        之后按对话顺序输出每句的PCM数据(及句间静音),某句及其之前所有对话都就绪后立即输出,
+        首句音频的等待时间约为一句的合成时间。生成失败的对话直接跳过。
+        客户端中途断开(或迭代器从未被消费)时后台生成仍会继续完成。
+        
+        :param project: 对话工程
+        :param force: 是否忽略哈希强制全部重新生成
+        :param gap_ms: 句间静音时长(毫秒)
+        :param on_complete: 全部生成结束后在后台线程中调用,参数为音频文件列表
+        :param tenant: 提交给调度器时的租户(通常为工程ID)
+        :param progress_callback: 进度回调,同 generate_project
+        :param on_error: 生成中途出错时在后台线程中调用(代替on_complete),参数为异常
+        :return: WAV字节流迭代器
+        """
+        sample_rate = RENDER_PARAMS["sample_rate"]
+        channels, sample_width = 1, 2
+        total = len(project.dialogues)
+        
+        # 完成通知: (对话索引, 音频文件或None),None表示生成线程已结束
+        ready_queue: "queue.Queue" = queue.Queue()
+        
+        def progress(done: int, total: int, index: int, audio_file: Optional[str], synthesized: bool):
+            ready_queue.put((index, audio_file))
+            if progress_callback:
+                progress_callback(done, total, index, audio_file, synthesized)
+        
+        def worker():
+            try:
+                audio_files = self.generate_project(project, progress_callback=progress,
+                                                    force=force, tenant=tenant)
+            except Exception as e:
+                print(f"流式生成出错: {e}")
+                if on_error:
+                    on_error(e)
+                return
+            finally:
+                ready_queue.put(None)
+            if on_complete:
+                on_complete(audio_files)
+        
+        threading.Thread(target=worker, name="tts-stream", daemon=True).start()
+        return self._iter_stream(ready_queue, total, sample_rate, channels, sample_width, gap_ms)
+    
+    def _iter_stream(self, ready_queue: "queue.Queue", total: int, sample_rate: int,
+                     channels: int, sample_width: int, gap_ms: int) -> Iterator[bytes]:
+        """按对话顺序输出 stream_project 后台生成就绪的音频"""
+        block_align = channels * sample_width
+        # 长度未知的WAV头(长度字段为占位值)
+        yield build_wav_header(sample_rate, channels, sample_width)
+        
+        gap = bytes(int(sample_rate * gap_ms / 1000) * block_align)
+        ready = {}
+        next_index = 0
+        emitted = False
+        
+        while next_index < total:
+            item = ready_queue.get()
+            if item is None:
+                break
+            index, audio_file = item
+            ready[index] = audio_file
+            
+            # 按顺序输出已连续就绪的对话
+            while next_index in ready:
+                audio_file = ready.pop(next_index)
+                next_index += 1
+                if not audio_file:
+                    continue
+                if emitted and gap:
+                    yield gap
+                for chunk in self._read_pcm(audio_file, (sample_rate, channels, sample_width * 8)):
+                    emitted = True
+                    yield chunk
+    
+    @staticmethod
+    def _read_pcm(audio_file: str, expected_format: tuple) -> Iterator[bytes]:
+        """
+        按块读取WAV文件的PCM数据(跳过文件头)
+        :param audio_file: WAV文件
+        :param expected_format: (采样率, 声道数, 位深),格式不一致的文件被跳过
+        """
+        try:
+            info = probe_audio(audio_file)
+        except (OSError, ValueError, struct.error) as e:
+            print(f"读取音频失败,跳过: {audio_file} ({e})")
+            return
+        
+        if info["format"] != "wav" or (
+            info["sample_rate"], info["channels"], info["bits_per_sample"]
+        ) != expected_format:
+            print(f"音频格式不一致,跳过: {audio_file}")
+            return
+        
+        remaining = info["data_size"]
+        with open(audio_file, "rb") as f:
+            f.seek(info["data_offset"])
+            while remaining > 0:
+                chunk = f.read(min(STREAM_CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+    
+    @staticmethod
+    def _submit_after(executor, previous: Future, fn, *args) -> Future:
+        """
+        在previous完成后再提交任务,不占用等待中的工作线程
+        :return: 代表后续任务结果的Future
+        """
+        proxy: Future = Future()
+        
+        def relay(inner: Future):
+            if inner.exception() is not None:
+                proxy.set_exception(inner.exception())
+            else:
+                proxy.set_result(inner.result())
+        
+        def start(_):
+            try:
+                executor.submit(fn, *args).add_done_callback(relay)
+            except Exception as e:
+                proxy.set_exception(e)
+        
+        previous.add_done_callback(start)
+        return proxy
+    
+    def merge_project(self, project: DialogueProject, output_file: str) -> Optional[dict]:
+        """
+        把工程中音频有效的对话按顺序合并为成品,并生成时间轴(保存在成品旁)
+        
+        格式一致的WAV直接拼接PCM数据,不解码也不需要FFmpeg,拼接时得到每句的采样数;
+        其他情况使用FFmpeg合并,每句的采样数从文件头读取。
+        
+        :param project: 对话工程(已生成音频)
+        :param output_file: 成品文件路径
+        :return: 时间轴字典,合并失败时返回None
+        """
+        speaker_voices = {speaker.id: speaker.voice_type for speaker in project.speakers}
+        lines = [
+            dialogue for dialogue in project.dialogues
+            if self.is_up_to_date(
+                dialogue, speaker_voices.get(dialogue.speaker_id, "zh_male_wennuanahu_moon_bigtts")
+            )
+        ]
+        if not lines:
+            print("没有音频文件可合并")
+            return None
+        audio_files = [dialogue.audio_file for dialogue in lines]
+        
+        with _mix_lock(output_file):
+            merged = self._concat_wav(audio_files, output_file)
+            if merged is not None:
+                fmt, segments = merged
+                self._write_peaks(output_file)
+            else:
+                if not self.merge_audio_files(audio_files, output_file):
+                    return None
+                try:
+                    infos = [probe_audio(audio_file) for audio_file in audio_files]
+                    info = probe_audio(output_file)
+                except (OSError, ValueError, struct.error) as e:
+                    print(f"读取音频信息失败,无法生成时间轴: {e}")
+                    return None
+                fmt = (info["sample_rate"], info["channels"], (info.get("bits_per_sample") or 16) // 8)
+                segments = [int(round((item["duration"] or 0) * fmt[0])) for item in infos]
+            
+            sample_rate, channels, sample_width = fmt
+            timeline = build_timeline(project, lines, segments, sample_rate, channels, sample_width,
+                                      audio_file=output_file)
+            try:
+                save_timeline(output_file, timeline)
+            except OSError as e:
+                print(f"保存时间轴失败: {e}")
+        return timeline
+    
+    def update_mix(self, project: DialogueProject, output_file: str) -> Optional[dict]:
+        """
+        按时间轴中每句的偏移增量更新成品,只替换重新生成过的对话(音频哈希与时间轴不同)
+        
+        新音频与原区域采样数相同时原地改写该区域;不同时重新写出成品,
+        未变化的区间从原成品按大块复制。PCM数据直接复制,不解码也不重新编码。
+        对话增删或重排、成品不是由PCM WAV直接拼接而成或格式不一致时返回None,由调用方改为完整合并。
+        
+        :param project: 对话工程
+        :param output_file: 成品文件路径(需已有时间轴)
+        :return: 更新后的时间轴,无法增量更新时返回None
+        """
+        if not Path(output_file).exists():
+            return None
+        with _mix_lock(output_file):
+            index = load_timeline(output_file)
+            if index is None:
+                return None
+            timeline = index.timeline
+            entries = timeline["lines"]
+            if [dialogue.id for dialogue in project.dialogues] != [entry["line_id"] for entry in entries]:
+                return None
+            
+            # 只替换音频有效且与成品中不同的对话,尚未重新生成的对话保留成品中的旧音频
+            speaker_voices = {speaker.id: speaker.voice_type for speaker in project.speakers}
+            replaced: Dict[str, DialogueLine] = {
+                dialogue.id: dialogue
+                for dialogue, entry in zip(project.dialogues, entries)
+                if dialogue.content_hash != entry["content_hash"]
+                and self.is_up_to_date(
+                    dialogue, speaker_voices.get(dialogue.speaker_id, "zh_male_wennuanahu_moon_bigtts")
+                )
+            }
+            if not replaced:
+                return timeline
+            
+            fmt = (timeline["sample_rate"], timeline["channels"], timeline["sample_width"] * 8)
+            block_align = timeline["channels"] * timeline["sample_width"]
+            try:
+                mix = probe_audio(output_file)
+                infos = {line_id: probe_audio(line.audio_file) for line_id, line in replaced.items()}
+            except (OSError, ValueError, struct.error) as e:
+                print(f"读取音频信息失败,改为完整合并: {e}")
+                return None
+            if mix["format"] != "wav" or (mix["sample_rate"], mix["channels"], mix["bits_per_sample"]) != fmt \
+                    or mix["data_size"] // block_align != timeline["total_samples"]:
+                return None
+            for info in infos.values():
+                if info["format"] != "wav" or (
+                    info["sample_rate"], info["channels"], info["bits_per_sample"]
+                ) != fmt:
+                    return None
+            samples = {line_id: info["data_size"] // block_align for line_id, info in infos.items()}
+            
+            try:
+                if all(samples[entry["line_id"]] == entry["samples"]
+                       for entry in entries if entry["line_id"] in replaced):
+                    self._rewrite_in_place(output_file, mix, entries, replaced, infos, block_align)
+                else:
+                    self._splice_mix(output_file, mix, entries, replaced, infos, samples, block_align)
+            except (OSError, ValueError) as e:
+                print(f"增量更新成品失败,改为完整合并: {e}")
+                return None
+            
+            timeline = splice_timeline(timeline, project, replaced, samples)
+            try:
+                save_timeline(output_file, timeline)
+            except OSError as e:
+                print(f"保存时间轴失败: {e}")
+            self._write_peaks(output_file)
+        print(f"成品已增量更新 {len(replaced)} 句: {output_file}")
+        return timeline
+    
+    @staticmethod
+    def _rewrite_in_place(output_file: str, mix: dict, entries: List[dict],
+                          replaced: Dict[str, DialogueLine], infos: Dict[str, dict], block_align: int):
+        """采样数不变: 直接覆盖成品中对应的区域"""
+        with open(output_file, "r+b") as out:
+            for entry in entries:
+                line = replaced.get(entry["line_id"])
+                if line is None:
+                    continue
+                out.seek(mix["data_offset"] + entry["start_sample"] * block_align)
+                info = infos[line.id]
+                with open(line.audio_file, "rb") as src:
+                    TTSGenerator._copy_range(src, info["data_offset"], entry["samples"] * block_align,
+                                             out.write)
+    
+    @staticmethod
+    def _splice_mix(output_file: str, mix: dict, entries: List[dict], replaced: Dict[str, DialogueLine],
+                    infos: Dict[str, dict], samples: Dict[str, int], block_align: int):
+        """采样数变化: 重新写出成品,相邻的未变化对话合并为一个区间从原成品复制"""
+        # 按顺序排列的复制区间: (源文件, 起始字节, 字节数)
+        ranges = []
+        for entry in entries:
+            line = replaced.get(entry["line_id"])
+            if line is not None:
+                ranges.append((line.audio_file, infos[line.id]["data_offset"], samples[line.id] * block_align))
+                continue
+            offset = mix["data_offset"] + entry["start_sample"] * block_align
+            length = entry["samples"] * block_align
+            if ranges and ranges[-1][0] == output_file and ranges[-1][1] + ranges[-1][2] == offset:
+                ranges[-1] = (output_file, ranges[-1][1], ranges[-1][2] + length)
+            else:
+                ranges.append((output_file, offset, length))
+        
+        part_file = Path(output_file).with_name(f".{Path(output_file).name}.part")
+        try:
+            with StreamingWavWriter(part_file, mix["sample_rate"], mix["channels"],
+                                    mix["bits_per_sample"] // 8) as writer:
+                for source, offset, length in ranges:
+                    with open(source, "rb") as src:
+                        TTSGenerator._copy_range(src, offset, length, writer.write_pcm)
+            os.replace(part_file, output_file)
+        finally:
+            part_file.unlink(missing_ok=True)
+    
+    @staticmethod
+    def _copy_range(src: BinaryIO, offset: int, length: int, write: Callable[[bytes], object]):
+        """从src的offset处按大块复制length字节"""
+        src.seek(offset)
+        while length > 0:
+            chunk = src.read(min(MERGE_BLOCK_SIZE, length))
+            if not chunk:
+                raise ValueError(f"音频数据不完整: {src.name}")
+            write(chunk)
+            length -= len(chunk)
+    
+    @staticmethod
+    def _concat_wav(audio_files: List[str], output_file: str):
+        """
+        直接拼接格式一致的PCM WAV文件(按大块复制数据,不解码)
+        :return: ((采样率, 声道数, 采样字节数), 每个文件的采样数),
+                 有非WAV或格式不一致的文件时返回None(由调用方改用FFmpeg)
+        """
+        infos = []
+        for audio_file in audio_files:
+            try:
+                info = probe_audio(audio_file)
+            except (OSError, ValueError, struct.error):
+                return None
+            if info["format"] != "wav" or not info.get("bits_per_sample"):
+                return None
+            infos.append(info)
+        
+        formats = {(info["sample_rate"], info["channels"], info["bits_per_sample"] // 8) for info in infos}
+        if len(formats) != 1:
+            return None
+        fmt = formats.pop()
+        sample_rate, channels, sample_width = fmt
+        block_align = channels * sample_width
+        
+        part_file = Path(output_file).with_name(f".{Path(output_file).name}.part")
+        segments = []
+        try:
+            with StreamingWavWriter(part_file, sample_rate, channels, sample_width) as writer:
+                for audio_file, info in zip(audio_files, infos):
+                    # 只复制完整的采样帧,保证各句在成品中的偏移按帧对齐
+                    remaining = info["data_size"] - info["data_size"] % block_align
+                    segments.append(remaining // block_align)
+                    with open(audio_file, "rb") as f:
+                        TTSGenerator._copy_range(f, info["data_offset"], remaining, writer.write_pcm)
+            os.replace(part_file, output_file)
+        except (OSError, ValueError) as e:
+            print(f"拼接音频失败: {e}")
+            part_file.unlink(missing_ok=True)
+            return None
         
-        return audio_files
+        print(f"音频合并成功: {output_file}")
+        return fmt, segments
     
     def merge_audio_files(self, audio_files: List[str], output_file: str) -> bool:
         """
@@ -151,6 +820,7 @@ class TTSGenerator:
             
             if result.returncode == 0:
                 print(f"音频合并成功: {output_file}")
+                self._write_peaks(output_file)
                 # 清理临时文件
                 list_file.unlink()
                 return True
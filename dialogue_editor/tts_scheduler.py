@@ -0,0 +1,257 @@
+"""
+TTS调用调度器
+所有上游合成请求共用一组固定数量的工作线程(即上游并发配额)。请求分为三个优先级:
+交互(单句生成、实时预览)总是先于批量(整个工程生成)执行,并预留名额,批量任务再多也不会占满;
+预取(推测用户接下来要听的对话)只在没有其他任务排队时使用空闲名额;
+同一优先级内按工程(租户)做加权公平排队,一个工程的上千句对话不会让其他工程一直排队
+"""
+import heapq
+import itertools
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+INTERACTIVE = "interactive"
+BULK = "bulk"
+PREFETCH = "prefetch"
+
+# 优先级从高到低
+PRIORITIES = (INTERACTIVE, BULK, PREFETCH)
+
+# 为交互请求预留的并发名额(批量和预取任务合计最多使用 max_concurrency - 预留数)
+DEFAULT_INTERACTIVE_RESERVED = 1
+
+
+class _Task:
+    """排队中的调用"""
+
+    __slots__ = ("finish_tag", "seq", "priority", "tenant", "future", "fn", "args", "kwargs", "enqueued_at")
+
+    def __init__(self, finish_tag: float, seq: int, priority: str, tenant: str,
+                 fn: Callable, args: tuple, kwargs: dict):
+        self.finish_tag = finish_tag
+        self.seq = seq
+        self.priority = priority
+        self.tenant = tenant
+        self.future: Future = Future()
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.enqueued_at = time.monotonic()
+
+    def __lt__(self, other: "_Task") -> bool:
+        return (self.finish_tag, self.seq) < (other.finish_tag, other.seq)
+
+
+class TenantExecutor:
+    """以固定优先级和租户提交任务的执行器(提供submit方法,可传给 TTSGenerator.generate_project)"""
+
+    def __init__(self, scheduler: "TTSScheduler", priority: str, tenant: str):
+        self.scheduler = scheduler
+        self.priority = priority
+        self.tenant = tenant
+
+    def submit(self, fn: Callable, *args, **kwargs) -> Future:
+        return self.scheduler.submit(fn, *args, priority=self.priority, tenant=self.tenant, **kwargs)
+
+
+class TTSScheduler:
+    """按优先级和租户加权公平调度的TTS调用执行器"""
+
+    def __init__(self, max_concurrency: int, interactive_reserved: int = DEFAULT_INTERACTIVE_RESERVED):
+        """
+        初始化
+        :param max_concurrency: 同时执行的上游调用数(上游并发配额)
+        :param interactive_reserved: 为交互请求预留的名额
+        """
+        self.max_concurrency = max(1, max_concurrency)
+        # 只有一个名额时无法预留,批量任务仍可使用
+        self.bulk_limit = max(1, self.max_concurrency - max(0, interactive_reserved))
+
+        self._cond = threading.Condition()
+        self._closed = False
+        self._seq = itertools.count()
+
+        # 每个优先级一个按完成标签排序的堆
+        self._queues: Dict[str, List[_Task]] = {priority: [] for priority in PRIORITIES}
+        # 每个优先级的虚拟时间,以及各租户最后一个任务的完成标签
+        self._virtual_time: Dict[str, float] = {priority: 0.0 for priority in PRIORITIES}
+        self._last_finish: Dict[Tuple[str, str], float] = {}
+        self._weights: Dict[str, float] = {}
+
+        # 统计
+        self._running: Counter = Counter()
+        self._queued_by_tenant: Dict[str, Counter] = {priority: Counter() for priority in PRIORITIES}
+        self._completed: Counter = Counter()
+        self._wait_total: Counter = Counter()
+
+        self._workers = [
+            threading.Thread(target=self._work, name=f"tts-sched-{i}", daemon=True)
+            for i in range(self.max_concurrency)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    # ---- 提交 ----
+
+    def submit(self, fn: Callable, *args, priority: str = BULK, tenant: str = "default",
+               cost: float = 1.0, **kwargs) -> Future:
+        """
+        提交调用
+        :param fn: 要执行的函数(通常是一次上游合成)
+        :param priority: INTERACTIVE、BULK 或 PREFETCH
+        :param tenant: 租户(工程ID或用户),同一优先级内各租户按权重公平分配
+        :param cost: 本次调用的相对开销
+        :return: Future;尚未开始执行时可以 cancel()
+        """
+        if priority not in self._queues:
+            raise ValueError(f"未知的优先级: {priority}")
+
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("调度器已关闭")
+            # 加权公平排队: 完成标签 = max(虚拟时间, 该租户上一个任务的完成标签) + 开销/权重
+            key = (priority, tenant)
+            start = max(self._virtual_time[priority], self._last_finish.get(key, 0.0))
+            finish_tag = start + cost / self._weights.get(tenant, 1.0)
+            self._last_finish[key] = finish_tag
+
+            task = _Task(finish_tag, next(self._seq), priority, tenant, fn, args, kwargs)
+            heapq.heappush(self._queues[priority], task)
+            self._queued_by_tenant[priority][tenant] += 1
+            self._cond.notify()
+        # 排队中被取消的任务立即移出队列
+        task.future.add_done_callback(lambda future: self._discard(task) if future.cancelled() else None)
+        return task.future
+
+    def call(self, priority: str, tenant: str, fn: Callable, *args, **kwargs) -> Any:
+        """提交调用并等待结果(在工作线程以外的线程中使用)"""
+        return self.submit(fn, *args, priority=priority, tenant=tenant, **kwargs).result()
+
+    def executor(self, priority: str, tenant: str) -> TenantExecutor:
+        """返回以固定优先级和租户提交任务的执行器"""
+        return TenantExecutor(self, priority, tenant)
+
+    def set_weight(self, tenant: str, weight: float):
+        """设置租户权重(默认1,权重为2的租户获得两倍的份额)"""
+        with self._cond:
+            self._weights[tenant] = max(weight, 1e-6)
+
+    # ---- 执行 ----
+
+    def _next_task(self) -> Optional[_Task]:
+        """取出下一个可执行的任务(调用方持有锁)"""
+        background = self._running[BULK] + self._running[PREFETCH]
+        for priority in PRIORITIES:
+            queue = self._queues[priority]
+            if not queue:
+                continue
+            if priority != INTERACTIVE and background >= self.bulk_limit:
+                continue
+            if priority == PREFETCH and (self._queues[INTERACTIVE] or self._queues[BULK]):
+                # 预取只使用空闲名额
+                continue
+            task = heapq.heappop(queue)
+            self._virtual_time[priority] = task.finish_tag
+            self._dequeued(task)
+            return task
+        return None
+
+    def _discard(self, task: _Task):
+        """
+        从队列中移除已取消的任务(Future被取消时调用)
+        取消的任务不再计入排队深度,也不再阻塞预取任务
+        """
+        with self._cond:
+            queue = self._queues[task.priority]
+            try:
+                queue.remove(task)
+            except ValueError:
+                # 已被工作线程取出或已在关闭时清空
+                return
+            heapq.heapify(queue)
+            self._dequeued(task)
+            self._cond.notify_all()
+
+    def _dequeued(self, task: _Task):
+        """任务离开队列后更新租户统计(调用方持有锁)"""
+        counter = self._queued_by_tenant[task.priority]
+        counter[task.tenant] -= 1
+        if not counter[task.tenant]:
+            del counter[task.tenant]
+            # 租户已没有排队任务,不再保留其完成标签
+            if self._last_finish.get((task.priority, task.tenant), 0.0) <= task.finish_tag:
+                self._last_finish.pop((task.priority, task.tenant), None)
+
+    def _work(self):
+        while True:
+            with self._cond:
+                task = self._next_task()
+                while task is None:
+                    if self._closed:
+                        return
+                    self._cond.wait()
+                    task = self._next_task()
+                if not task.future.set_running_or_notify_cancel():
+                    continue
+                self._running[task.priority] += 1
+                self._wait_total[task.priority] += time.monotonic() - task.enqueued_at
+
+            try:
+                result = task.fn(*task.args, **task.kwargs)
+            except BaseException as e:
+                task.future.set_exception(e)
+            else:
+                task.future.set_result(result)
+            finally:
+                with self._cond:
+                    self._running[task.priority] -= 1
+                    self._completed[task.priority] += 1
+                    # 释放的名额可能让受限的批量或预取任务可以执行
+                    self._cond.notify_all()
+
+    # ---- 状态 ----
+
+    def queue_depth(self, priority: Optional[str] = None) -> int:
+        """排队中的任务数"""
+        with self._cond:
+            if priority is not None:
+                return len(self._queues[priority])
+            return sum(len(queue) for queue in self._queues.values())
+
+    def stats(self) -> Dict:
+        """各优先级的排队深度、执行中任务数和平均排队时间"""
+        with self._cond:
+            classes = {}
+            for priority in PRIORITIES:
+                started = self._completed[priority] + self._running[priority]
+                classes[priority] = {
+                    "queued": len(self._queues[priority]),
+                    "running": self._running[priority],
+                    "completed": self._completed[priority],
+                    "avg_wait_ms": round(self._wait_total[priority] / started * 1000, 1) if started else 0.0,
+                    "queued_by_tenant": dict(self._queued_by_tenant[priority]),
+                }
+            return {
+                "max_concurrency": self.max_concurrency,
+                "bulk_limit": self.bulk_limit,
+                "classes": classes,
+            }
+
+    def shutdown(self, wait: bool = True):
+        """停止接收新任务,取消排队中的任务,等待执行中的任务结束"""
+        with self._cond:
+            self._closed = True
+            tasks = [task for queue in self._queues.values() for task in queue]
+            for queue in self._queues.values():
+                queue.clear()
+            for counter in self._queued_by_tenant.values():
+                counter.clear()
+            for task in tasks:
+                task.future.cancel()
+            self._cond.notify_all()
+        if wait:
+            for worker in self._workers:
+                worker.join()
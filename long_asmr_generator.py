@@ -5,6 +5,7 @@
 使用"亲密耳语"场景的ultra_soft配置
 """
 from tts_http_v3 import TTSHttpClient
+from audio_pipeline import ASMR_TRIM_CONFIG, synthesize_trimmed
 import os
 from pathlib import Path
 import time
@@ -163,11 +164,11 @@ def generate_long_asmr_mp3(script_name: str, output_filename: str = None):
             
             print(f"\n🎵 生成段落 {i}/{total_segments}: {text[:30]}...")
             
-            success = client.synthesize_speech(
-                text=text,
-                output_file=temp_filename,
+            success = synthesize_trimmed(
+                client, text, temp_filename,
                 speaker=DEFAULT_SPEAKER,
                 context_texts=BEST_ASMR_CONTEXT,
+                **ASMR_TRIM_CONFIG,
                 **BEST_ASMR_CONFIG
             )
             
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+audio_pipeline 单元测试
+首尾静音裁剪和多相重采样: 一次性处理与分块流式处理结果一致,长度和频率符合预期
+"""
+import numpy as np
+import pytest
+
+from audio_pipeline import Resampler, SilenceTrimmer, resample, trim_silence
+
+RATE = 24000
+
+
+def _tone(seconds: float, freq: float = 440.0, rate: int = RATE, amplitude: int = 10000) -> np.ndarray:
+    t = np.arange(int(rate * seconds)) / rate
+    return (amplitude * np.sin(2 * np.pi * freq * t)).astype(np.int16).reshape(-1, 1)
+
+
+def _silence(seconds: float, rate: int = RATE) -> np.ndarray:
+    return np.zeros((int(rate * seconds), 1), dtype=np.int16)
+
+
+def _run_stage(stage, samples: np.ndarray, chunk: int) -> np.ndarray:
+    parts = [stage.process(samples[i:i + chunk]) for i in range(0, len(samples), chunk)]
+    return np.concatenate(parts + [stage.flush()])
+
+
+def test_trim_keeps_padding_around_voice():
+    """首尾静音裁剪到keep_ms,中间的声音完整保留"""
+    voice = _tone(1.0)
+    samples = np.concatenate([_silence(0.5), voice, _silence(0.5)])
+
+    trimmed = trim_silence(samples, RATE, keep_ms=100)
+    keep = RATE // 10
+    assert len(trimmed) == len(voice) + 2 * keep
+    assert not trimmed[:keep].any()
+    np.testing.assert_array_equal(trimmed[keep:keep + len(voice)], voice)
+
+
+def test_trim_keeps_inner_pause():
+    """两段声音之间的停顿不被裁剪"""
+    samples = np.concatenate([_silence(0.3), _tone(0.2), _silence(0.4), _tone(0.2), _silence(0.3)])
+
+    trimmed = trim_silence(samples, RATE, keep_ms=0)
+    assert len(trimmed) == int(RATE * 0.8)
+
+
+def test_trim_streaming_matches_whole():
+    """分块送入(块长与检测帧不对齐)与一次性裁剪结果相同"""
+    samples = np.concatenate([_silence(0.37), _tone(0.61), _silence(0.2), _tone(0.1), _silence(0.43)])
+
+    whole = trim_silence(samples, RATE)
+    streamed = _run_stage(SilenceTrimmer(RATE), samples, chunk=1001)
+    np.testing.assert_array_equal(streamed, whole)
+
+
+def test_trim_all_silence_is_empty():
+    """全部为静音时输出为空"""
+    assert len(trim_silence(_silence(1.0), RATE)) == 0
+
+
+@pytest.mark.parametrize("src, dst", [(24000, 48000), (48000, 16000), (24000, 44100)])
+def test_resample_length(src, dst):
+    """输出长度为 ceil(输入长度 * dst / src)"""
+    samples = _tone(0.5, rate=src)
+    out = resample(samples, src, dst)
+    assert out.dtype == np.int16
+    assert len(out) == -(-len(samples) * dst // src)
+
+
+def test_resample_streaming_matches_whole():
+    """分块流式重采样与一次性重采样结果相同"""
+    samples = _tone(0.5, rate=24000)
+    whole = resample(samples, 24000, 44100)
+    streamed = _run_stage(Resampler(24000, 44100), samples, chunk=777)
+    np.testing.assert_array_equal(streamed, whole)
+
+
+def test_resample_preserves_frequency():
+    """重采样后主频不变"""
+    out = resample(_tone(1.0, freq=1000.0, rate=24000), 24000, 16000)[:, 0].astype(np.float64)
+    spectrum = np.abs(np.fft.rfft(out))
+    peak_hz = np.argmax(spectrum) * 16000 / len(out)
+    assert peak_hz == pytest.approx(1000.0, abs=2.0)
+
+
+def test_resample_same_rate_is_passthrough():
+    """采样率相同时原样返回"""
+    samples = _tone(0.1)
+    np.testing.assert_array_equal(resample(samples, RATE, RATE), samples)
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+audio_probe 单元测试
+用构造的WAV/RF64/MP3文件头验证时长、格式和数据长度的探测结果
+"""
+import struct
+import wave
+
+import pytest
+
+from audio_probe import probe_audio, probe_duration
+from wav_writer import build_wav_header
+
+# MPEG1 Layer III, 128kbps, 44.1kHz, 单声道, 无CRC
+MP3_MONO_HEADER = 0xFFFB90C4
+MP3_FRAME_LENGTH = 144 * 128000 // 44100
+
+
+def _write_wav(path, frames: int, sample_rate: int = 24000, channels: int = 1):
+    with wave.open(str(path), "wb") as w:
+        w.setnchannels(channels)
+        w.setsampwidth(2)
+        w.setframerate(sample_rate)
+        w.writeframes(bytes(frames * channels * 2))
+
+
+def _mp3_frame(payload: bytes = b"") -> bytes:
+    frame = struct.pack(">I", MP3_MONO_HEADER) + payload
+    return frame + bytes(MP3_FRAME_LENGTH - len(frame))
+
+
+def test_probe_wav(tmp_path):
+    """普通WAV按data块长度计算时长"""
+    path = tmp_path / "a.wav"
+    _write_wav(path, 48000, sample_rate=24000, channels=2)
+
+    info = probe_audio(path)
+    assert info["format"] == "wav"
+    assert info["sample_rate"] == 24000
+    assert info["channels"] == 2
+    assert info["bits_per_sample"] == 16
+    assert info["data_size"] == 48000 * 4
+    assert info["duration"] == pytest.approx(2.0)
+
+
+def test_probe_streaming_wav_uses_file_size(tmp_path):
+    """流式写入(长度为占位值)的WAV以实际文件长度为准"""
+    path = tmp_path / "stream.wav"
+    path.write_bytes(build_wav_header(24000, 1, 2) + bytes(24000 * 2))
+
+    info = probe_audio(path)
+    assert info["data_size"] == 24000 * 2
+    assert info["duration"] == pytest.approx(1.0)
+
+
+def test_probe_rf64_reads_ds64(tmp_path):
+    """RF64文件从ds64块读取数据长度(不超过实际文件长度)"""
+    path = tmp_path / "big.wav"
+    header = build_wav_header(24000, 1, 2, data_size=5 * 1024 ** 3)
+    assert header[:4] == b"RF64"
+    path.write_bytes(header + bytes(4800))
+
+    info = probe_audio(path)
+    assert info["format"] == "wav"
+    assert info["data_size"] == 4800
+    assert info["duration"] == pytest.approx(0.1)
+
+
+def test_probe_cbr_mp3(tmp_path):
+    """没有Xing头的MP3按首帧比特率估算时长"""
+    path = tmp_path / "cbr.mp3"
+    path.write_bytes(_mp3_frame() * 100)
+
+    info = probe_audio(path)
+    assert info["format"] == "mp3"
+    assert info["sample_rate"] == 44100
+    assert info["channels"] == 1
+    assert info["bit_rate"] == 128000
+    assert info["duration"] == pytest.approx(100 * MP3_FRAME_LENGTH * 8 / 128000)
+
+
+def test_probe_xing_mp3(tmp_path):
+    """Xing头中的帧数优先于按比特率估算"""
+    path = tmp_path / "vbr.mp3"
+    # 单声道MPEG1的边信息为17字节,Xing头紧随其后
+    xing = bytes(17) + b"Xing" + struct.pack(">III", 0x3, 1000, 200000)
+    path.write_bytes(b"ID3\x03\x00\x00\x00\x00\x00\x00" + _mp3_frame(xing) + _mp3_frame() * 10)
+
+    info = probe_audio(path)
+    assert info["duration"] == pytest.approx(1000 * 1152 / 44100)
+    assert info["bit_rate"] == int(200000 * 8 / info["duration"])
+
+
+def test_probe_unknown_format(tmp_path):
+    """无法识别的文件抛出ValueError,probe_duration返回None"""
+    path = tmp_path / "noise.bin"
+    path.write_bytes(b"not audio" * 100)
+
+    with pytest.raises(ValueError):
+        probe_audio(path)
+    assert probe_duration(path) is None
@@ -171,6 +171,45 @@ def test_mp3_quality_comparison():
         client.close()
 
 
+def test_mp3_quality_local_resample():
+    """MP3不同质量对比测试(一次合成，本地重采样)"""
+    client = MP3TTSClient()
+    
+    try:
+        print("🎵 MP3质量对比测试 - 本地重采样")
+        print("=" * 40)
+        
+        text = TEST_TEXTS["medium"]
+        speaker = input(f"音色 (回车默认 {DEFAULT_SPEAKER}): ").strip() or DEFAULT_SPEAKER
+        
+        output_files = {
+            config['sample_rate']: f"mp3_local_{config['sample_rate']}Hz_{config['bit_rate']//1000}k.mp3"
+            for config in MP3_CONFIGS
+        }
+        bit_rates = {config['sample_rate']: config['bit_rate'] // 1000 for config in MP3_CONFIGS}
+        
+        print(f"🚀 仅合成一次 ({max(output_files)}Hz)，其余采样率本地生成")
+        results = client.synthesize_multi_rate(
+            text=text,
+            output_files=output_files,
+            speaker=speaker,
+            bit_rates=bit_rates
+        )
+        
+        print(f"\n📊 MP3质量对比结果:")
+        print("-" * 60)
+        for config in MP3_CONFIGS:
+            output_file = output_files[config['sample_rate']]
+            if results.get(config['sample_rate']) and Path(output_file).exists():
+                file_size = Path(output_file).stat().st_size
+                print(f"{config['desc']:<25} | {file_size/1024:>8.1f} KB | {output_file}")
+            else:
+                print(f"{config['desc']:<25} | ❌ 失败")
+    
+    finally:
+        client.close()
+
+
 def test_mp3_different_texts():
     """不同长度文本的MP3测试"""
     client = MP3TTSClient()
@@ -339,8 +378,9 @@ def main():
         print("3. 不同长度文本测试")
         print("4. 带情感MP3测试")
         print("5. 交互式MP3测试")
+        print("6. 质量对比测试 (一次合成+本地重采样)")
         
-        choice = input("请选择 (1-5): ").strip()
+        choice = input("请选择 (1-6): ").strip()
         
         if choice == "1":
             test_mp3_basic()
@@ -352,6 +392,8 @@ def main():
             test_mp3_with_emotions()
         elif choice == "5":
             test_mp3_interactive()
+        elif choice == "6":
+            test_mp3_quality_local_resample()
         else:
             print("❌ 无效选择")
     
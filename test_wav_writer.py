@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+wav_writer 单元测试
+拼接多个响应、回滚失败的响应，以及数据超过4GiB时文件头切换为RF64
+"""
+import struct
+import wave
+
+import pytest
+
+from audio_probe import probe_audio
+from wav_writer import HEADER_SIZE, RIFF_MAX_SIZE, StreamingWavWriter, build_wav_header
+
+# 不超过32位RIFF长度上限的最大(偶数)数据长度
+MAX_RIFF_DATA = RIFF_MAX_SIZE - (HEADER_SIZE - 8) - 1
+
+
+def _wav_bytes(pcm: bytes, sample_rate: int = 24000) -> bytes:
+    return build_wav_header(sample_rate, 1, 2, len(pcm)) + pcm
+
+
+def _parse_header(header: bytes) -> dict:
+    magic, riff_size = struct.unpack("<4sI", header[:8])
+    ds64_id, _, ds64_riff, ds64_data, ds64_samples = struct.unpack("<4sIQQQ", header[12:44])
+    data_id, data_size = struct.unpack("<4sI", header[HEADER_SIZE - 8:HEADER_SIZE])
+    assert header[8:12] == b"WAVE" and data_id == b"data"
+    return {
+        "magic": magic,
+        "riff_size": riff_size,
+        "ds64": ds64_id,
+        "ds64_riff": ds64_riff,
+        "ds64_data": ds64_data,
+        "ds64_samples": ds64_samples,
+        "data_size": data_size,
+    }
+
+
+def test_concatenates_responses(tmp_path):
+    """各响应的WAV头被剥离，PCM连续拼接，格式取自第一个响应"""
+    path = tmp_path / "out.wav"
+    with StreamingWavWriter(path) as writer:
+        for pcm in (b"\x01\x00" * 100, b"\x02\x00" * 50):
+            writer.begin_response()
+            data = _wav_bytes(pcm, sample_rate=16000)
+            # 文件头跨块到达
+            writer.write_response_chunk(data[:10])
+            writer.write_response_chunk(data[10:])
+
+    with wave.open(str(path)) as w:
+        assert w.getframerate() == 16000
+        assert w.readframes(w.getnframes()) == b"\x01\x00" * 100 + b"\x02\x00" * 50
+
+
+def test_rejects_mismatched_format(tmp_path):
+    """拼接的响应格式不一致时报错"""
+    with StreamingWavWriter(tmp_path / "out.wav", sample_rate=24000, channels=1, sample_width=2) as writer:
+        writer.begin_response()
+        with pytest.raises(ValueError):
+            writer.write_response_chunk(_wav_bytes(b"\x00\x00", sample_rate=16000))
+
+
+def test_rollback_discards_failed_response(tmp_path):
+    """回滚只丢弃当前响应已写入的数据"""
+    path = tmp_path / "out.wav"
+    with StreamingWavWriter(path, 24000, 1, 2) as writer:
+        writer.begin_response()
+        writer.write_response_chunk(b"\x01\x00" * 10)
+        writer.begin_response()
+        writer.write_response_chunk(b"\x02\x00" * 10)
+        writer.rollback_response()
+
+    assert probe_audio(path)["data_size"] == 20
+    with wave.open(str(path)) as w:
+        assert w.readframes(w.getnframes()) == b"\x01\x00" * 10
+
+
+def test_streaming_header_has_placeholder_lengths(tmp_path):
+    """写入过程中文件头长度为占位值，关闭后回填实际长度"""
+    path = tmp_path / "out.wav"
+    writer = StreamingWavWriter(path, 24000, 1, 2)
+    writer.write_pcm(bytes(4800))
+    writer._file.flush()
+    header = _parse_header(path.read_bytes()[:HEADER_SIZE])
+    assert header["magic"] == b"RIFF" and header["ds64"] == b"JUNK"
+    assert header["riff_size"] == header["data_size"] == RIFF_MAX_SIZE
+    assert probe_audio(path)["duration"] == pytest.approx(0.1)
+
+    writer.close()
+    header = _parse_header(path.read_bytes()[:HEADER_SIZE])
+    assert header["data_size"] == 4800
+    assert header["riff_size"] == HEADER_SIZE - 8 + 4800
+
+
+def test_header_switches_to_rf64_above_4gib():
+    """RIFF长度恰好不超过上限时保持RIFF，超过后改写为RF64并在ds64块中记录64位长度"""
+    header = _parse_header(build_wav_header(24000, 1, 2, MAX_RIFF_DATA))
+    assert header["magic"] == b"RIFF"
+    assert header["riff_size"] == RIFF_MAX_SIZE - 1
+    assert header["data_size"] == MAX_RIFF_DATA
+
+    data_size = MAX_RIFF_DATA + 2
+    header = _parse_header(build_wav_header(24000, 1, 2, data_size))
+    assert header["magic"] == b"RF64"
+    assert header["ds64"] == b"ds64"
+    assert header["riff_size"] == header["data_size"] == RIFF_MAX_SIZE
+    assert header["ds64_riff"] == HEADER_SIZE - 8 + data_size
+    assert header["ds64_data"] == data_size
+    assert header["ds64_samples"] == data_size // 2
+
+
+def test_close_writes_rf64_in_place(tmp_path):
+    """关闭时按写入长度原地改写为RF64，音频数据位置不变"""
+    path = tmp_path / "big.wav"
+    writer = StreamingWavWriter(path, 24000, 1, 2)
+    writer.write_pcm(b"\x07\x00" * 8)
+    # 模拟已写入超过4GiB(不实际写入)
+    writer.data_size = MAX_RIFF_DATA + 2
+    writer.close()
+
+    data = path.read_bytes()
+    header = _parse_header(data[:HEADER_SIZE])
+    assert header["magic"] == b"RF64"
+    assert header["ds64_data"] == MAX_RIFF_DATA + 2
+    assert data[HEADER_SIZE:HEADER_SIZE + 16] == b"\x07\x00" * 8
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+waveform_peaks 单元测试
+峰值计算、多级降采样、编解码往返以及从WAV文件读取
+"""
+import wave
+
+import numpy as np
+import pytest
+
+from waveform_peaks import (
+    LEVEL_FACTOR,
+    MIN_LEVEL_PEAKS,
+    PeaksBuilder,
+    decode_peaks,
+    encode_peaks,
+    load_peaks,
+    peaks_path,
+    select_level,
+)
+
+
+def _ramp(count: int, channels: int = 1) -> np.ndarray:
+    values = (np.arange(count) % 2000 - 1000).astype(np.int16)
+    return np.repeat(values[:, None], channels, axis=1)
+
+
+def test_builder_min_max_per_peak():
+    """每个峰值为所覆盖采样的最小值和最大值，不足一个宽度的余量单独成峰"""
+    builder = PeaksBuilder(24000, samples_per_peak=4)
+    builder.add(np.array([[1], [-3], [5], [2], [7], [-8]], dtype=np.int16))
+
+    (samples_per_peak, peaks), = builder.levels()
+    assert samples_per_peak == 4
+    assert peaks.tolist() == [[-3, 5], [-8, 7]]
+    assert builder.total_samples == 6
+
+
+def test_builder_chunking_is_transparent():
+    """分块送入(块长与峰值宽度不对齐)与一次送入结果相同"""
+    samples = _ramp(10_000, channels=2)
+    whole = PeaksBuilder(24000, channels=2, samples_per_peak=64)
+    whole.add(samples)
+    chunked = PeaksBuilder(24000, channels=2, samples_per_peak=64)
+    for i in range(0, len(samples), 999):
+        chunked.add_pcm(samples[i:i + 999].astype("<i2").tobytes())
+
+    assert whole.to_bytes() == chunked.to_bytes()
+
+
+def test_coarser_levels():
+    """峰值超过MIN_LEVEL_PEAKS时逐级按LEVEL_FACTOR合并"""
+    builder = PeaksBuilder(24000, samples_per_peak=1)
+    builder.add(_ramp(MIN_LEVEL_PEAKS * LEVEL_FACTOR * 2))
+    levels = builder.levels()
+
+    assert [size for size, _ in levels] == [1, LEVEL_FACTOR, LEVEL_FACTOR ** 2]
+    assert len(levels[-1][1]) <= MIN_LEVEL_PEAKS
+    fine, coarse = levels[0][1], levels[1][1]
+    assert coarse[0].tolist() == [fine[:LEVEL_FACTOR, 0].min(), fine[:LEVEL_FACTOR, 1].max()]
+
+
+def test_encode_decode_roundtrip():
+    """编码后解码得到相同的采样率、总采样数和各级峰值"""
+    builder = PeaksBuilder(16000, samples_per_peak=8)
+    builder.add(_ramp(50_000))
+    levels = builder.levels()
+
+    sample_rate, total_samples, decoded = decode_peaks(encode_peaks(levels, 16000, 50_000))
+    assert (sample_rate, total_samples) == (16000, 50_000)
+    assert len(decoded) == len(levels)
+    for (size, peaks), (decoded_size, decoded_peaks) in zip(levels, decoded):
+        assert size == decoded_size
+        np.testing.assert_array_equal(peaks, decoded_peaks)
+
+
+@pytest.mark.parametrize("data", [b"", b"NOPE" + bytes(20)])
+def test_decode_rejects_invalid(data):
+    with pytest.raises(ValueError):
+        decode_peaks(data)
+
+
+def test_decode_rejects_truncated():
+    builder = PeaksBuilder(24000, samples_per_peak=4)
+    builder.add(_ramp(100))
+    with pytest.raises(ValueError):
+        decode_peaks(builder.to_bytes()[:-2])
+
+
+def test_select_level():
+    """选择峰值个数不超过上限的最细一级，都超过时返回最粗一级"""
+    levels = [(1, np.zeros((1000, 2))), (4, np.zeros((250, 2))), (16, np.zeros((63, 2)))]
+    assert select_level(levels, 300)[0] == 4
+    assert select_level(levels, 10)[0] == 16
+    assert select_level(levels, 5000)[0] == 1
+
+
+def test_load_peaks_from_wav(tmp_path):
+    """首次读取时计算并保存峰值文件，按max_peaks只返回一级"""
+    audio = tmp_path / "line.wav"
+    with wave.open(str(audio), "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(24000)
+        w.writeframes(_ramp(24000 * 30).astype("<i2").tobytes())
+
+    data = load_peaks(audio)
+    assert peaks_path(audio).read_bytes() == data
+    sample_rate, total_samples, levels = decode_peaks(data)
+    assert (sample_rate, total_samples) == (24000, 24000 * 30)
+    assert len(levels) > 1
+    assert levels[0][1].min() == -1000 and levels[0][1].max() == 999
+
+    _, _, selected = decode_peaks(load_peaks(audio, max_peaks=1000))
+    assert len(selected) == 1
+    assert selected[0][0] == levels[1][0] and len(selected[0][1]) <= 1000
@@ -7,13 +7,18 @@ import base64
 import json
 import logging
 import os
+import tempfile
+import threading
 import uuid
+from collections import OrderedDict
 from pathlib import Path
-from typing import Dict, List, Optional, Union
+from typing import Callable, Dict, Iterator, List, Optional, Union
 
 import requests
 from dotenv import load_dotenv
 
+from wav_writer import StreamingWavWriter
+
 # 加载环境变量
 load_dotenv()
 
@@ -36,6 +41,13 @@ class TTSHttpClient:
         self.base_url = "https://openspeech.bytedance.com/api/v3/tts/unidirectional"
         self.session = requests.Session()  # 复用连接
         
+        # 多采样率合成的源音频缓存: 请求参数 -> (PCM数组, 采样率)
+        self._source_cache = OrderedDict()
+        self.source_cache_size = 16
+        
+        # 本地转码器(按需创建)
+        self._transcoder = None
+        
         if not self.appid or not self.access_token:
             raise ValueError("❌ 请在.env文件中配置VOLCENGINE_APP_ID和VOLCENGINE_ACCESS_TOKEN")
     
@@ -137,29 +149,44 @@ class TTSHttpClient:
     def synthesize_speech(
         self,
         text: str,
-        output_file: str,
+        output_file: Optional[str],
         speaker: Optional[str] = None,
         audio_format: str = "wav",
         sample_rate: int = 24000,
+        wav_writer: Optional[StreamingWavWriter] = None,
+        on_sentence: Optional[Callable[[Dict], None]] = None,
         **kwargs
     ) -> bool:
         """
         合成语音
         
+        WAV格式边接收边写盘(先写入 .part 文件，成功后再替换为output_file)，
+        其他格式在接收完成后一次性写入。
+        
         Args:
             text: 要合成的文本
-            output_file: 输出文件路径
+            output_file: 输出文件路径(指定wav_writer时可为None)
             speaker: 语音类型，如不指定则使用默认值
             audio_format: 音频格式 (wav/mp3/pcm/ogg_opus)
             sample_rate: 采样率
+            wav_writer: 流式WAV写入器，指定时音频(去掉本次响应的WAV头)追加到该写入器，
+                        可把多次合成拼接为一个文件
+            on_sentence: 时间戳回调，每收到一句的时间戳调用一次(参数见 parse_sentence)，
+                         指定时自动开启 enable_timestamp
             **kwargs: 其他参数
         
         Returns:
             bool: 是否成功
         """
+        writer = None
+        owns_writer = False
+        success = False
+        
         try:
             # 使用指定speaker或默认值
             voice_type = speaker or self.voice_type
+            if on_sentence is not None:
+                kwargs.setdefault("enable_timestamp", True)
             
             # 构建请求
             headers = self.get_headers()
@@ -191,63 +218,53 @@ class TTSHttpClient:
             logid = response.headers.get('X-Tt-Logid', 'unknown')
             logger.info(f"✅ 请求成功! LogID: {logid}")
             
+            # WAV格式直接流式写盘，不在内存中拼接整段音频
+            if wav_writer is not None:
+                writer = wav_writer
+            elif audio_format == "wav":
+                writer = StreamingWavWriter(f"{output_file}.part")
+                owns_writer = True
+            if writer is not None:
+                writer.begin_response()
+            
             # 处理流式响应
             audio_data = bytearray()
-            has_audio = False
+            received = 0
             
-            for line in response.iter_lines():
-                if not line:
-                    continue
-                
-                try:
-                    # 解析JSON响应
-                    response_data = json.loads(line.decode('utf-8'))
-                    
-                    # 检查错误
-                    code = response_data.get('code', 0)
-                    message = response_data.get('message', '')
-                    
-                    if code == 20000000:
-                        # 合成结束
-                        logger.info("🏁 音频合成完成")
-                        break
-                    elif code != 0:
-                        # 错误响应
-                        logger.error(f"❌ 服务端错误 [Code: {code}]: {message}")
-                        return False
-                    
-                    # 获取音频数据
-                    audio_base64 = response_data.get('data')
-                    if audio_base64:
-                        # 解码base64音频数据
-                        audio_chunk = base64.b64decode(audio_base64)
-                        audio_data.extend(audio_chunk)
-                        has_audio = True
-                        logger.info(f"🔊 接收音频数据: {len(audio_chunk)} 字节")
-                    
-                    # 获取时间戳信息（如果启用）
-                    sentence = response_data.get('sentence')
-                    if sentence:
-                        logger.info(f"📝 时间戳信息: {sentence.get('text', '')}")
-                
-                except json.JSONDecodeError as e:
-                    logger.warning(f"⚠️ 无法解析响应行: {line[:100]}... 错误: {e}")
-                    continue
+            for audio_chunk in self._iter_audio(response, on_sentence):
+                if writer is not None:
+                    writer.write_response_chunk(audio_chunk)
+                else:
+                    audio_data.extend(audio_chunk)
+                received += len(audio_chunk)
+            
+            if not received:
+                logger.warning("⚠️ 没有接收到音频数据")
+                return False
             
             # 保存音频文件
-            if has_audio and audio_data:
+            if owns_writer:
+                if writer.sample_rate is None:
+                    # 响应不带WAV头时按请求参数补全格式
+                    writer.sample_rate, writer.channels, writer.sample_width = sample_rate, 1, 2
+                writer.close()
+                output_path = Path(output_file)
+                os.replace(writer.path, output_path)
+            elif writer is not None:
+                logger.info(f"💾 音频已追加到: {writer.path.absolute()} (累计 {writer.duration:.1f} 秒)")
+                success = True
+                return True
+            else:
                 output_path = Path(output_file)
                 output_path.parent.mkdir(parents=True, exist_ok=True)
                 
                 with open(output_path, 'wb') as f:
                     f.write(audio_data)
-                
-                logger.info(f"💾 音频保存成功: {output_path.absolute()}")
-                logger.info(f"📊 文件大小: {len(audio_data):,} 字节 ({len(audio_data)/1024:.1f} KB)")
-                return True
-            else:
-                logger.warning("⚠️ 没有接收到音频数据")
-                return False
+            
+            logger.info(f"💾 音频保存成功: {output_path.absolute()}")
+            logger.info(f"📊 文件大小: {received:,} 字节 ({received/1024:.1f} KB)")
+            success = True
+            return True
         
         except requests.exceptions.RequestException as e:
             logger.error(f"❌ HTTP请求失败: {e}")
@@ -255,6 +272,167 @@ class TTSHttpClient:
         except Exception as e:
             logger.error(f"❌ 合成失败: {e}")
             return False
+        finally:
+            # 失败时清理未完成的输出
+            if not success and writer is not None:
+                if owns_writer:
+                    writer.close()
+                    writer.path.unlink(missing_ok=True)
+                else:
+                    writer.rollback_response()
+    
+    def stream_speech(
+        self,
+        text: str,
+        speaker: Optional[str] = None,
+        audio_format: str = "pcm",
+        sample_rate: int = 24000,
+        cancel_event: Optional[threading.Event] = None,
+        on_sentence: Optional[Callable[[Dict], None]] = None,
+        **kwargs
+    ) -> Iterator[bytes]:
+        """
+        流式合成语音，每收到一块音频立即产出(用于边合成边播放)
+        
+        Args:
+            text: 要合成的文本
+            speaker: 语音类型，如不指定则使用默认值
+            audio_format: 音频格式，默认pcm(不带文件头，可直接拼接播放)
+            sample_rate: 采样率
+            cancel_event: 取消事件，置位后停止接收并关闭连接
+            on_sentence: 时间戳回调(同 synthesize_speech)
+            **kwargs: 其他参数(同 synthesize_speech)
+        
+        Yields:
+            bytes: 音频数据块
+        
+        Raises:
+            RuntimeError: 服务端返回错误
+            requests.exceptions.RequestException: HTTP请求失败
+        """
+        voice_type = speaker or self.voice_type
+        if on_sentence is not None:
+            kwargs.setdefault("enable_timestamp", True)
+        payload = self.build_request_payload(
+            text=text,
+            speaker=voice_type,
+            audio_format=audio_format,
+            sample_rate=sample_rate,
+            **kwargs
+        )
+        
+        logger.info(f"🚀 开始流式TTS合成: {text[:50]}...")
+        
+        # 提前退出(取消或调用方关闭生成器)时随上下文关闭连接
+        with self.session.post(
+            self.base_url,
+            headers=self.get_headers(),
+            json=payload,
+            stream=True,
+            timeout=60
+        ) as response:
+            response.raise_for_status()
+            for audio_chunk in self._iter_audio(response, on_sentence):
+                if cancel_event is not None and cancel_event.is_set():
+                    logger.info("⏹️ 流式合成已取消")
+                    return
+                yield audio_chunk
+    
+    def _iter_audio(
+        self,
+        response: requests.Response,
+        on_sentence: Optional[Callable[[Dict], None]] = None
+    ) -> Iterator[bytes]:
+        """
+        解析流式响应，逐块产出解码后的音频数据，合成结束时停止
+        
+        Args:
+            response: 流式响应
+            on_sentence: 时间戳回调，参数为 parse_sentence 的结果
+        
+        Raises:
+            RuntimeError: 服务端返回错误，或连接在收到合成结束标记前断开(音频不完整)
+        """
+        for line in response.iter_lines():
+            if not line:
+                continue
+            
+            try:
+                # 解析JSON响应
+                response_data = json.loads(line.decode('utf-8'))
+            except json.JSONDecodeError as e:
+                logger.warning(f"⚠️ 无法解析响应行: {line[:100]}... 错误: {e}")
+                continue
+            
+            # 检查错误
+            code = response_data.get('code', 0)
+            message = response_data.get('message', '')
+            
+            if code == 20000000:
+                # 合成结束
+                logger.info("🏁 音频合成完成")
+                return
+            elif code != 0:
+                # 错误响应
+                logger.error(f"❌ 服务端错误 [Code: {code}]: {message}")
+                raise RuntimeError(f"服务端错误 [Code: {code}]: {message}")
+            
+            # 获取音频数据
+            audio_base64 = response_data.get('data')
+            if audio_base64:
+                # 解码base64音频数据
+                audio_chunk = base64.b64decode(audio_base64)
+                logger.info(f"🔊 接收音频数据: {len(audio_chunk)} 字节")
+                yield audio_chunk
+            
+            # 获取时间戳信息（如果启用）
+            sentence = response_data.get('sentence')
+            if sentence:
+                logger.info(f"📝 时间戳信息: {sentence.get('text', '')}")
+                if on_sentence is not None:
+                    parsed = self.parse_sentence(sentence)
+                    if parsed:
+                        on_sentence(parsed)
+        
+        # 没有收到结束标记就读完了响应: 连接中途断开，已收到的音频不完整
+        logger.error("❌ 响应在合成结束前中断")
+        raise RuntimeError("响应在合成结束前中断，音频不完整")
+    
+    @staticmethod
+    def parse_sentence(sentence: Dict) -> Optional[Dict]:
+        """
+        整理服务端返回的句级时间戳
+        
+        Args:
+            sentence: 响应中的 sentence 字段，包含 text 和 words(每个词的 word/startTime/endTime，单位秒)
+        
+        Returns:
+            dict: {"text", "start", "end", "words": [{"word", "start", "end"}, ...]}，
+                  时间为相对本次合成音频开头的秒数；没有任何时间信息时返回None
+        """
+        def seconds(item: Dict, *keys: str) -> Optional[float]:
+            for key in keys:
+                value = item.get(key)
+                if isinstance(value, (int, float)):
+                    return float(value)
+            return None
+        
+        words = []
+        for word in sentence.get('words') or []:
+            start = seconds(word, 'startTime', 'start_time')
+            end = seconds(word, 'endTime', 'end_time')
+            if start is None or end is None:
+                continue
+            words.append({"word": word.get('word', ''), "start": start, "end": max(start, end)})
+        
+        start = seconds(sentence, 'startTime', 'start_time')
+        end = seconds(sentence, 'endTime', 'end_time')
+        if words:
+            start = words[0]["start"] if start is None else start
+            end = words[-1]["end"] if end is None else end
+        if start is None or end is None:
+            return None
+        return {"text": sentence.get('text', ''), "start": start, "end": max(start, end), "words": words}
     
     def synthesize_with_mix(
         self,
@@ -296,9 +474,135 @@ class TTSHttpClient:
             **kwargs
         )
     
+    def synthesize_multi_rate(
+        self,
+        text: str,
+        output_files: Dict[int, str],
+        speaker: Optional[str] = None,
+        bit_rates: Optional[Dict[int, int]] = None,
+        **kwargs
+    ) -> Dict[int, bool]:
+        """
+        一次合成、本地重采样得到多个采样率版本
+        
+        以请求的最高采样率合成一次WAV，其余采样率通过本地多相重采样得到，
+        相同参数的源音频和重采样结果都会缓存，重复调用不再消耗配额。
+        
+        Args:
+            text: 要合成的文本
+            output_files: {采样率: 输出文件路径}，格式由扩展名决定(wav/mp3等)
+            speaker: 语音类型，如不指定则使用默认值
+            bit_rates: {采样率: 比特率(kbps)}，仅压缩格式使用
+            **kwargs: 其他合成参数(同 synthesize_speech)
+        
+        Returns:
+            Dict[int, bool]: 每个采样率是否成功
+        """
+        from audio_pipeline import read_audio, resample_cached, write_audio
+        
+        if not output_files:
+            return {}
+        
+        voice_type = speaker or self.voice_type
+        source_rate = max(output_files)
+        cache_key = json.dumps(
+            {"text": text, "speaker": voice_type, "sample_rate": source_rate, **kwargs},
+            ensure_ascii=False, sort_keys=True, default=str
+        )
+        
+        cached = self._source_cache.get(cache_key)
+        if cached is not None:
+            self._source_cache.move_to_end(cache_key)
+            logger.info(f"♻️ 复用已合成的源音频 ({source_rate}Hz)")
+        else:
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                source_file = os.path.join(tmp_dir, "source.wav")
+                if not self.synthesize_speech(
+                    text=text,
+                    output_file=source_file,
+                    speaker=voice_type,
+                    audio_format="wav",
+                    sample_rate=source_rate,
+                    **kwargs
+                ):
+                    return {rate: False for rate in output_files}
+                cached = read_audio(source_file)
+            
+            self._source_cache[cache_key] = cached
+            if len(self._source_cache) > self.source_cache_size:
+                self._source_cache.popitem(last=False)
+        
+        samples, actual_rate = cached
+        bit_rates = bit_rates or {}
+        results = {}
+        
+        for rate, output_file in output_files.items():
+            try:
+                variant = resample_cached(samples, actual_rate, rate)
+                write_audio(output_file, variant, rate, bit_rates.get(rate))
+                logger.info(f"🔁 本地重采样 {actual_rate}Hz -> {rate}Hz: {output_file}")
+                results[rate] = True
+            except Exception as e:
+                logger.error(f"❌ 生成 {rate}Hz 版本失败: {e}")
+                results[rate] = False
+        
+        return results
+    
+    def synthesize_to_formats(
+        self,
+        text: str,
+        output_stem: str,
+        formats: List[str],
+        speaker: Optional[str] = None,
+        sample_rate: int = 24000,
+        overrides: Optional[Dict[str, Dict]] = None,
+        **kwargs
+    ) -> Dict[str, Optional[str]]:
+        """
+        一次合成WAV，本地并行转码为多种交付格式
+        
+        WAV即合成的源文件，不再转码(转码输出会覆盖源文件本身)
+        
+        Args:
+            text: 要合成的文本
+            output_stem: 输出路径前缀(不含扩展名)，如 "output/hello"
+            formats: 目标格式列表，如 ["wav", "mp3", "ogg_opus"]
+            speaker: 语音类型，如不指定则使用默认值
+            sample_rate: 采样率
+            overrides: 按格式覆盖编码参数，如 {"mp3": {"bitrate": "192k"}}
+            **kwargs: 其他合成参数(同 synthesize_speech)
+        
+        Returns:
+            Dict[str, Optional[str]]: 格式 -> 输出文件路径(失败为None)
+        """
+        from audio_transcode import Transcoder
+        
+        source_file = f"{output_stem}.wav"
+        if not self.synthesize_speech(
+            text=text,
+            output_file=source_file,
+            speaker=speaker,
+            audio_format="wav",
+            sample_rate=sample_rate,
+            **kwargs
+        ):
+            return {fmt: None for fmt in formats}
+        
+        targets = [fmt for fmt in formats if fmt != "wav"]
+        results = {}
+        if targets:
+            if self._transcoder is None:
+                self._transcoder = Transcoder()
+            logger.info(f"🎚️ 本地转码: {', '.join(targets)}")
+            results = self._transcoder.transcode(source_file, targets, output_stem, overrides)
+        return {fmt: source_file if fmt == "wav" else results[fmt] for fmt in formats}
+    
     def close(self):
         """关闭会话"""
         self.session.close()
+        if self._transcoder is not None:
+            self._transcoder.close()
+            self._transcoder = None
 
 
 def test_single_synthesis():
@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""
+流式WAV写入器
+边接收边写盘，关闭时回填RIFF/data长度；超过4GiB自动转为RF64格式。
+可把多次TTS请求返回的WAV流(各自带RIFF头)拼接为一个连续的WAV文件
+"""
+import logging
+import os
+import struct
+from pathlib import Path
+from typing import Optional, Union
+
+logger = logging.getLogger(__name__)
+
+# 32位RIFF长度字段的上限，超过后必须使用RF64
+RIFF_MAX_SIZE = 0xFFFFFFFF
+
+# 固定头部布局: RIFF头(12) + JUNK/ds64块(8+28) + fmt块(8+16) + data块头(8)
+_DS64_BODY_SIZE = 28
+HEADER_SIZE = 12 + 8 + _DS64_BODY_SIZE + 8 + 16 + 8
+
+
+def build_wav_header(
+    sample_rate: int,
+    channels: int,
+    sample_width: int,
+    data_size: Optional[int] = None,
+) -> bytes:
+    """
+    生成固定长度(HEADER_SIZE)的WAV文件头
+
+    Args:
+        sample_rate: 采样率
+        channels: 声道数
+        sample_width: 采样字节数
+        data_size: 音频数据字节数，为空表示长度未知(流式输出)，长度字段写0xFFFFFFFF占位值
+
+    Returns:
+        bytes: 文件头，数据超过4GiB时为RF64格式
+    """
+    block_align = channels * sample_width
+    junk = b"JUNK" + struct.pack("<I", _DS64_BODY_SIZE) + bytes(_DS64_BODY_SIZE)
+
+    if data_size is None:
+        magic, riff_field, data_field, ds64 = b"RIFF", RIFF_MAX_SIZE, RIFF_MAX_SIZE, junk
+    else:
+        riff_size = HEADER_SIZE - 8 + data_size + (data_size & 1)
+        if riff_size > RIFF_MAX_SIZE:
+            magic, riff_field, data_field = b"RF64", RIFF_MAX_SIZE, RIFF_MAX_SIZE
+            ds64 = b"ds64" + struct.pack(
+                "<IQQQI", _DS64_BODY_SIZE, riff_size, data_size, data_size // block_align, 0
+            )
+        else:
+            magic, riff_field, data_field, ds64 = b"RIFF", riff_size, data_size, junk
+
+    return (
+        magic + struct.pack("<I", riff_field) + b"WAVE"
+        + ds64
+        + b"fmt " + struct.pack(
+            "<IHHIIHH", 16, 1, channels, sample_rate,
+            sample_rate * block_align, block_align, sample_width * 8
+        )
+        + b"data" + struct.pack("<I", data_field)
+    )
+
+
+class StreamingWavWriter:
+    """
+    流式WAV写入器
+
+    头部预留一个28字节的JUNK块，文件超过4GiB时原地改写为ds64块(RF64)，
+    因此不需要移动已写入的音频数据。写入过程中头部长度为0xFFFFFFFF占位值，
+    即使进程中断，常见播放器也能按实际文件长度读取。
+    """
+
+    def __init__(
+        self,
+        path: Union[str, Path],
+        sample_rate: Optional[int] = None,
+        channels: Optional[int] = None,
+        sample_width: Optional[int] = None,
+    ):
+        """
+        Args:
+            path: 输出文件路径
+            sample_rate: 采样率，为空时取第一个响应WAV头中的值
+            channels: 声道数，为空时取第一个响应WAV头中的值
+            sample_width: 采样字节数，为空时取第一个响应WAV头中的值
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.sample_width = sample_width
+
+        self.data_size = 0
+        self._file = open(self.path, "wb")
+        self._write_header(streaming=True)
+
+        # 当前响应的头部解析状态
+        self._pending = b""
+        self._in_header = False
+        self._response_start = self.data_size
+
+    # ------------------------------------------------------------------
+    # 写入
+    # ------------------------------------------------------------------
+
+    def begin_response(self):
+        """开始一个新的响应，其开头的RIFF头(如有)会被剥离"""
+        self._pending = b""
+        self._in_header = True
+        self._response_start = self.data_size
+
+    def rollback_response(self):
+        """丢弃当前响应已写入的数据(如合成中途失败)"""
+        self._file.seek(HEADER_SIZE + self._response_start)
+        self._file.truncate()
+        self.data_size = self._response_start
+        self._pending = b""
+        self._in_header = False
+
+    def write_response_chunk(self, data: bytes):
+        """
+        写入当前响应的一块数据
+
+        响应开头若为RIFF/RF64头则解析并剥离，之后的数据作为PCM直接追加
+        """
+        if not self._in_header:
+            self.write_pcm(data)
+            return
+
+        self._pending += data
+        header_end = self._parse_response_header(self._pending)
+        if header_end is None:
+            return
+
+        self._in_header = False
+        pcm, self._pending = self._pending[header_end:], b""
+        self.write_pcm(pcm)
+
+    def write_pcm(self, pcm: bytes):
+        """追加原始PCM数据"""
+        if pcm:
+            self._file.write(pcm)
+            self.data_size += len(pcm)
+
+    def _parse_response_header(self, data: bytes) -> Optional[int]:
+        """
+        解析响应开头的WAV头
+
+        Returns:
+            PCM数据起始偏移；数据不足以判断时返回None
+        """
+        if len(data) < 12:
+            return None
+        if data[:4] not in (b"RIFF", b"RF64", b"BW64") or data[8:12] != b"WAVE":
+            # 不带头的原始PCM
+            return 0
+
+        pos = 12
+        while pos + 8 <= len(data):
+            chunk_id, chunk_size = struct.unpack("<4sI", data[pos:pos + 8])
+            if chunk_id == b"data":
+                return pos + 8
+            if chunk_id == b"fmt ":
+                if pos + 8 + 16 > len(data):
+                    return None
+                self._check_format(*struct.unpack("<HHIIHH", data[pos + 8:pos + 24]))
+            pos += 8 + chunk_size + (chunk_size & 1)
+        return None
+
+    def _check_format(self, audio_format, channels, sample_rate, byte_rate, block_align, bits):
+        """校验(或采用)响应中的音频格式，拼接的各段格式必须一致"""
+        fmt = (sample_rate, channels, bits // 8)
+        current = (self.sample_rate, self.channels, self.sample_width)
+        if current == (None, None, None):
+            self.sample_rate, self.channels, self.sample_width = fmt
+        elif current != fmt:
+            raise ValueError(f"WAV格式不一致: 期望 {current}, 实际 {fmt}")
+
+    # ------------------------------------------------------------------
+    # 头部
+    # ------------------------------------------------------------------
+
+    def _write_header(self, streaming: bool = False):
+        """写入(或回填)固定长度的文件头"""
+        header = build_wav_header(
+            self.sample_rate or 24000,
+            self.channels or 1,
+            self.sample_width or 2,
+            None if streaming else self.data_size,
+        )
+        self._file.seek(0)
+        self._file.write(header)
+
+    def close(self):
+        """回填长度字段并关闭文件"""
+        if self._file.closed:
+            return
+        self._file.seek(0, os.SEEK_END)
+        if self.data_size & 1:
+            self._file.write(b"\x00")
+        self._write_header()
+        self._file.close()
+
+        if self.data_size + HEADER_SIZE - 8 > RIFF_MAX_SIZE:
+            logger.info(f"💾 文件超过4GiB，已写为RF64: {self.path}")
+
+    @property
+    def duration(self) -> float:
+        """已写入音频的时长(秒)"""
+        block_align = (self.channels or 1) * (self.sample_width or 2)
+        return self.data_size / block_align / (self.sample_rate or 24000)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+"""
+波形峰值预计算
+把音频按多级分辨率计算为 (最小值, 最大值) 峰值数组，保存为音频旁的紧凑二进制文件(.peaks)，
+绘制波形时只需读取几KB的峰值，无需下载和解码整段WAV
+
+文件格式(小端):
+    文件头  4s 魔数"PEAK"，H 版本，H 级数，I 采样率，Q 总采样数
+    级别表  每级 I 每个峰值覆盖的采样数，I 峰值个数
+    数据    按级别表顺序依次存放，每个峰值为 h 最小值、h 最大值(16位PCM取值)
+"""
+import os
+import struct
+import uuid
+from pathlib import Path
+from typing import Iterator, List, Optional, Tuple, Union
+
+import numpy as np
+
+from audio_pipeline import pcm_to_array
+from audio_probe import probe_audio
+
+PEAKS_MAGIC = b"PEAK"
+PEAKS_VERSION = 1
+PEAKS_SUFFIX = ".peaks"
+
+# 最细一级每个峰值覆盖的采样数(24kHz下约10毫秒)
+DEFAULT_SAMPLES_PER_PEAK = 256
+
+# 相邻两级的分辨率倍数
+LEVEL_FACTOR = 4
+
+# 峰值个数不超过此值时不再生成更粗的级别
+MIN_LEVEL_PEAKS = 512
+
+# 读取WAV时每块的采样数(按峰值宽度对齐)
+READ_BLOCK_SAMPLES = DEFAULT_SAMPLES_PER_PEAK * 1024
+
+_HEADER = struct.Struct("<4sHHIQ")
+_LEVEL = struct.Struct("<II")
+
+# 一级峰值: (每个峰值覆盖的采样数, 形状为 (峰值数, 2) 的int16数组)
+PeakLevel = Tuple[int, np.ndarray]
+
+
+class PeaksBuilder:
+    """
+    增量计算峰值
+
+    按块送入PCM，只保留最细一级的峰值和不足一个峰值宽度的余量，
+    内存占用与音频长度的 1/samples_per_peak 成正比，可用于任意长度的音频。
+    """
+
+    def __init__(self, sample_rate: int, channels: int = 1,
+                 samples_per_peak: int = DEFAULT_SAMPLES_PER_PEAK):
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.samples_per_peak = samples_per_peak
+        self.total_samples = 0
+        self._blocks: List[np.ndarray] = []
+        self._remainder = np.zeros((0, 2), dtype=np.int16)
+
+    def add_pcm(self, data: bytes):
+        """送入16位小端PCM字节(长度需按帧对齐)"""
+        self.add(pcm_to_array(data, self.channels))
+
+    def add(self, samples: np.ndarray):
+        """
+        送入 (采样数, 声道数) 的int16数组
+
+        Args:
+            samples: 音频采样
+        """
+        if not len(samples):
+            return
+        self.total_samples += len(samples)
+        # 多声道合并为每个采样时刻的最小/最大值
+        frames = np.stack([samples.min(axis=1), samples.max(axis=1)], axis=1)
+        if len(self._remainder):
+            frames = np.concatenate([self._remainder, frames])
+
+        full = len(frames) - len(frames) % self.samples_per_peak
+        if full:
+            blocks = frames[:full].reshape(-1, self.samples_per_peak, 2)
+            self._blocks.append(np.stack([blocks[:, :, 0].min(axis=1), blocks[:, :, 1].max(axis=1)], axis=1))
+        self._remainder = frames[full:]
+
+    def levels(self) -> List[PeakLevel]:
+        """
+        各级峰值(从细到粗)
+
+        Returns:
+            list: [(每个峰值覆盖的采样数, 峰值数组), ...]
+        """
+        blocks = list(self._blocks)
+        if len(self._remainder):
+            blocks.append(np.array([[self._remainder[:, 0].min(), self._remainder[:, 1].max()]], dtype=np.int16))
+        peaks = np.concatenate(blocks) if blocks else np.zeros((0, 2), dtype=np.int16)
+
+        levels = [(self.samples_per_peak, peaks.astype(np.int16))]
+        while len(peaks) > MIN_LEVEL_PEAKS:
+            starts = np.arange(0, len(peaks), LEVEL_FACTOR)
+            peaks = np.stack([
+                np.minimum.reduceat(peaks[:, 0], starts),
+                np.maximum.reduceat(peaks[:, 1], starts),
+            ], axis=1)
+            levels.append((levels[-1][0] * LEVEL_FACTOR, peaks))
+        return levels
+
+    def to_bytes(self) -> bytes:
+        """编码为 .peaks 文件内容"""
+        return encode_peaks(self.levels(), self.sample_rate, self.total_samples)
+
+
+def encode_peaks(levels: List[PeakLevel], sample_rate: int, total_samples: int) -> bytes:
+    """
+    编码峰值
+
+    Args:
+        levels: 各级峰值
+        sample_rate: 采样率
+        total_samples: 音频总采样数
+
+    Returns:
+        bytes: .peaks 文件内容
+    """
+    parts = [_HEADER.pack(PEAKS_MAGIC, PEAKS_VERSION, len(levels), sample_rate, total_samples)]
+    parts.extend(_LEVEL.pack(samples_per_peak, len(peaks)) for samples_per_peak, peaks in levels)
+    parts.extend(np.ascontiguousarray(peaks, dtype="<i2").tobytes() for _, peaks in levels)
+    return b"".join(parts)
+
+
+def decode_peaks(data: bytes) -> Tuple[int, int, List[PeakLevel]]:
+    """
+    解码峰值
+
+    Args:
+        data: .peaks 文件内容
+
+    Returns:
+        (采样率, 总采样数, 各级峰值)
+
+    Raises:
+        ValueError: 文件格式无效
+    """
+    if len(data) < _HEADER.size:
+        raise ValueError("峰值文件过短")
+    magic, version, count, sample_rate, total_samples = _HEADER.unpack_from(data)
+    if magic != PEAKS_MAGIC or version != PEAKS_VERSION:
+        raise ValueError("无法识别的峰值文件")
+
+    offset = _HEADER.size + count * _LEVEL.size
+    levels = []
+    for i in range(count):
+        samples_per_peak, peak_count = _LEVEL.unpack_from(data, _HEADER.size + i * _LEVEL.size)
+        size = peak_count * 4
+        if offset + size > len(data):
+            raise ValueError("峰值文件不完整")
+        peaks = np.frombuffer(data, dtype="<i2", count=peak_count * 2, offset=offset).reshape(-1, 2)
+        levels.append((samples_per_peak, peaks))
+        offset += size
+    return sample_rate, total_samples, levels
+
+
+def select_level(levels: List[PeakLevel], max_peaks: int) -> PeakLevel:
+    """
+    选择峰值个数不超过 max_peaks 的最细一级(都超过时返回最粗一级)
+
+    Args:
+        levels: 各级峰值(从细到粗)
+        max_peaks: 最多需要的峰值个数(通常为绘制宽度的像素数)
+    """
+    for level in levels:
+        if len(level[1]) <= max_peaks:
+            return level
+    return levels[-1]
+
+
+def _iter_wav_pcm(path: Union[str, Path]) -> Tuple[dict, Iterator[bytes]]:
+    """读取16位PCM WAV的格式信息和按块读取数据的迭代器"""
+    info = probe_audio(path)
+    if info["format"] != "wav" or info.get("bits_per_sample") != 16:
+        raise ValueError(f"仅支持16位PCM WAV: {path}")
+
+    block_bytes = READ_BLOCK_SAMPLES * info["channels"] * 2
+
+    def chunks() -> Iterator[bytes]:
+        remaining = info["data_size"]
+        with open(path, "rb") as f:
+            f.seek(info["data_offset"])
+            while remaining > 0:
+                chunk = f.read(min(block_bytes, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+
+    return info, chunks()
+
+
+def compute_file_peaks(path: Union[str, Path],
+                       samples_per_peak: int = DEFAULT_SAMPLES_PER_PEAK) -> bytes:
+    """
+    按块读取WAV文件并计算峰值
+
+    Args:
+        path: 16位PCM WAV文件
+        samples_per_peak: 最细一级每个峰值覆盖的采样数
+
+    Returns:
+        bytes: .peaks 文件内容
+    """
+    info, chunks = _iter_wav_pcm(path)
+    builder = PeaksBuilder(info["sample_rate"], info["channels"], samples_per_peak)
+    for chunk in chunks:
+        builder.add_pcm(chunk)
+    return builder.to_bytes()
+
+
+def peaks_path(audio_path: Union[str, Path]) -> Path:
+    """音频对应的峰值文件路径(与音频同目录同名)"""
+    return Path(audio_path).with_suffix(PEAKS_SUFFIX)
+
+
+def write_peaks_file(audio_path: Union[str, Path], data: Optional[bytes] = None) -> Path:
+    """
+    计算并保存音频旁的峰值文件(先写临时文件再原子替换)
+
+    Args:
+        audio_path: 音频文件
+        data: 已计算好的峰值(为空时从音频文件计算)
+
+    Returns:
+        Path: 峰值文件路径
+    """
+    target = peaks_path(audio_path)
+    if data is None:
+        data = compute_file_peaks(audio_path)
+    tmp = target.with_name(f".{target.name}.{uuid.uuid4().hex[:8]}.tmp")
+    try:
+        tmp.write_bytes(data)
+        os.replace(tmp, target)
+    finally:
+        if tmp.exists():
+            tmp.unlink()
+    return target
+
+
+def load_peaks(audio_path: Union[str, Path], max_peaks: Optional[int] = None) -> bytes:
+    """
+    读取音频的峰值，峰值文件不存在或比音频旧时重新计算
+
+    Args:
+        audio_path: 音频文件
+        max_peaks: 只返回峰值个数不超过该值的一级(为空时返回全部级别)
+
+    Returns:
+        bytes: .peaks 格式的数据
+    """
+    target = peaks_path(audio_path)
+    try:
+        fresh = target.stat().st_mtime >= Path(audio_path).stat().st_mtime
+    except FileNotFoundError:
+        fresh = False
+    if fresh:
+        data = target.read_bytes()
+    else:
+        data = compute_file_peaks(audio_path)
+        write_peaks_file(audio_path, data)
+
+    if max_peaks is None:
+        return data
+    sample_rate, total_samples, levels = decode_peaks(data)
+    return encode_peaks([select_level(levels, max_peaks)], sample_rate, total_samples)